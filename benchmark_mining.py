@@ -0,0 +1,76 @@
+import argparse
+from time import perf_counter
+from build_blockchain import INITIAL_BLOCK_HASH, INITIAL_BLOCK_BITS, InitialBlock, Block, create_initial_block, \
+    compute_initial_block_target, compute_initial_block_difficulty, proof_of_work, update_initial_block, \
+    validate_block
+from build_signature import create_private_key, derive_public_key, create_address
+from build_transaction import Transaction, create_coinbase_transaction, create_transaction, sign_transaction
+from build_miner import MiningPool, create_mining_pool, mine_initial_block, mine_initial_block_parallel, \
+    shutdown_mining_pool
+
+
+# Benchmark mining
+def create_benchmark_block(transactions_count: int, bits: int) -> InitialBlock:
+    """ Creates an initial block with sample transactions
+    :param transactions_count: number of user transactions
+    :param bits: target encoded in bits
+    :return: initial block
+    """
+    block_transactions: list[Transaction] = [create_coinbase_transaction('Node:bench', 'Miner:bench', 1.1, 2)]
+
+    for i in range(transactions_count):
+        private_key: str = create_private_key(f'Sender:{i}')
+        sender: str = create_address(derive_public_key(private_key))
+        transaction: Transaction = create_transaction({'inputs': [{'sender': sender, 'amount': 10.5}],
+                                                       'outputs': [{'receiver': f'Receiver:{i}', 'amount': 10.5}]})
+        block_transactions.append(sign_transaction(transaction, [private_key]))
+
+    return create_initial_block(1, INITIAL_BLOCK_HASH, block_transactions, bits)
+
+
+def run_benchmark(transactions_count: int, bits: int, mining_workers: int) -> None:
+    """ Mines the same block with old & new paths and reports hashes per second
+    :param transactions_count: number of user transactions
+    :param bits: target encoded in bits
+    :param mining_workers: number of parallel mining processes (1 to skip parallel path)
+    :return: None
+    """
+    initial_block: InitialBlock = create_benchmark_block(transactions_count, bits)
+    initial_block_target: int = compute_initial_block_target(bits)
+    new_block_difficulty: float = compute_initial_block_difficulty(initial_block_target)
+    mined_blocks: list[Block] = []
+
+    for path_name, mine in (('proof_of_work', proof_of_work), ('mine_initial_block', mine_initial_block)):
+        start_time: float = perf_counter()
+        new_block_hash, new_block_nonce = mine(initial_block, initial_block_target)
+        elapsed_time: float = perf_counter() - start_time
+        hashes_count: int = new_block_nonce
+        print(f'{path_name:>20}: {hashes_count} hashes in {elapsed_time:.3f}s '
+              f'({hashes_count / elapsed_time:,.0f} H/s)')
+        mined_blocks.append(update_initial_block(initial_block, new_block_hash, new_block_nonce, new_block_difficulty))
+
+    is_identical: bool = mined_blocks[0] == mined_blocks[1]
+    is_valid: bool = all(validate_block(INITIAL_BLOCK_HASH, mined_block) for mined_block in mined_blocks)
+    print(f'blocks identical: {is_identical}, validate_block: {is_valid}')
+
+    if mining_workers > 1:
+        mining_pool: MiningPool = create_mining_pool(mining_workers)
+        start_time = perf_counter()
+        new_block_hash, new_block_nonce = mine_initial_block_parallel(mining_pool, initial_block, initial_block_target)
+        elapsed_time = perf_counter() - start_time
+        shutdown_mining_pool(mining_pool)
+        # Strided workers cover nonces below the golden one roughly evenly
+        print(f'{"parallel x" + str(mining_workers):>20}: ~{new_block_nonce} hashes in {elapsed_time:.3f}s '
+              f'(~{new_block_nonce / elapsed_time:,.0f} H/s)')
+        parallel_block: Block = update_initial_block(initial_block, new_block_hash, new_block_nonce,
+                                                     new_block_difficulty)
+        print(f'parallel validate_block: {validate_block(INITIAL_BLOCK_HASH, parallel_block)}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare proof_of_work & mine_initial_block hash rates')
+    parser.add_argument('--transactions', type=int, default=100, help='user transactions per block')
+    parser.add_argument('--bits', type=int, default=INITIAL_BLOCK_BITS, help='target encoded in bits')
+    parser.add_argument('--workers', type=int, default=1, help='parallel mining processes')
+    args = parser.parse_args()
+    run_benchmark(args.transactions, args.bits, args.workers)
@@ -0,0 +1,517 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+from dataclasses import replace
+from datetime import datetime
+from statistics import median
+from threading import Thread
+from time import perf_counter
+from typing import TypedDict, Optional, Callable, Any
+from concurrent.futures import ProcessPoolExecutor
+from flask import Flask, request
+from waitress import create_server
+from common import SUCCESS_REQUEST_STATUS, JSON_MIMETYPE
+from build_blockchain import INITIAL_BLOCK_HASH, MAX_TARGET, InitialBlock, Block, create_initial_block, \
+    compute_initial_block_target, compute_initial_block_difficulty, compute_target_bits, proof_of_work, \
+    update_initial_block, validate_block
+from build_signature import create_private_key, derive_public_key, create_address
+from build_transaction import Transaction, TransactionData, create_coinbase_transaction, create_transaction, \
+    export_transaction, validate_transaction, sign_transaction, check_transactions_signatures, \
+    verify_transaction_signatures, signature_cache
+from build_validator import ValidationPool, verify_signatures_parallel
+from build_miner import mine_initial_block
+from build_mempool import add_mempool_transaction
+from build_node import Node, create_node, update_node, rollback_node
+from build_storage import get_chain_tip, close_chain_store
+from build_broadcast import broadcast_block
+from build_app import NodeApp, create_node_config, create_app, shutdown_app
+
+# Fixed timestamp keeps mined nonces, and so hash counts, identical between runs
+BENCHMARK_TIMESTAMP: str = f'{datetime(2022, 1, 1)}'
+# Benchmark transactions spend from a genesis account
+BENCHMARK_PRIVATE_KEY: str = create_private_key('Bob')
+BENCHMARK_SENDER: str = create_address(derive_public_key(BENCHMARK_PRIVATE_KEY))
+BENCHMARK_NODE_PORT: int = 5999
+
+
+# Build benchmark suite
+class BenchmarkResult(TypedDict):
+    name: str
+    params: dict[str, int]
+    value: float
+    unit: str
+    higher_is_better: bool
+
+
+class BenchmarkReport(TypedDict):
+    created: str
+    commit: Optional[str]
+    python: str
+    platform: str
+    repeat: int
+    results: list[BenchmarkResult]
+
+
+class StandInPeer(TypedDict):
+    url: str
+    server: Any
+    thread: Thread
+
+
+def create_result(name: str,
+                  params: dict[str, int],
+                  value: float,
+                  unit: str,
+                  higher_is_better: bool) -> BenchmarkResult:
+    """ Creates benchmark result
+    :param name: benchmark name
+    :param params: benchmark parameters, e.g. difficulty or payload size
+    :param value: measured value
+    :param unit: value unit
+    :param higher_is_better: True for rates, False for latencies
+    :return: new benchmark result
+    """
+    print(f'{name:>22} {json.dumps(params):<40} {value:>14,.3f} {unit}')
+    return {'name': name,
+            'params': params,
+            'value': round(value, 3),
+            'unit': unit,
+            'higher_is_better': higher_is_better,
+            }
+
+
+def time_runs(run: Callable[[], Any], repeat: int) -> float:
+    """ Times repeated runs, reporting the median to damp scheduler noise
+    :param run: measured code
+    :param repeat: number of runs
+    :return: median run time in seconds
+    """
+    run_times: list[float] = []
+
+    for _ in range(repeat):
+        start_time: float = perf_counter()
+        run()
+        run_times.append(perf_counter() - start_time)
+
+    return median(run_times)
+
+
+def create_benchmark_transaction(index: int, outputs_count: int = 1, is_signed: bool = True) -> Transaction:
+    """ Creates transaction unique per index, funded by a genesis account
+    :param index: transaction index
+    :param outputs_count: number of outputs, sets payload size
+    :param is_signed: sign transaction, off where signatures are not checked
+    :return: new transaction
+    """
+    transaction: Transaction = create_transaction({
+        'inputs': [{'sender': BENCHMARK_SENDER, 'amount': 0.0001 * outputs_count}],
+        'outputs': [{'receiver': f'Receiver:{index}:{i}', 'amount': 0.0001} for i in range(outputs_count)],
+    })
+    return sign_transaction(transaction, [BENCHMARK_PRIVATE_KEY]) if is_signed else transaction
+
+
+def create_benchmark_transaction_data(index: int, outputs_count: int = 1) -> TransactionData:
+    """ Creates signed transaction request data unique per index
+    :param index: transaction index
+    :param outputs_count: number of outputs, sets payload size
+    :return: transaction data
+    """
+    return export_transaction(create_benchmark_transaction(index, outputs_count))
+
+
+def create_benchmark_initial_block(height: int, transactions_count: int, bits: int) -> InitialBlock:
+    """ Creates initial block with fixed timestamp & deterministic transactions
+    :param height: block height, varies block header between mined blocks
+    :param transactions_count: number of user transactions
+    :param bits: target encoded in bits
+    :return: initial block
+    """
+    coinbase_transaction: Transaction = create_coinbase_transaction('Node:bench', 'Miner:bench', 1.1, height)
+    block_transactions: list[Transaction] = [coinbase_transaction] + [create_benchmark_transaction(i)
+                                                                      for i in range(transactions_count)]
+    initial_block: InitialBlock = create_initial_block(height - 1, INITIAL_BLOCK_HASH, block_transactions, bits)
+    return replace(initial_block, timestamp=BENCHMARK_TIMESTAMP)
+
+
+def mine_benchmark_block(initial_block: InitialBlock) -> Block:
+    """ Mines initial block
+    :param initial_block: initial block
+    :return: new block
+    """
+    initial_block_target: int = compute_initial_block_target(initial_block.bits)
+    new_block_hash, new_block_nonce = mine_initial_block(initial_block, initial_block_target)
+    return update_initial_block(initial_block, new_block_hash, new_block_nonce,
+                                compute_initial_block_difficulty(initial_block_target))
+
+
+def benchmark_hash_rate(difficulty_shifts: list[int], blocks_count: int) -> list[BenchmarkResult]:
+    """ Mines blocks at rising difficulty with legacy & midstate mining paths
+    :param difficulty_shifts: target shifts below max target, each one doubles expected hashes
+    :param blocks_count: blocks mined per difficulty
+    :return: hash rates & block times
+    """
+    results: list[BenchmarkResult] = []
+
+    for difficulty_shift in difficulty_shifts:
+        bits: int = compute_target_bits(MAX_TARGET >> difficulty_shift)
+        initial_blocks: list[InitialBlock] = [create_benchmark_initial_block(height, 0, bits)
+                                              for height in range(1, blocks_count + 1)]
+
+        for path_name, mine in (('proof_of_work', proof_of_work), ('mine_initial_block', mine_initial_block)):
+            hashes_count: int = 0
+            start_time: float = perf_counter()
+
+            for initial_block in initial_blocks:
+                hashes_count += mine(initial_block, compute_initial_block_target(bits))[1]
+
+            elapsed_time: float = perf_counter() - start_time
+            params: dict[str, int] = {'difficulty_shift': difficulty_shift, 'blocks': blocks_count}
+            results.append(create_result(f'{path_name}_rate', params, hashes_count / elapsed_time, 'H/s', True))
+            results.append(create_result(f'{path_name}_block', params, elapsed_time / blocks_count * 1000, 'ms',
+                                         False))
+
+    return results
+
+
+def benchmark_validate_block(transactions_counts: list[int], repeat: int) -> list[BenchmarkResult]:
+    """ Validates mined blocks of growing size
+    :param transactions_counts: user transactions per block
+    :param repeat: number of timed runs
+    :return: validated blocks & transactions per second
+    """
+    results: list[BenchmarkResult] = []
+    bits: int = compute_target_bits(MAX_TARGET)
+
+    for transactions_count in transactions_counts:
+        new_block: Block = mine_benchmark_block(create_benchmark_initial_block(1, transactions_count, bits))
+        # Every run verifies all signatures, as for a block of transactions node has not seen
+        run_time: float = time_runs(lambda: validate_block(INITIAL_BLOCK_HASH, new_block, use_signature_cache=False),
+                                    repeat)
+        params: dict[str, int] = {'transactions': transactions_count}
+        results.append(create_result('validate_block', params, 1 / run_time, 'blocks/s', True))
+        results.append(create_result('validate_block_tx', params, (transactions_count + 1) / run_time, 'tx/s', True))
+
+    return results
+
+
+def benchmark_validate_transaction(outputs_counts: list[int], transactions_count: int,
+                                   repeat: int) -> list[BenchmarkResult]:
+    """ Validates transactions of growing size one by one
+    :param outputs_counts: outputs per transaction, sets payload size
+    :param transactions_count: transactions validated per run
+    :param repeat: number of timed runs
+    :return: validated transactions per second
+    """
+    results: list[BenchmarkResult] = []
+
+    for outputs_count in outputs_counts:
+        transactions: list[Transaction] = [create_benchmark_transaction(i, outputs_count)
+                                           for i in range(transactions_count)]
+        run_time: float = time_runs(lambda: [validate_transaction(t) for t in transactions], repeat)
+        results.append(create_result('validate_transaction', {'outputs': outputs_count},
+                                     transactions_count / run_time, 'tx/s', True))
+
+    return results
+
+
+def benchmark_verify_signatures(workers_counts: list[int], transactions_count: int) -> list[BenchmarkResult]:
+    """ Verifies signatures of a transactions batch in process, across validation pools & from signature cache
+    :param workers_counts: validation processes per pool
+    :param transactions_count: transactions verified per run
+    :return: verified transactions per second
+    """
+    transactions: list[Transaction] = [create_benchmark_transaction(i) for i in range(transactions_count)]
+    params: dict[str, int] = {'transactions': transactions_count}
+    run_time: float = time_runs(lambda: check_transactions_signatures(transactions), 1)
+    results: list[BenchmarkResult] = [create_result('verify_signatures', {**params, 'workers': 0},
+                                                    transactions_count / run_time, 'tx/s', True)]
+
+    for workers_count in workers_counts:
+        validation_pool: ValidationPool = {'executor': ProcessPoolExecutor(max_workers=workers_count),
+                                           'workers': workers_count}
+        # Start workers before timing
+        list(validation_pool['executor'].map(check_transactions_signatures, [[]] * workers_count))
+        signature_cache.clear()
+
+        try:
+            run_time = time_runs(lambda: verify_signatures_parallel(validation_pool, transactions), 1)
+        finally:
+            validation_pool['executor'].shutdown()
+
+        results.append(create_result('verify_signatures', {**params, 'workers': workers_count},
+                                     transactions_count / run_time, 'tx/s', True))
+
+    # Transactions seen before, e.g. in mempool, then again in a block
+    run_time = time_runs(lambda: [verify_transaction_signatures(t) for t in transactions], 1)
+    results.append(create_result('verify_signatures_cached', params, transactions_count / run_time, 'tx/s', True))
+    return results
+
+
+def benchmark_update_node(mempool_sizes: list[int], block_transactions: int, repeat: int) -> list[BenchmarkResult]:
+    """ Connects a block of mempool transactions to nodes with growing mempools
+    :param mempool_sizes: mempool transactions before block
+    :param block_transactions: user transactions per block
+    :param repeat: number of timed runs
+    :return: update_node latency
+    """
+    results: list[BenchmarkResult] = []
+
+    for mempool_size in mempool_sizes:
+        node: Node = create_node(BENCHMARK_NODE_PORT)
+        # update_node checks no signatures, large mempools are left unsigned
+        mempool_transactions: list[Transaction] = [create_benchmark_transaction(i, is_signed=False)
+                                                   for i in range(mempool_size)]
+
+        for mempool_transaction in mempool_transactions:
+            add_mempool_transaction(node['mempool'], mempool_transaction)
+
+        tip_block: Block = get_chain_tip(node['chain'])
+        bits: int = compute_target_bits(MAX_TARGET)
+        initial_block: InitialBlock = create_initial_block(tip_block.height,
+                                                           tip_block.hash,
+                                                           [create_coinbase_transaction('Node:bench', 'Miner:bench',
+                                                                                        1.1, tip_block.height + 1)] +
+                                                           mempool_transactions[:block_transactions],
+                                                           bits)
+        new_block: Block = mine_benchmark_block(initial_block)
+        run_times: list[float] = []
+
+        for _ in range(repeat):
+            start_time: float = perf_counter()
+            update_node(node, new_block)
+            run_times.append(perf_counter() - start_time)
+            # Restore node for the next run
+            rollback_node(node, tip_block.height)
+
+            for block_transaction in new_block.transactions[1:]:
+                add_mempool_transaction(node['mempool'], block_transaction)
+
+        close_chain_store(node['chain'])
+        results.append(create_result('update_node', {'mempool': mempool_size, 'transactions': block_transactions},
+                                     median(run_times) * 1000, 'ms', False))
+
+    return results
+
+
+def benchmark_add_transaction(outputs_counts: list[int], requests_count: int) -> list[BenchmarkResult]:
+    """ Posts transactions to an in-process node webapp, one per request & in one batch request
+    :param outputs_counts: outputs per transaction, sets payload size
+    :param requests_count: transactions posted per payload size
+    :return: accepted transactions per second
+    """
+    results: list[BenchmarkResult] = []
+    node_app: NodeApp = create_app(create_node_config(BENCHMARK_NODE_PORT, [], None, 1, 1))
+    client = node_app['app'].test_client()
+    next_index: int = 0
+    # Measure verification, not signature cache hits left by earlier benchmarks
+    signature_cache.clear()
+
+    try:
+        for outputs_count in outputs_counts:
+            transactions_data: list[TransactionData] = [create_benchmark_transaction_data(next_index + i, outputs_count)
+                                                        for i in range(2 * requests_count)]
+            next_index += 2 * requests_count
+            start_time: float = perf_counter()
+
+            for transaction_data in transactions_data[:requests_count]:
+                if client.post('/add_transaction', json=transaction_data).status_code != SUCCESS_REQUEST_STATUS:
+                    raise RuntimeError(f'add_transaction rejected benchmark transaction {transaction_data["id"]}')
+
+            elapsed_time: float = perf_counter() - start_time
+            results.append(create_result('add_transaction', {'outputs': outputs_count},
+                                         requests_count / elapsed_time, 'req/s', True))
+            start_time = perf_counter()
+            response = client.post('/add_transactions',
+                                   data=json.dumps(transactions_data[requests_count:]),
+                                   content_type=JSON_MIMETYPE)
+            elapsed_time = perf_counter() - start_time
+
+            if response.get_json()['added'] != requests_count:
+                raise RuntimeError('add_transactions rejected benchmark transactions')
+
+            results.append(create_result('add_transactions', {'outputs': outputs_count},
+                                         requests_count / elapsed_time, 'tx/s', True))
+    finally:
+        shutdown_app(node_app)
+
+    return results
+
+
+def start_stand_in_peer() -> StandInPeer:
+    """ Serves a peer that wants every announced item & accepts every block, without validating it
+    :return: stand-in peer
+    """
+    app = Flask('stand_in_peer')
+
+    @app.route('/inventory', methods=['POST'])
+    def inventory():
+        return app.response_class(request.get_data(), mimetype=JSON_MIMETYPE), SUCCESS_REQUEST_STATUS
+
+    @app.route('/add_block', methods=['POST'])
+    def add_block():
+        request.get_data()
+        return 'New block stored', SUCCESS_REQUEST_STATUS
+
+    server = create_server(app, host='127.0.0.1', port=0, threads=4)
+    server_thread = Thread(target=server.run, daemon=True)
+    server_thread.start()
+    return {'url': f'http://127.0.0.1:{server.effective_port}', 'server': server, 'thread': server_thread}
+
+
+def benchmark_broadcast_block(peers_counts: list[int], transactions_counts: list[int],
+                              repeat: int) -> list[BenchmarkResult]:
+    """ Broadcasts blocks of growing size to growing numbers of stand-in peers over local HTTP
+    :param peers_counts: number of peers
+    :param transactions_counts: user transactions per block
+    :param repeat: number of timed runs
+    :return: broadcast_block latency
+    """
+    results: list[BenchmarkResult] = []
+    stand_in_peers: list[StandInPeer] = [start_stand_in_peer() for _ in range(max(peers_counts))]
+    bits: int = compute_target_bits(MAX_TARGET)
+
+    try:
+        for transactions_count in transactions_counts:
+            new_block: Block = mine_benchmark_block(create_benchmark_initial_block(1, transactions_count, bits))
+
+            for peers_count in peers_counts:
+                peers: list[str] = [stand_in_peer['url'] for stand_in_peer in stand_in_peers[:peers_count]]
+                # Open pooled connections before timing
+                broadcast_block(peers, new_block)
+                run_time: float = time_runs(lambda: broadcast_block(peers, new_block), repeat)
+                results.append(create_result('broadcast_block', {'peers': peers_count,
+                                                                 'transactions': transactions_count},
+                                             run_time * 1000, 'ms', False))
+    finally:
+        for stand_in_peer in stand_in_peers:
+            stand_in_peer['server'].close()
+
+    return results
+
+
+def get_commit() -> Optional[str]:
+    """ Reads current git commit, so reports from different versions can be told apart
+    :return: short commit hash, None outside a git checkout
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(args: argparse.Namespace) -> BenchmarkReport:
+    """ Runs selected benchmarks
+    :param args: command line arguments
+    :return: benchmark report
+    """
+    benchmarks: dict[str, Callable[[], list[BenchmarkResult]]] = {
+        'mining': lambda: benchmark_hash_rate(args.difficulty_shifts, args.blocks),
+        'validate_block': lambda: benchmark_validate_block(args.block_sizes, args.repeat),
+        'validate_transaction': lambda: benchmark_validate_transaction(args.outputs, args.transactions, args.repeat),
+        'signatures': lambda: benchmark_verify_signatures(args.signature_workers, args.transactions),
+        'update_node': lambda: benchmark_update_node(args.mempool_sizes, args.block_transactions, args.repeat),
+        'add_transaction': lambda: benchmark_add_transaction(args.outputs, args.requests),
+        'broadcast': lambda: benchmark_broadcast_block(args.peers, args.block_sizes, args.repeat),
+    }
+    results: list[BenchmarkResult] = []
+
+    for benchmark_name in args.only or list(benchmarks):
+        results.extend(benchmarks[benchmark_name]())
+
+    return {'created': f'{datetime.now()}',
+            'commit': get_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'results': results,
+            }
+
+
+def compare_reports(baseline_report: BenchmarkReport, report: BenchmarkReport, tolerance: float) -> list[str]:
+    """ Compares results measured with the same parameters against a baseline report
+    :param baseline_report: baseline benchmark report
+    :param report: new benchmark report
+    :param tolerance: allowed relative slowdown, e.g. 0.1 for 10%
+    :return: regression descriptions
+    """
+    baseline_results: dict[str, BenchmarkResult] = {f'{r["name"]} {json.dumps(r["params"], sort_keys=True)}': r
+                                                    for r in baseline_report['results']}
+    regressions: list[str] = []
+
+    for result in report['results']:
+        result_key: str = f'{result["name"]} {json.dumps(result["params"], sort_keys=True)}'
+        baseline_result: Optional[BenchmarkResult] = baseline_results.get(result_key)
+
+        if baseline_result is None or not baseline_result['value'] or not result['value']:
+            continue
+
+        # Slowdown as a fraction of baseline speed, for rates & latencies alike
+        speed_ratio: float = result['value'] / baseline_result['value'] if result['higher_is_better'] \
+            else baseline_result['value'] / result['value']
+        print(f'{result_key:<64} {baseline_result["value"]:>14,.3f} -> {result["value"]:>14,.3f} '
+              f'{result["unit"]:<9} {speed_ratio - 1:+.1%}')
+
+        if speed_ratio < 1 - tolerance:
+            regressions.append(f'{result_key}: {speed_ratio - 1:+.1%}')
+
+    return regressions
+
+
+def parse_int_list(value: str) -> list[int]:
+    """ Parses comma separated integers
+    :param value: command line value
+    :return: integers
+    """
+    return [int(item) for item in value.split(',') if item]
+
+
+def parse_args() -> argparse.Namespace:
+    """ Parses command line arguments
+    :return: command line arguments
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks mining, validation, ingestion & broadcast')
+    parser.add_argument('--only', nargs='+', choices=('mining', 'validate_block', 'validate_transaction',
+                                                      'signatures', 'update_node', 'add_transaction', 'broadcast'),
+                        help='benchmarks to run (default all)')
+    parser.add_argument('--output', help='JSON file to write results to')
+    parser.add_argument('--compare', help='baseline JSON results, exit with status 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown against baseline')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per measurement, median is reported')
+    parser.add_argument('--difficulty-shifts', type=parse_int_list, default=[0, 4, 8],
+                        help='mining targets below max target, each shift doubles expected hashes')
+    parser.add_argument('--blocks', type=int, default=8, help='blocks mined per difficulty')
+    parser.add_argument('--block-sizes', type=parse_int_list, default=[10, 100, 1000],
+                        help='user transactions per validated & broadcast block')
+    parser.add_argument('--outputs', type=parse_int_list, default=[1, 10],
+                        help='outputs per validated & posted transaction')
+    parser.add_argument('--transactions', type=int, default=2000, help='transactions validated per run')
+    parser.add_argument('--signature-workers', type=parse_int_list, default=[1, 2, 4],
+                        help='validation processes verifying signatures in parallel')
+    parser.add_argument('--mempool-sizes', type=parse_int_list, default=[1000, 10_000, 100_000],
+                        help='mempool transactions before update_node')
+    parser.add_argument('--block-transactions', type=int, default=1000, help='user transactions per connected block')
+    parser.add_argument('--requests', type=int, default=500, help='transactions posted per payload size')
+    parser.add_argument('--peers', type=parse_int_list, default=[1, 4, 16], help='stand-in peers per broadcast')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    benchmark_args: argparse.Namespace = parse_args()
+    benchmark_report: BenchmarkReport = run_benchmarks(benchmark_args)
+
+    if benchmark_args.output:
+        with open(benchmark_args.output, 'w') as report_file:
+            json.dump(benchmark_report, report_file, indent=2)
+
+    if benchmark_args.compare:
+        with open(benchmark_args.compare) as baseline_file:
+            report_regressions: list[str] = compare_reports(json.load(baseline_file), benchmark_report,
+                                                            benchmark_args.tolerance)
+
+        for report_regression in report_regressions:
+            print(f'regression: {report_regression}')
+
+        sys.exit(1 if report_regressions else 0)
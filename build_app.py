@@ -0,0 +1,517 @@
+import logging
+from time import perf_counter
+from typing import TypedDict, Optional, Callable, Iterator, Any
+from dataclasses import is_dataclass, fields
+from threading import Thread, Lock
+from flask import Flask, Response, jsonify, request, g
+from flask.json.provider import DefaultJSONProvider
+from common import MINING_WORKERS, CONTINUOUS_MINING, VALIDATION_WORKERS, VERIFY_CHAIN_ON_STARTUP, MAX_SYNC_HEADERS, \
+    MAX_SYNC_BLOCKS, MAX_INDEX_RESULTS, MAX_TRANSACTIONS_BATCH, MAX_BATCH_TRANSACTION_SIZE, NDJSON_MIMETYPE, \
+    JSON_MIMETYPE, BINARY_MIMETYPE, SUCCESS_REQUEST_STATUS, ACCEPTED_REQUEST_STATUS, BAD_REQUEST_STATUS, \
+    NOT_FOUND_REQUEST_STATUS, CONFLICT_REQUEST_STATUS, TOO_MANY_REQUESTS_STATUS
+from build_node import Node, create_node, verify_node_chain, add_node_transactions, add_node_peers, export_node, \
+    run_node_snapshots, collect_node_metrics
+from build_ledger import get_balance
+from build_mempool import MempoolEntry
+from build_blockchain import Block, BlockHeader, encode_block, decode_block, encode_blocks, import_block, \
+    validate_block_header
+from build_codec import DECODE_ERRORS
+from build_metrics import METRICS_MIMETYPE, increment_counter, observe_histogram, add_metrics_collector, \
+    export_metrics
+from build_broadcast import Inventory, parse_inventory
+from build_relay import Relay, create_relay, start_relay, select_wanted_inventory, relay_transactions, relay_block
+from build_merkle import MerkleTree, get_cached_merkle_tree, create_merkle_proof
+from build_block_index import BLOCK_EXTENDED, BLOCK_REORGANIZED, BLOCK_SIDE, BLOCK_ORPHAN, BLOCK_DUPLICATE, \
+    BlockIndex, create_block_index, process_new_block
+from build_miner import MiningPool, create_mining_pool, shutdown_mining_pool
+from build_validator import ValidationPool, create_validation_pool, shutdown_validation_pool, \
+    verify_signatures_parallel
+from build_storage import read_chain_block, find_chain_block_index, close_chain_store
+from build_sync import SyncBlocksRequest, ChainSync, create_chain_sync, start_chain_sync, collect_headers, \
+    collect_blocks, parse_sync_request, collect_sync_blocks, encode_sync_blocks
+from build_scheduler import JOB_MINED, JOB_FAILED, MiningScheduler, MiningJob, create_mining_scheduler, \
+    submit_mining_job, get_mining_job, set_continuous_mining, notify_mempool_change, notify_chain_tip_change
+from build_transaction_index import TransactionRef, AddressTransactionsPage, find_transaction_ref, \
+    list_address_transactions
+from build_transaction import InitialTransaction, Transaction, TransactionResult, create_transaction, \
+    validate_transaction, validate_transactions, parse_transactions_batch, decode_transactions
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+# Build node webapp
+class NodeConfig(TypedDict):
+    port: int
+    peers: list[str]
+    data_dir: Optional[str]
+    mining_workers: int
+    validation_workers: int
+    continuous_mining: bool
+    threads: int
+
+
+class NodeApp(TypedDict):
+    app: Flask
+    node: Node
+    node_lock: Lock
+    mining_pool: MiningPool
+    validation_pool: ValidationPool
+
+
+def create_node_config(node_port: int,
+                       peers: list[str],
+                       data_dir: Optional[str] = None,
+                       mining_workers: int = MINING_WORKERS,
+                       validation_workers: int = VALIDATION_WORKERS,
+                       continuous_mining: bool = CONTINUOUS_MINING,
+                       threads: int = 1) -> NodeConfig:
+    """ Creates node config
+    :param node_port: node port
+    :param peers: peer urls
+    :param data_dir: node data directory (None keeps node state until exit only)
+    :param mining_workers: number of mining processes
+    :param validation_workers: number of block validation processes
+    :param continuous_mining: mine blocks in background without requests
+    :param threads: number of request handling threads
+    :return: new node config
+    """
+    return {'port': node_port,
+            'peers': peers,
+            'data_dir': data_dir,
+            'mining_workers': mining_workers,
+            'validation_workers': validation_workers,
+            'continuous_mining': continuous_mining,
+            'threads': threads,
+            }
+
+
+class NodeJSONProvider(DefaultJSONProvider):
+    """ Serializes blocks & transactions field by field, leaving out cached encodings (repr=False fields)
+    """
+    @staticmethod
+    def default(o: Any) -> Any:
+        if is_dataclass(o):
+            return {data_field.name: getattr(o, data_field.name) for data_field in fields(o) if data_field.repr}
+
+        return DefaultJSONProvider.default(o)
+
+
+def is_binary_accepted() -> bool:
+    """ Checks whether request prefers binary over json response, json is the default for people & browsers
+    :return: binary response accepted
+    """
+    return request.accept_mimetypes.best_match([JSON_MIMETYPE, BINARY_MIMETYPE]) == BINARY_MIMETYPE
+
+
+def create_negotiated_response(data: Any, encode_data: Callable[[Any], bytes]) -> Response:
+    """ Serializes response data as binary when requested, as json otherwise
+    :param data: response data
+    :param encode_data: binary encoder of response data
+    :return: response
+    """
+    return Response(encode_data(data), mimetype=BINARY_MIMETYPE) if is_binary_accepted() else jsonify(data)
+
+
+def create_app(node_config: NodeConfig) -> NodeApp:
+    """ Creates node with background miner & chain sync, and its webapp
+    :param node_config: node config
+    :return: node webapp with node resources
+    """
+    # Create webapp
+    app = Flask(__name__)
+    app.json = NodeJSONProvider(app)
+    # Full transactions batch is the largest body, longer ones are refused with 413 before being read
+    app.config['MAX_CONTENT_LENGTH'] = MAX_TRANSACTIONS_BATCH * MAX_BATCH_TRANSACTION_SIZE
+
+    # Create node, reloading stored chain & mempool
+    node: Node = create_node(node_config['port'], node_config['data_dir'], node_config['peers'])
+    node_lock: Lock = Lock()
+
+    # Verify whole stored chain across validation processes
+    validation_pool: ValidationPool = create_validation_pool(node_config['validation_workers'])
+
+    if VERIFY_CHAIN_ON_STARTUP:
+        verify_node_chain(node, validation_pool)
+
+    if node_config['data_dir'] is not None:
+        Thread(target=run_node_snapshots, args=(node, node_lock), daemon=True).start()
+
+    # Create node miner running in background
+    mining_pool: MiningPool = create_mining_pool(node_config['mining_workers'])
+    mining_scheduler: MiningScheduler = create_mining_scheduler(node,
+                                                                node_lock,
+                                                                mining_pool,
+                                                                node_config['continuous_mining'])
+    # Catch up with peers in background
+    block_index: BlockIndex = create_block_index()
+    chain_sync: ChainSync = create_chain_sync(node, node_lock, block_index, validation_pool,
+                                              lambda: notify_chain_tip_change(mining_scheduler))
+    start_chain_sync(chain_sync)
+    # Announce new transactions & blocks to peers by id
+    relay: Relay = create_relay(node, node_lock, block_index)
+    start_relay(relay)
+    # Read mempool & chain gauges on metrics requests only
+    add_metrics_collector(node['metrics'], lambda: collect_node_metrics(node, node_lock))
+
+    # Time every request by route
+    @app.before_request
+    def start_request_timer():
+        g.request_start_time = perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response: Response) -> Response:
+        route_labels: dict[str, str] = {'route': request.url_rule.rule if request.url_rule else 'unmatched',
+                                        'method': request.method}
+        observe_histogram(node['metrics'], 'galleon_request_duration_seconds', route_labels,
+                          perf_counter() - g.request_start_time)
+        increment_counter(node['metrics'], 'galleon_requests_total',
+                          {**route_labels, 'status': str(response.status_code)})
+        return response
+
+    # Request node metrics in Prometheus text format
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        return Response(export_metrics(node['metrics']), content_type=METRICS_MIMETYPE), SUCCESS_REQUEST_STATUS
+
+    # Request node
+    @app.route('/get_node', methods=['GET'])
+    def get_node():
+        with node_lock:
+            return jsonify(export_node(node)), SUCCESS_REQUEST_STATUS
+
+    # Add new transaction to node mempool
+    @app.route('/add_transaction', methods=['POST'])
+    def add_transaction():
+        new_transaction_json: InitialTransaction = request.get_json()
+
+        try:
+            # Create transaction with ID
+            new_transaction: Transaction = create_transaction(new_transaction_json)
+        except ValueError:
+            return 'Transaction data invalid', BAD_REQUEST_STATUS
+
+        # Validate transaction
+        is_new_transaction_valid: bool = validate_transaction(new_transaction)
+
+        if not is_new_transaction_valid:
+            return 'Transaction data invalid', BAD_REQUEST_STATUS
+
+        # Verify signatures in a validation process, concurrent requests spread across all of them
+        if not verify_signatures_parallel(validation_pool, [new_transaction])[0]:
+            return 'Transaction signature invalid', BAD_REQUEST_STATUS
+
+        # Add new transaction to mempool if senders own spent amounts & it outbids conflicting transactions
+        with node_lock:
+            transaction_result: TransactionResult = add_node_transactions(node, [new_transaction], [True])[0]
+
+            if transaction_result['status'] == SUCCESS_REQUEST_STATUS:
+                relay_transactions(relay, [new_transaction.id])
+
+        if transaction_result['status'] != SUCCESS_REQUEST_STATUS:
+            return transaction_result['error'], transaction_result['status']
+
+        notify_mempool_change(mining_scheduler)
+        # Return add_transaction response
+        return jsonify(new_transaction), SUCCESS_REQUEST_STATUS
+
+    # Add batch of new transactions, as JSON array, NDJSON stream or binary (relayed by peers), to node mempool
+    @app.route('/add_transactions', methods=['POST'])
+    def add_transactions():
+        try:
+            new_transactions: list[Optional[Transaction]] = decode_transactions(request.get_data())[0] \
+                if request.mimetype == BINARY_MIMETYPE \
+                else parse_transactions_batch(request.get_data(), request.mimetype == NDJSON_MIMETYPE)
+        except DECODE_ERRORS:
+            return 'Transactions batch invalid', BAD_REQUEST_STATUS
+
+        if len(new_transactions) > MAX_TRANSACTIONS_BATCH:
+            return 'Transactions batch too large', BAD_REQUEST_STATUS
+
+        # Validate whole batch, then verify signatures of valid transactions across validation processes
+        validation_results: list[bool] = validate_transactions(new_transactions)
+        valid_transactions: list[Transaction] = [t for t, is_valid in zip(new_transactions, validation_results)
+                                                 if is_valid]
+        signature_results: Iterator[bool] = iter(verify_signatures_parallel(validation_pool, valid_transactions))
+        validation_results = [is_valid and next(signature_results) for is_valid in validation_results]
+
+        with node_lock:
+            transaction_results = add_node_transactions(node, new_transactions, validation_results)
+            relay_transactions(relay, [r['id'] for r in transaction_results if r['status'] == SUCCESS_REQUEST_STATUS])
+
+        added_count: int = sum(r['status'] == SUCCESS_REQUEST_STATUS for r in transaction_results)
+
+        if added_count:
+            notify_mempool_change(mining_scheduler)
+
+        # Return add_transactions response
+        return jsonify({'added': added_count, 'results': transaction_results}), SUCCESS_REQUEST_STATUS
+
+    # Request block headers by height range
+    @app.route('/get_headers', methods=['GET'])
+    def get_headers():
+        start_height: int = request.args.get('start', 1, type=int)
+        limit: int = request.args.get('limit', MAX_SYNC_HEADERS, type=int)
+
+        with node_lock:
+            block_headers: list[BlockHeader] = collect_headers(node['chain'], start_height, limit)
+
+        return jsonify(block_headers), SUCCESS_REQUEST_STATUS
+
+    # Request blocks by height range, or starting from block hash
+    @app.route('/get_blocks', methods=['GET'])
+    def get_blocks():
+        start_height: int = request.args.get('start', 1, type=int)
+        limit: int = request.args.get('limit', MAX_SYNC_BLOCKS, type=int)
+
+        with node_lock:
+            if 'start_hash' in request.args:
+                block_index = find_chain_block_index(node['chain'], request.args['start_hash'])
+
+                if block_index is None:
+                    return 'Block not found', NOT_FOUND_REQUEST_STATUS
+
+                start_height = block_index + 1
+
+            blocks: list[Block] = collect_blocks(node['chain'], start_height, limit)
+
+        return create_negotiated_response(blocks, encode_blocks), SUCCESS_REQUEST_STATUS
+
+    # Request block by hash
+    @app.route('/get_block/<block_hash>', methods=['GET'])
+    def get_block(block_hash: str):
+        with node_lock:
+            block_index = find_chain_block_index(node['chain'], block_hash)
+
+            if block_index is None:
+                return 'Block not found', NOT_FOUND_REQUEST_STATUS
+
+            block: Block = read_chain_block(node['chain'], block_index)
+
+        return create_negotiated_response(block, encode_block), SUCCESS_REQUEST_STATUS
+
+    # Request proof that transaction is included in block, verifiable against block header's merkle root
+    @app.route('/get_merkle_proof/<block_hash>/<transaction_id>', methods=['GET'])
+    def get_merkle_proof(block_hash: str, transaction_id: str):
+        with node_lock:
+            block_index = find_chain_block_index(node['chain'], block_hash)
+
+            if block_index is None:
+                return 'Block not found', NOT_FOUND_REQUEST_STATUS
+
+            block: Block = read_chain_block(node['chain'], block_index)
+
+        transactions_ids: list[str] = [t.id for t in block.transactions]
+
+        if transaction_id not in transactions_ids:
+            return 'Transaction not found', NOT_FOUND_REQUEST_STATUS
+
+        with node_lock:
+            merkle_tree: MerkleTree = get_cached_merkle_tree(block.merkle_root, transactions_ids)
+            merkle_proof = create_merkle_proof(merkle_tree, transactions_ids.index(transaction_id))
+
+        return jsonify({'merkle_root': block.merkle_root, 'proof': merkle_proof}), SUCCESS_REQUEST_STATUS
+
+    # Request transaction by id with its chain position, looked up in transaction index (height None in mempool)
+    @app.route('/get_transaction/<transaction_id>', methods=['GET'])
+    def get_transaction(transaction_id: str):
+        with node_lock:
+            transaction_ref: Optional[TransactionRef] = find_transaction_ref(node['transaction_index'], transaction_id)
+
+            if transaction_ref is not None:
+                height, position = transaction_ref
+                block: Block = read_chain_block(node['chain'], height - 1)
+                return jsonify({'transaction': block.transactions[position],
+                                'block_hash': block.hash,
+                                'height': height,
+                                'position': position}), SUCCESS_REQUEST_STATUS
+
+            mempool_entry: Optional[MempoolEntry] = node['mempool']['entries'].get(transaction_id)
+
+        if mempool_entry is None:
+            return 'Transaction not found', NOT_FOUND_REQUEST_STATUS
+
+        return jsonify({'transaction': mempool_entry['transaction'], 'block_hash': None, 'height': None,
+                        'position': None}), SUCCESS_REQUEST_STATUS
+
+    # Request page of chain transactions sending from or paying to address, newest first
+    @app.route('/get_address_transactions/<address>', methods=['GET'])
+    def get_address_transactions(address: str):
+        offset: int = request.args.get('offset', 0, type=int)
+        limit: int = request.args.get('limit', MAX_INDEX_RESULTS, type=int)
+
+        with node_lock:
+            address_page: AddressTransactionsPage = list_address_transactions(node['transaction_index'], address,
+                                                                              offset, limit)
+        return jsonify(address_page), SUCCESS_REQUEST_STATUS
+
+    # Answer peer's inventory announcement with the transactions & blocks node is missing
+    @app.route('/inventory', methods=['POST'])
+    def inventory():
+        try:
+            announced_inventory: Inventory = parse_inventory(request.get_json(silent=True))
+        except ValueError:
+            return 'Inventory invalid', BAD_REQUEST_STATUS
+
+        with node_lock:
+            wanted_inventory: Inventory = select_wanted_inventory(relay, announced_inventory)
+
+        return jsonify(wanted_inventory), SUCCESS_REQUEST_STATUS
+
+    # Request node's peers
+    @app.route('/get_peers', methods=['GET'])
+    def get_peers():
+        return jsonify(node['peers']), SUCCESS_REQUEST_STATUS
+
+    # Add peers to node's peer list
+    @app.route('/add_peers', methods=['POST'])
+    def add_peers():
+        new_peers = request.get_json()
+
+        if not isinstance(new_peers, list) or not all(isinstance(peer, str) for peer in new_peers):
+            return 'Peers invalid', BAD_REQUEST_STATUS
+
+        with node_lock:
+            added_peers: list[str] = add_node_peers(node, new_peers)
+
+        if added_peers:
+            start_chain_sync(chain_sync)
+
+        return jsonify(added_peers), SUCCESS_REQUEST_STATUS
+
+    # Request blocks missing from peer's chain described by its block locator
+    @app.route('/sync_blocks', methods=['POST'])
+    def sync_blocks():
+        try:
+            sync_request: SyncBlocksRequest = parse_sync_request(request.get_json(silent=True))
+        except ValueError:
+            return 'Sync request invalid', BAD_REQUEST_STATUS
+
+        with node_lock:
+            sync_response = collect_sync_blocks(node['chain'], sync_request['locator'], sync_request['limit'])
+        return create_negotiated_response(sync_response, encode_sync_blocks), SUCCESS_REQUEST_STATUS
+
+    # Catch up with peers in background
+    @app.route('/sync_chain', methods=['POST'])
+    def sync_chain():
+        is_sync_started: bool = start_chain_sync(chain_sync)
+        return jsonify({'started': is_sync_started}), ACCEPTED_REQUEST_STATUS
+
+    # Request address balance
+    @app.route('/get_balance/<address>', methods=['GET'])
+    def get_address_balance(address: str):
+        with node_lock:
+            balance: float = get_balance(node['ledger'], address)
+        return jsonify({'address': address, 'balance': balance}), SUCCESS_REQUEST_STATUS
+
+    # Queue new block mining job
+    @app.route('/mine_block', methods=['GET'])
+    def mine_block():
+        mining_job: Optional[MiningJob] = submit_mining_job(mining_scheduler)
+
+        if mining_job is None:
+            return 'Mining job queue full', TOO_MANY_REQUESTS_STATUS
+
+        return jsonify(mining_job), ACCEPTED_REQUEST_STATUS
+
+    # Request mining job status
+    @app.route('/mining_jobs/<job_id>', methods=['GET'])
+    def get_mining_job_status(job_id: str):
+        mining_job = get_mining_job(mining_scheduler, job_id)
+
+        if mining_job is None:
+            return 'Mining job not found', NOT_FOUND_REQUEST_STATUS
+
+        return jsonify(mining_job), SUCCESS_REQUEST_STATUS
+
+    # Request mining job result
+    @app.route('/mining_jobs/<job_id>/result', methods=['GET'])
+    def get_mining_job_result(job_id: str):
+        mining_job = get_mining_job(mining_scheduler, job_id)
+
+        if mining_job is None:
+            return 'Mining job not found', NOT_FOUND_REQUEST_STATUS
+        elif mining_job['status'] == JOB_MINED:
+            return jsonify(mining_job['result']), SUCCESS_REQUEST_STATUS
+        elif mining_job['status'] == JOB_FAILED:
+            return jsonify(mining_job), CONFLICT_REQUEST_STATUS
+        else:
+            return jsonify(mining_job), ACCEPTED_REQUEST_STATUS
+
+    # Start continuous background mining
+    @app.route('/start_mining', methods=['POST'])
+    def start_mining():
+        set_continuous_mining(mining_scheduler, True)
+        return jsonify({'continuous': True}), SUCCESS_REQUEST_STATUS
+
+    # Stop continuous background mining
+    @app.route('/stop_mining', methods=['POST'])
+    def stop_mining():
+        set_continuous_mining(mining_scheduler, False)
+        return jsonify({'continuous': False}), SUCCESS_REQUEST_STATUS
+
+    # Add new block to chain
+    @app.route('/add_block', methods=['POST'])
+    def add_block():
+        try:
+            new_block: Block = decode_block(request.get_data())[0] if request.mimetype == BINARY_MIMETYPE \
+                else import_block(request.get_json())
+        except DECODE_ERRORS as err:
+            logger.warning('Node:%s new block malformed: %r', node['port'], err)
+            return 'New block malformed', BAD_REQUEST_STATUS
+
+        validation_start_time: float = perf_counter()
+
+        # Verify signatures across validation processes before taking node lock, validate_block then hits the cache
+        if validate_block_header(new_block.prev_hash, new_block):
+            verify_signatures_parallel(validation_pool, list(new_block.transactions[1:]))
+
+        with node_lock:
+            # Store new block on main chain, side branch or as orphan
+            block_status: str = process_new_block(node, block_index, new_block)
+            validation_time: float = perf_counter() - validation_start_time
+
+        observe_histogram(node['metrics'], 'galleon_block_validation_seconds', {'status': block_status},
+                          validation_time)
+        increment_counter(node['metrics'], 'galleon_blocks_total', {'status': block_status})
+        # Block details are formatted only when debug logging is on
+        logger.info('Node:%s new block status=%s height=%s hash=%s validation_ms=%.3f',
+                    node['port'], block_status, new_block.height, new_block.hash, validation_time * 1000)
+        logger.debug('Node:%s new block: %s', node['port'], new_block)
+
+        if block_status in (BLOCK_EXTENDED, BLOCK_REORGANIZED, BLOCK_SIDE):
+            # Pass new block on, peers fetch it only if they are missing it
+            relay_block(relay, new_block)
+
+        if block_status in (BLOCK_EXTENDED, BLOCK_REORGANIZED):
+            # Rebuild local block template on top of new tip
+            notify_chain_tip_change(mining_scheduler)
+            return create_negotiated_response(new_block, encode_block), SUCCESS_REQUEST_STATUS
+        elif block_status == BLOCK_SIDE:
+            return 'New block stored on side branch', ACCEPTED_REQUEST_STATUS
+        elif block_status == BLOCK_ORPHAN:
+            # Node missed new block's ancestors, fetch them instead of waiting for broadcasts
+            start_chain_sync(chain_sync)
+            return 'New block parent unknown', ACCEPTED_REQUEST_STATUS
+        elif block_status == BLOCK_DUPLICATE:
+            return 'Block already known', CONFLICT_REQUEST_STATUS
+        else:
+            return 'New block invalid', BAD_REQUEST_STATUS
+
+    return {'app': app,
+            'node': node,
+            'node_lock': node_lock,
+            'mining_pool': mining_pool,
+            'validation_pool': validation_pool,
+            }
+
+
+def shutdown_app(node_app: NodeApp) -> None:
+    """ Stops node's worker processes & closes its chain storage
+    :param node_app: node webapp
+    :return: None
+    """
+    shutdown_mining_pool(node_app['mining_pool'])
+    shutdown_validation_pool(node_app['validation_pool'])
+
+    with node_app['node_lock']:
+        close_chain_store(node_app['node']['chain'])
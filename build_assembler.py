@@ -0,0 +1,82 @@
+from collections import defaultdict
+from common import MAX_BLOCK_SIZE
+from build_blockchain import BLOCK_REWARD, InitialBlock, Block, create_initial_block
+from build_transaction import AMOUNT_BASE_UNITS, Transaction, create_coinbase_transaction, compute_transaction_size, \
+    convert_amount_to_base_units
+from build_mempool import Mempool, MempoolEntry, iterate_mempool_by_fee_rate
+from build_node import Node
+from build_ledger import Ledger
+from build_storage import get_chain_height, get_chain_tip
+from build_difficulty import compute_next_bits
+
+# Misfit transactions tolerated once block is nearly full, before assembly stops
+MAX_CONSECUTIVE_MISFITS: int = 1000
+
+
+# Build block assembler
+def assemble_block_transactions(mempool: Mempool, ledger: Ledger, max_block_size: int) -> list[MempoolEntry]:
+    """ Selects funded mempool transactions by fee rate until block size limit
+    :param mempool: mempool
+    :param ledger: ledger at chain tip
+    :param max_block_size: max size of block transactions in bytes
+    :return: selected mempool entries, highest fee rate first
+    """
+    block_entries: list[MempoolEntry] = []
+    block_size: int = 0
+    block_spends: defaultdict[str, int] = defaultdict(int)
+    consecutive_misfits: int = 0
+
+    for mempool_entry in iterate_mempool_by_fee_rate(mempool):
+        if block_size + mempool_entry['size'] > max_block_size:
+            consecutive_misfits += 1
+
+            if consecutive_misfits >= MAX_CONSECUTIVE_MISFITS:
+                break
+            continue
+
+        consecutive_misfits = 0
+        transaction_spends: dict[str, int] = mempool_entry['spends']
+
+        # Skip transactions overspending together with those already selected
+        if any(ledger['balances'].get(sender, 0) < block_spends[sender] + spent_amount
+               for sender, spent_amount in transaction_spends.items()):
+            continue
+
+        for sender, spent_amount in transaction_spends.items():
+            block_spends[sender] += spent_amount
+
+        block_entries.append(mempool_entry)
+        block_size += mempool_entry['size']
+
+    return block_entries
+
+
+def create_block_template(node: Node, max_block_size: int = MAX_BLOCK_SIZE) -> InitialBlock:
+    """ Creates an initial block on top of node's chain tip paying block reward & fees to miner
+    :param node: node
+    :param max_block_size: max size of block transactions in bytes
+    :return: initial block
+    """
+    node_address: str = f'Node:{node["port"]}'
+    miner_address: str = f'Miner:{node["port"]}'
+    # Get prev block hash
+    prev_block: Block = get_chain_tip(node['chain'])
+    prev_block_hash: str = prev_block.hash
+    # Reserve coinbase transaction size, its amount digits may grow with fees
+    block_height: int = get_chain_height(node['chain']) + 1
+    coinbase_size: int = compute_transaction_size(create_coinbase_transaction(node_address, miner_address, BLOCK_REWARD,
+                                                                              block_height))
+    block_entries: list[MempoolEntry] = assemble_block_transactions(node['mempool'],
+                                                                   node['ledger'],
+                                                                   max_block_size - 2 * coinbase_size)
+    # Select new block transactions
+    block_fees: int = sum(mempool_entry['fee'] for mempool_entry in block_entries)
+    coinbase_amount: float = (convert_amount_to_base_units(BLOCK_REWARD) + block_fees) / AMOUNT_BASE_UNITS
+    coinbase_transaction: Transaction = create_coinbase_transaction(node_address, miner_address, coinbase_amount,
+                                                                    block_height)
+    block_transactions: list[Transaction] = [coinbase_transaction]
+    block_transactions.extend(mempool_entry['transaction'] for mempool_entry in block_entries)
+    return create_initial_block(get_chain_height(node['chain']),
+                                prev_block_hash,
+                                block_transactions,
+                                compute_next_bits(node['chain']))
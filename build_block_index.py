@@ -0,0 +1,251 @@
+from typing import TypedDict, Optional
+from collections import OrderedDict
+from common import MAX_REORG_DEPTH, MAX_ORPHAN_BLOCKS
+from build_blockchain import Block, compute_initial_block_target, validate_block_header, validate_block
+from build_ledger import validate_block_spends
+from build_mempool import add_mempool_transaction
+from build_node import Node, update_node, rollback_node
+from build_storage import get_chain_height, get_chain_tip, read_chain_block, find_chain_block_index
+from build_difficulty import validate_block_bits, validate_block_timestamp
+from build_transaction_index import find_transaction_ref, validate_block_transactions_new
+
+BLOCK_EXTENDED: str = 'extended'
+BLOCK_REORGANIZED: str = 'reorganized'
+BLOCK_SIDE: str = 'side'
+BLOCK_ORPHAN: str = 'orphan'
+BLOCK_DUPLICATE: str = 'duplicate'
+BLOCK_INVALID: str = 'invalid'
+
+
+# Build block index
+class SideBlock(TypedDict):
+    block: Block
+    fork_index: int
+    work: int
+
+
+class BlockIndex(TypedDict):
+    side_blocks: dict[str, SideBlock]
+    orphans: OrderedDict[str, Block]
+
+
+def create_block_index() -> BlockIndex:
+    """ Creates an empty index of side branch & orphan blocks
+    :return: new block index
+    """
+    return {'side_blocks': {}, 'orphans': OrderedDict()}
+
+
+def compute_block_work(bits: int) -> int:
+    """ Computes expected number of hashes needed to mine a block
+    :param bits: target encoded in bits
+    :return: block work
+    """
+    return 2 ** 256 // (compute_initial_block_target(bits) + 1)
+
+
+def compute_chain_work(node: Node, fork_index: int) -> int:
+    """ Sums work of main chain blocks above fork point, O(fork depth)
+    :param node: node
+    :param fork_index: chain position of fork point
+    :return: main chain work since fork point
+    """
+    return sum(compute_block_work(read_chain_block(node['chain'], block_index).bits)
+               for block_index in range(fork_index + 1, get_chain_height(node['chain'])))
+
+
+def process_new_block(node: Node, block_index: BlockIndex, new_block: Block, is_block_checked: bool = False) -> str:
+    """ Adds block to main chain, side branch or orphans, then connects orphans waiting for it
+    :param node: node
+    :param block_index: block index
+    :param new_block: new block
+    :param is_block_checked: new block's proof of work & transactions already checked, e.g. by validation pool
+    :return: new block status
+    """
+    block_status: str = accept_block(node, block_index, new_block, is_block_checked)
+    parent_hashes: list[str] = [new_block.hash] if block_status in (BLOCK_EXTENDED,
+                                                                       BLOCK_REORGANIZED,
+                                                                       BLOCK_SIDE) else []
+
+    while parent_hashes:
+        parent_hash: str = parent_hashes.pop()
+        child_blocks: list[Block] = [orphan_block for orphan_block in block_index['orphans'].values()
+                                     if orphan_block.prev_hash == parent_hash]
+
+        for child_block in child_blocks:
+            del block_index['orphans'][child_block.hash]
+            child_status: str = accept_block(node, block_index, child_block)
+
+            if child_status in (BLOCK_EXTENDED, BLOCK_REORGANIZED, BLOCK_SIDE):
+                parent_hashes.append(child_block.hash)
+
+            # Report a reorg triggered by orphans as reorg of the new block
+            if child_status == BLOCK_REORGANIZED:
+                block_status = BLOCK_REORGANIZED
+
+    return block_status
+
+
+def accept_block(node: Node, block_index: BlockIndex, new_block: Block, is_block_checked: bool = False) -> str:
+    """ Validates & stores block, reorganizing chain when its branch has more work
+    :param node: node
+    :param block_index: block index
+    :param new_block: new block
+    :param is_block_checked: new block's proof of work & transactions already checked
+    :return: new block status
+    """
+    new_block_hash: str = new_block.hash
+
+    if find_chain_block_index(node['chain'], new_block_hash) is not None or \
+            new_block_hash in block_index['side_blocks'] or new_block_hash in block_index['orphans']:
+        return BLOCK_DUPLICATE
+
+    tip_block: Block = get_chain_tip(node['chain'])
+
+    # Most common case: block extends main chain
+    if new_block.prev_hash == tip_block.hash:
+        if new_block.height != tip_block.height + 1 or \
+                not (is_block_checked or validate_block(tip_block.hash, new_block)) or \
+                not validate_block_bits(node['chain'], new_block) or \
+                not validate_block_timestamp(node['chain'], new_block) or \
+                not validate_block_spends(node['ledger'], new_block) or \
+                not validate_block_transactions_new(node['transaction_index'], new_block):
+            return BLOCK_INVALID
+
+        update_node(node, new_block)
+        prune_side_blocks(node, block_index)
+        return BLOCK_EXTENDED
+
+    parent_index: Optional[int] = find_chain_block_index(node['chain'], new_block.prev_hash)
+    parent_side_block: Optional[SideBlock] = block_index['side_blocks'].get(new_block.prev_hash)
+
+    if parent_index is not None:
+        parent_height, fork_index, parent_work = parent_index + 1, parent_index, 0
+    elif parent_side_block is not None:
+        parent_height = parent_side_block['block'].height
+        fork_index, parent_work = parent_side_block['fork_index'], parent_side_block['work']
+    else:
+        # Parent unknown yet, keep block until parent arrives
+        # Its own proof of work is checked first, junk would push real orphans out & trigger syncs
+        if not (is_block_checked or validate_block_header(new_block.prev_hash, new_block)):
+            return BLOCK_INVALID
+
+        block_index['orphans'][new_block_hash] = new_block
+
+        while len(block_index['orphans']) > MAX_ORPHAN_BLOCKS:
+            block_index['orphans'].popitem(last=False)
+
+        return BLOCK_ORPHAN
+
+    if new_block.height != parent_height + 1 or \
+            not (is_block_checked or validate_block(new_block.prev_hash, new_block)) or \
+            fork_index < get_chain_height(node['chain']) - 1 - MAX_REORG_DEPTH:
+        return BLOCK_INVALID
+
+    side_block: SideBlock = {'block': new_block,
+                             'fork_index': fork_index,
+                             'work': parent_work + compute_block_work(new_block.bits)}
+    block_index['side_blocks'][new_block_hash] = side_block
+
+    # First seen branch wins ties
+    if side_block['work'] > compute_chain_work(node, fork_index):
+        return BLOCK_REORGANIZED if reorganize_chain(node, block_index, new_block_hash) else BLOCK_INVALID
+
+    return BLOCK_SIDE
+
+
+def reorganize_chain(node: Node, block_index: BlockIndex, side_tip_hash: str) -> bool:
+    """ Switches main chain to side branch, rolling back & reapplying only blocks above fork point
+    :param node: node
+    :param block_index: block index
+    :param side_tip_hash: side branch tip hash
+    :return: False if side branch turned out invalid & main chain was restored
+    """
+    side_blocks: dict[str, SideBlock] = block_index['side_blocks']
+    fork_index: int = side_blocks[side_tip_hash]['fork_index']
+    branch_blocks: list[Block] = []
+    branch_hash: str = side_tip_hash
+
+    while branch_hash in side_blocks:
+        branch_blocks.append(side_blocks[branch_hash]['block'])
+        branch_hash = side_blocks[branch_hash]['block'].prev_hash
+
+    branch_blocks.reverse()
+    disconnected_blocks: list[Block] = rollback_node(node, fork_index + 1)
+    connected_blocks: list[Block] = []
+
+    # Branch bits, timestamps, spends & transactions novelty are checked once their ancestors are connected
+    for branch_block in branch_blocks:
+        if not validate_block_bits(node['chain'], branch_block) or \
+                not validate_block_timestamp(node['chain'], branch_block) or \
+                not validate_block_spends(node['ledger'], branch_block) or \
+                not validate_block_transactions_new(node['transaction_index'], branch_block):
+            break
+
+        update_node(node, branch_block)
+        connected_blocks.append(branch_block)
+
+    is_branch_valid: bool = len(connected_blocks) == len(branch_blocks)
+
+    if is_branch_valid:
+        main_blocks, dropped_blocks = connected_blocks, disconnected_blocks
+    else:
+        # Drop invalid block with its descendants, then restore previous main chain
+        for branch_block in branch_blocks[len(connected_blocks):]:
+            side_blocks.pop(branch_block.hash, None)
+
+        main_blocks, dropped_blocks = disconnected_blocks, rollback_node(node, fork_index + 1)
+
+        for main_block in main_blocks:
+            update_node(node, main_block)
+
+    # Dropped blocks stay available for a reorg back, fork point & work are set by rebase
+    for dropped_block in dropped_blocks:
+        side_blocks[dropped_block.hash] = {'block': dropped_block, 'fork_index': fork_index, 'work': 0}
+
+    # Return transactions of dropped blocks missing from main chain to mempool
+    for dropped_block in dropped_blocks:
+        for transaction in dropped_block.transactions[1:]:
+            if find_transaction_ref(node['transaction_index'], transaction.id) is None:
+                add_mempool_transaction(node['mempool'], transaction, node['ledger'])
+
+    rebase_side_blocks(node, block_index)
+    return is_branch_valid
+
+
+def rebase_side_blocks(node: Node, block_index: BlockIndex) -> None:
+    """ Recomputes side blocks' fork points & work after main chain changed
+    :param node: node
+    :param block_index: block index
+    :return: None
+    """
+    side_blocks: dict[str, SideBlock] = block_index['side_blocks']
+
+    # Parents come before children in height order
+    for side_block in sorted(side_blocks.values(), key=lambda s: s['block'].height):
+        side_block_hash: str = side_block['block'].hash
+        parent_hash: str = side_block['block'].prev_hash
+        parent_index: Optional[int] = find_chain_block_index(node['chain'], parent_hash)
+        block_work: int = compute_block_work(side_block['block'].bits)
+
+        if find_chain_block_index(node['chain'], side_block_hash) is not None:
+            del side_blocks[side_block_hash]
+        elif parent_index is not None:
+            side_block['fork_index'], side_block['work'] = parent_index, block_work
+        elif parent_hash in side_blocks:
+            side_block['fork_index'] = side_blocks[parent_hash]['fork_index']
+            side_block['work'] = side_blocks[parent_hash]['work'] + block_work
+        else:
+            del side_blocks[side_block_hash]
+
+
+def prune_side_blocks(node: Node, block_index: BlockIndex) -> None:
+    """ Drops side blocks forking deeper than max reorg depth
+    :param node: node
+    :param block_index: block index
+    :return: None
+    """
+    min_fork_index: int = get_chain_height(node['chain']) - 1 - MAX_REORG_DEPTH
+
+    for side_block_hash in [h for h, s in block_index['side_blocks'].items() if s['fork_index'] < min_fork_index]:
+        del block_index['side_blocks'][side_block_hash]
@@ -1,33 +1,83 @@
-import json
-from typing import TypedDict, Final
-from datetime import datetime
-from decimal import Decimal
+import logging
+import struct
+from typing import TypedDict, Final, Callable
+from dataclasses import dataclass
+from calendar import timegm
+from datetime import datetime, timedelta
+from functools import lru_cache
 from hashlib import sha256
-from build_transaction import Transaction, create_coinbase_transaction
+from common import MAX_BLOCK_SIZE
+from build_codec import encode_varint, decode_varint
+from build_transaction import Transaction, TransactionData, create_coinbase_transaction, encode_coinbase_height, \
+    create_transaction, encode_transaction, decode_transaction, compute_transaction_size, validate_transactions, \
+    compute_transaction_amounts, convert_amount_to_base_units, verify_transaction_signatures, \
+    check_transaction_signatures
+from build_merkle import MerkleTree, create_merkle_tree, get_merkle_root, is_merkle_tree_mutated, compute_merkle_root
+
+logger: logging.Logger = logging.getLogger(__name__)
 
 BLOCK_REWARD: Final = 1.1
 INITIAL_BLOCK_HASH: Final = '0'
 INITIAL_BLOCK_NONCE: Final = 1
-# TODO: difficulty adjustment - timer/blocks?
 INITIAL_BLOCK_BITS: int = 509450204  # 4 leading zeros
-MAX_TARGET = '0x00FFFF0000000000000000000000000000000000000000000000000000000000'
+MAX_TARGET: Final = 0x00FFFF0000000000000000000000000000000000000000000000000000000000
+# Distinct bits values seen by a node are few, retargets only happen every few blocks
+TARGET_CACHE_SIZE: Final = 1024
+BLOCK_VERSION: Final = 1
+BLOCK_HASH_SIZE: Final = 32
+# Binary header without nonce: version, prev_hash, merkle_root, timestamp (us), bits
+BLOCK_HEADER_PREFIX = struct.Struct('<I32s32sQI')
+BLOCK_HEADER_NONCE = struct.Struct('<Q')
+# Binary block: header prefix, nonce & hash, then varint height & transactions count, then transactions
+BLOCK_FIXED_FIELDS = struct.Struct('<I32s32sQIQ32s')
+BLOCK_TIMESTAMP_EPOCH: Final = datetime(1970, 1, 1)
 
 
 # Build blockchain
-class InitialBlock(TypedDict):
+@dataclass(frozen=True, slots=True)
+class InitialBlock:
+    version: int
     height: int
     timestamp: str
     prev_hash: str
-    transactions: list[Transaction]
+    merkle_root: str
+    transactions: tuple[Transaction, ...]
     bits: int
 
 
+@dataclass(frozen=True, slots=True)
 class Block(InitialBlock):
     hash: str
     nonce: int
     difficulty: float
 
 
+class BlockData(TypedDict):
+    version: int
+    height: int
+    timestamp: str
+    prev_hash: str
+    merkle_root: str
+    transactions: list[TransactionData]
+    bits: int
+    hash: str
+    nonce: int
+    difficulty: float
+
+
+class BlockHeader(TypedDict):
+    version: int
+    height: int
+    timestamp: str
+    prev_hash: str
+    merkle_root: str
+    bits: int
+    hash: str
+    nonce: int
+    difficulty: float
+    transactions_count: int
+
+
 def create_chain(node_address: str, miner_address: str) -> list[Block]:
     """ Creates a new chain with genesis block
     :param node_address: node address
@@ -35,11 +85,14 @@ def create_chain(node_address: str, miner_address: str) -> list[Block]:
     :return: chain
     """
     new_chain: list[Block] = []
-    coinbase_transaction: Transaction = create_coinbase_transaction(node_address, miner_address, BLOCK_REWARD)
+    coinbase_transaction: Transaction = create_coinbase_transaction(node_address,
+                                                                    miner_address,
+                                                                    BLOCK_REWARD,
+                                                                    len(new_chain) + 1)
     genesis_initial_block: InitialBlock = create_initial_block(len(new_chain),
                                                                INITIAL_BLOCK_HASH,
                                                                [coinbase_transaction])
-    genesis_initial_block_target: str = compute_initial_block_target(genesis_initial_block['bits'])
+    genesis_initial_block_target: int = compute_initial_block_target(genesis_initial_block.bits)
     genesis_block_difficulty: float = compute_initial_block_difficulty(genesis_initial_block_target)
     genesis_block: Block = update_initial_block(genesis_initial_block,
                                                 INITIAL_BLOCK_HASH,
@@ -49,55 +102,76 @@ def create_chain(node_address: str, miner_address: str) -> list[Block]:
     return new_chain
 
 
-def create_initial_block(blockchain_length: int, prev_block_hash: str, transactions: list[Transaction]) -> InitialBlock:
+def create_initial_block(blockchain_length: int,
+                         prev_block_hash: str,
+                         transactions: list[Transaction],
+                         bits: int = INITIAL_BLOCK_BITS) -> InitialBlock:
     """ Creates a new initial block
     :param blockchain_length: blockchain length
     :param prev_block_hash: previous block hash
     :param transactions: block transactions
+    :param bits: target encoded in bits
     :return: new initial block
     """
-    return {'height': blockchain_length + 1,
-            'timestamp': f'{datetime.now()}',
-            'prev_hash': prev_block_hash,
-            'transactions': transactions,
-            'bits': INITIAL_BLOCK_BITS,
-            }
+    return InitialBlock(version=BLOCK_VERSION,
+                        height=blockchain_length + 1,
+                        timestamp=f'{datetime.now()}',
+                        prev_hash=prev_block_hash,
+                        merkle_root=compute_merkle_root([t.id for t in transactions]),
+                        transactions=tuple(transactions),
+                        bits=bits)
 
 
-def compute_initial_block_target(bits: int) -> str:
-    """ Computes initial block target
+@lru_cache(maxsize=TARGET_CACHE_SIZE)
+def compute_initial_block_target(bits: int) -> int:
+    """ Decodes compact bits into target: 3-byte mantissa shifted by 1-byte exponent
     :param bits: target encoded in bits
-    :return: hexadecimal target
+    :return: integer target
     """
-    bits_in_hex = hex(bits)
-    derived_target_start = int(bits_in_hex[2:4], 16)
-    derived_target_end = bits_in_hex[4:]
-    current_target_start = '0' * (64 - derived_target_start * 2)
-    current_target_end = '0' * (derived_target_start * 2 - len(derived_target_end))
-    return f'0x{current_target_start}{derived_target_end}{current_target_end}'
+    exponent: int = bits >> 24
+    mantissa: int = bits & 0xFFFFFF
+    return mantissa << 8 * (exponent - 3) if exponent >= 3 else mantissa >> 8 * (3 - exponent)
 
 
-def compute_initial_block_difficulty(current_target: str) -> float:
+@lru_cache(maxsize=TARGET_CACHE_SIZE)
+def compute_target_bits(target: int) -> int:
+    """ Encodes target into compact bits, dropping precision below the 3-byte mantissa
+    :param target: integer target
+    :return: target encoded in bits
+    """
+    exponent: int = (target.bit_length() + 7) // 8
+    mantissa: int = target << 8 * (3 - exponent) if exponent <= 3 else target >> 8 * (exponent - 3)
+
+    # Keep mantissa's top bit clear, it is the sign bit of compact encoding
+    if mantissa & 0x800000:
+        mantissa >>= 8
+        exponent += 1
+
+    return exponent << 24 | mantissa
+
+
+def compute_initial_block_difficulty(current_target: int) -> float:
     """ Computes initial block difficulty
     :param current_target: block target
     :return: mining difficulty
     """
-    max_target_dec = int(MAX_TARGET, 16)
-    current_target_dec = int(current_target, 16)
-    return float(round(Decimal(max_target_dec / current_target_dec), 2))
-
-
-# TODO: more realistic hash computation
-#   1. Compute block_header
-#     a. client
-#     b. timestamp
-#     c. transactions: merkle root
-#     d. prev_hash
-#     e. target
-#   2. Compute block_header with nonce
-#   3. Find double hash
-#   4. Compare double hash with target
-def proof_of_work(initial_block: InitialBlock, initial_block_target: str) -> tuple[str, int]:
+    return round(MAX_TARGET / current_target, 2)
+
+
+def compute_block_difficulty(bits: int) -> float:
+    """ Computes block difficulty from its bits, difficulty sent along by peers is never trusted
+    :param bits: target encoded in bits
+    :return: mining difficulty
+    """
+    target: int = compute_initial_block_target(bits)
+
+    if target <= 0:
+        raise ValueError(f'invalid block bits: {bits}')
+
+    return compute_initial_block_difficulty(target)
+
+
+def proof_of_work(initial_block: InitialBlock, initial_block_target: int) -> tuple[str, int]:
     """ Computes block hash & nonce by solving cryptographic puzzle
     :param initial_block: initial block
     :param initial_block_target: initial block target
@@ -111,7 +185,7 @@ def proof_of_work(initial_block: InitialBlock, initial_block_target: str) -> tup
     while nonce_is_valid is False:
         new_block_hash = compute_initial_block_hash(initial_block, new_block_nonce)
 
-        if initial_block_target > f'0x{new_block_hash}':
+        if int(new_block_hash, 16) < initial_block_target:
             nonce_is_valid = True
         else:
             new_block_nonce += 1
@@ -119,67 +193,266 @@ def proof_of_work(initial_block: InitialBlock, initial_block_target: str) -> tup
     return new_block_hash, new_block_nonce
 
 
-def compute_initial_block_hash(initial_block: InitialBlock, block_nonce: int) -> str:
-    """ Computes block hash by solving a cryptographic puzzle
-    :param initial_block: block with initial hash & nonce
+def encode_block_hash(block_hash: str) -> bytes:
+    """ Encodes hexadecimal block hash as fixed-size bytes
+    :param block_hash: hexadecimal block hash
+    :return: 32-byte block hash
+    """
+    return bytes.fromhex(block_hash.rjust(2 * BLOCK_HASH_SIZE, '0'))
+
+
+def decode_block_hash(block_hash: bytes) -> str:
+    """ Decodes fixed-size block hash, all zero bytes are genesis placeholder hash
+    :param block_hash: 32-byte block hash
+    :return: hexadecimal block hash
+    """
+    return block_hash.hex() if any(block_hash) else INITIAL_BLOCK_HASH
+
+
+def encode_block_timestamp(block_timestamp: str) -> int:
+    """ Encodes block timestamp as microseconds since epoch
+    :param block_timestamp: block timestamp
+    :return: integer timestamp
+    """
+    timestamp: datetime = datetime.fromisoformat(block_timestamp)
+    return timegm(timestamp.utctimetuple()) * 1_000_000 + timestamp.microsecond
+
+
+def decode_block_timestamp(block_timestamp: int) -> str:
+    """ Decodes microseconds since epoch into block timestamp
+    :param block_timestamp: integer timestamp
+    :return: block timestamp
+    """
+    return f'{BLOCK_TIMESTAMP_EPOCH + timedelta(microseconds=block_timestamp)}'
+
+
+def encode_block_header_prefix(block_header: InitialBlock) -> bytes:
+    """ Packs fixed-size binary block header without nonce, transactions are covered by merkle root
+    :param block_header: initial block, block or block header
+    :return: binary header prefix
+    """
+    return BLOCK_HEADER_PREFIX.pack(block_header.version,
+                                    encode_block_hash(block_header.prev_hash),
+                                    bytes.fromhex(block_header.merkle_root),
+                                    encode_block_timestamp(block_header.timestamp),
+                                    block_header.bits)
+
+
+def hash_block_header(block_header_prefix: bytes, block_nonce: int) -> bytes:
+    """ Double hashes binary block header
+    :param block_header_prefix: binary header prefix
+    :param block_nonce: block nonce
+    :return: block hash digest
+    """
+    return sha256(sha256(block_header_prefix + BLOCK_HEADER_NONCE.pack(block_nonce)).digest()).digest()
+
+
+def compute_initial_block_hash(block_header: InitialBlock, block_nonce: int) -> str:
+    """ Computes block hash from block header, in O(1) regardless of transactions count
+    :param block_header: initial block, block or block header
     :param block_nonce: golden nonce
     :return: block hash
     """
-    initial_block_hash = hash_initial_block(initial_block)
-    return sha256((str(block_nonce) + initial_block_hash).encode()).hexdigest()
+    return hash_block_header(encode_block_header_prefix(block_header), block_nonce).hex()
+
+
+def encode_block(block: Block) -> bytes:
+    """ Encodes block in canonical binary form, difficulty is left out as it follows from bits
+    :param block: block
+    :return: binary block
+    """
+    return b''.join([encode_block_header_prefix(block),
+                     BLOCK_HEADER_NONCE.pack(block.nonce),
+                     encode_block_hash(block.hash),
+                     encode_varint(block.height),
+                     encode_varint(len(block.transactions)),
+                     *[encode_transaction(transaction) for transaction in block.transactions],
+                     ])
+
+
+def decode_block(data: bytes, offset: int = 0) -> tuple[Block, int]:
+    """ Decodes binary block
+    :param data: encoded data
+    :param offset: block position
+    :return: block & position after it
+    """
+    version, prev_hash, merkle_root, timestamp, bits, nonce, block_hash = BLOCK_FIXED_FIELDS.unpack_from(data, offset)
+    height, offset = decode_varint(data, offset + BLOCK_FIXED_FIELDS.size)
+    transactions_count, offset = decode_varint(data, offset)
+    transactions: list[Transaction] = []
+
+    for _ in range(transactions_count):
+        transaction, offset = decode_transaction(data, offset)
+        transactions.append(transaction)
+
+    return Block(version=version,
+                 height=height,
+                 timestamp=decode_block_timestamp(timestamp),
+                 prev_hash=decode_block_hash(prev_hash),
+                 merkle_root=merkle_root.hex(),
+                 transactions=tuple(transactions),
+                 bits=bits,
+                 hash=decode_block_hash(block_hash),
+                 nonce=nonce,
+                 difficulty=compute_block_difficulty(bits)), offset
+
+
+def encode_blocks(blocks: list[Block]) -> bytes:
+    """ Encodes blocks prefixed with their count
+    :param blocks: blocks
+    :return: binary blocks
+    """
+    return encode_varint(len(blocks)) + b''.join(encode_block(block) for block in blocks)
 
 
-def hash_initial_block(initial_block: InitialBlock) -> str:
-    """ Hashes block with initial hash & nonce
-    :param initial_block: block with initial hash & nonce
-    :return: hashed block
+def decode_blocks(data: bytes, offset: int = 0) -> tuple[list[Block], int]:
+    """ Decodes count-prefixed binary blocks
+    :param data: encoded data
+    :param offset: blocks count position
+    :return: blocks & position after them
     """
-    encoded_initial_block = json.dumps(initial_block, sort_keys=True).encode()
-    return sha256(encoded_initial_block).hexdigest()
+    blocks_count, offset = decode_varint(data, offset)
+    blocks: list[Block] = []
+
+    for _ in range(blocks_count):
+        block, offset = decode_block(data, offset)
+        blocks.append(block)
+
+    return blocks, offset
 
 
 def update_initial_block(initial_block: InitialBlock,
                          new_block_hash: str,
                          new_block_nonce: int,
                          new_block_difficulty: float) -> Block:
-    """ Updates initial block with new hash, nonce & difficulty
+    """ Completes initial block with new hash, nonce & difficulty, sharing its transactions
     :param initial_block: initial block
     :param new_block_hash: new block hash
     :param new_block_nonce: new block nonce
     :param new_block_difficulty: new block difficulty
     :return: new block with hash, nonce & difficulty
     """
-    new_block: Block = {k: v for k, v in initial_block.items()}
-    new_block['hash'] = new_block_hash
-    new_block['nonce'] = new_block_nonce
-    new_block['difficulty'] = new_block_difficulty
-    return new_block
+    return Block(version=initial_block.version,
+                 height=initial_block.height,
+                 timestamp=initial_block.timestamp,
+                 prev_hash=initial_block.prev_hash,
+                 merkle_root=initial_block.merkle_root,
+                 transactions=initial_block.transactions,
+                 bits=initial_block.bits,
+                 hash=new_block_hash,
+                 nonce=new_block_nonce,
+                 difficulty=new_block_difficulty)
+
 
+def import_block(block_data: BlockData) -> Block:
+    """ Creates block from json data, e.g. a block posted by a peer, difficulty follows from bits
+    :param block_data: block data
+    :return: block
+    """
+    try:
+        return Block(version=block_data['version'],
+                     height=block_data['height'],
+                     timestamp=block_data['timestamp'],
+                     prev_hash=block_data['prev_hash'],
+                     merkle_root=block_data['merkle_root'],
+                     transactions=tuple(create_transaction(t) for t in block_data['transactions']),
+                     bits=block_data['bits'],
+                     hash=block_data['hash'],
+                     nonce=block_data['nonce'],
+                     difficulty=compute_block_difficulty(block_data['bits']))
+    except (KeyError, TypeError) as err:
+        raise ValueError(f'malformed block: {repr(err)}') from err
+
+
+def validate_block_header(prev_block_hash: str, block_header: Block) -> bool:
+    """ Validates block header links to prev block & satisfies proof of work, in O(1)
+    :param prev_block_hash: prev block hash
+    :param block_header: new block or block header
+    :return: block header validation status
+    """
+    try:
+        # Prev & new blocks hashes validation
+        if prev_block_hash != block_header.prev_hash:
+            return False
+
+        # New block hash validation, bits may not ask for less work than minimum difficulty
+        initial_block_target: int = compute_initial_block_target(block_header.bits)
+        initial_block_hash: str = compute_initial_block_hash(block_header, block_header.nonce)
+        return initial_block_target <= MAX_TARGET and block_header.hash == initial_block_hash and \
+            int(initial_block_hash, 16) < initial_block_target
+    except Exception as err:
+        logger.warning('validate_block_header error: %r', err)
+        return False
 
-def validate_block(prev_block_hash: str, new_block: Block) -> bool:
+
+def validate_coinbase_amount(new_block: Block) -> bool:
+    """ Validates coinbase pays block reward plus block transactions' fees, no more & no less
+    :param new_block: new block with valid transaction amounts
+    :return: coinbase amount validation status
+    """
+    try:
+        block_fees: int = sum(transaction_inputs - transaction_outputs
+                              for transaction_inputs, transaction_outputs in map(compute_transaction_amounts,
+                                                                                 new_block.transactions[1:]))
+        coinbase_amount: int = compute_transaction_amounts(new_block.transactions[0])[1]
+        return coinbase_amount == convert_amount_to_base_units(BLOCK_REWARD) + block_fees
+    except Exception as err:
+        logger.warning('validate_coinbase_amount error: %r', err)
+        return False
+
+
+def validate_block(prev_block_hash: str, new_block: Block, use_signature_cache: bool = True) -> bool:
     """ Validates new mined block
     :param prev_block_hash: pre block hash
     :param new_block: new mined block
+    :param use_signature_cache: skip & remember transactions with verified signatures (off in pool workers)
     :return: new block validation status
     """
-    # Prev & new blocks hashes validation
-    if prev_block_hash != new_block['prev_hash']:
+    if not validate_block_header(prev_block_hash, new_block):
         return False
 
-    # New block hash validation
-    initial_block: InitialBlock = downgrade_block_to_initial(new_block)
-    initial_block_target: str = compute_initial_block_target(new_block['bits'])
-    initial_block_hash: str = compute_initial_block_hash(initial_block, new_block['nonce'])
+    # New block size validation
+    try:
+        if sum(compute_transaction_size(t) for t in new_block.transactions) > MAX_BLOCK_SIZE:
+            return False
+    except Exception as err:
+        logger.warning('validate_block error: %r', err)
+        return False
+
+    # New block transactions validation, coinbase carrying block height keeps its id unique across blocks
+    transactions_ids: list[str] = [t.id for t in new_block.transactions]
+    merkle_tree: MerkleTree = create_merkle_tree(transactions_ids)
 
-    if new_block['hash'] != initial_block_hash or initial_block_target <= f'0x{initial_block_hash}':
+    # Repeated last transactions leave merkle root unchanged (CVE-2012-2459), they would be applied twice
+    if new_block.merkle_root != get_merkle_root(merkle_tree).hex() or is_merkle_tree_mutated(merkle_tree) or \
+            len(set(transactions_ids)) != len(transactions_ids) or \
+            not new_block.transactions or not new_block.transactions[0].inputs or \
+            new_block.transactions[0].inputs[0].signature != encode_coinbase_height(new_block.height):
         return False
 
-    return True
+    # New block amounts validation, ledger credits outputs so they may not exceed inputs & coinbase mints no extra coins
+    if not all(validate_transactions(list(new_block.transactions[1:]))) or not validate_coinbase_amount(new_block):
+        return False
 
+    # New block signatures validation, transactions verified on mempool admission or in a pool hit signature cache
+    verify_signatures: Callable[[Transaction], bool] = verify_transaction_signatures if use_signature_cache \
+        else check_transaction_signatures
+    return all(verify_signatures(t) for t in new_block.transactions[1:])
 
-def downgrade_block_to_initial(block: Block) -> InitialBlock:
-    """ Strips block down to initial block
+
+def downgrade_block_to_header(block: Block) -> BlockHeader:
+    """ Strips block down to header
     :param block: block
-    :return: initial block
+    :return: block header
     """
-    return {k: v for k, v in block.items() if k != 'hash' and k != 'nonce' and k != 'difficulty'}
+    return {'version': block.version,
+            'height': block.height,
+            'timestamp': block.timestamp,
+            'prev_hash': block.prev_hash,
+            'merkle_root': block.merkle_root,
+            'bits': block.bits,
+            'hash': block.hash,
+            'nonce': block.nonce,
+            'difficulty': block.difficulty,
+            'transactions_count': len(block.transactions),
+            }
@@ -0,0 +1,187 @@
+import logging
+from typing import TypedDict, Optional, Any
+from time import perf_counter, sleep
+from concurrent.futures import ThreadPoolExecutor
+from requests import Session, Response, RequestException
+from requests.adapters import HTTPAdapter
+from common import SUCCESS_REQUEST_STATUS, BROADCAST_CONNECT_TIMEOUT, BROADCAST_READ_TIMEOUT, \
+    BROADCAST_RETRIES, BROADCAST_BACKOFF, BROADCAST_WORKERS, BROADCAST_PEER_POOLS, BINARY_MIMETYPE, MAX_INVENTORY_ITEMS
+from build_blockchain import Block, encode_block
+from build_metrics import Metrics, increment_counter, observe_histogram
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+PEER_UPDATED: str = 'updated'
+PEER_REJECTED: str = 'rejected'
+PEER_UNAVAILABLE: str = 'unavailable'
+PEER_KNOWN: str = 'known'
+
+
+# Build broadcast
+class Inventory(TypedDict):
+    transactions: list[str]
+    blocks: list[str]
+
+
+class PeerBroadcastResult(TypedDict):
+    peer: str
+    status: str
+    status_code: Optional[int]
+    latency: float
+    attempts: int
+
+
+def create_broadcast_session(peer_pools: int, pool_size: int) -> Session:
+    """ Creates HTTP session keeping persistent connections to peers
+    :param peer_pools: max number of peers with pooled connections
+    :param pool_size: max pooled connections per peer
+    :return: new session
+    """
+    session = Session()
+    adapter = HTTPAdapter(pool_connections=peer_pools, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    return session
+
+
+# Shared by all broadcasts of the process, so connections to peers are reused
+broadcast_session: Session = create_broadcast_session(BROADCAST_PEER_POOLS, BROADCAST_WORKERS)
+broadcast_executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=BROADCAST_WORKERS,
+                                                            thread_name_prefix='broadcast')
+
+
+def post_to_peer(peer: str, path: str, payload: bytes, content_type: str) -> PeerBroadcastResult:
+    """ Posts payload to peer, retrying unavailable peers with exponential backoff
+    :param peer: peer url
+    :param path: peer route
+    :param payload: serialized payload
+    :param content_type: payload mimetype, also requested for the response
+    :return: peer broadcast result
+    """
+    start_time: float = perf_counter()
+    status: str = PEER_UNAVAILABLE
+    status_code: Optional[int] = None
+    attempts: int = 0
+
+    while attempts <= BROADCAST_RETRIES:
+        if attempts:
+            sleep(BROADCAST_BACKOFF * 2 ** (attempts - 1))
+        attempts += 1
+
+        try:
+            response: Response = broadcast_session.post(f'{peer}{path}',
+                                                        data=payload,
+                                                        headers={'Content-Type': content_type, 'Accept': content_type},
+                                                        timeout=(BROADCAST_CONNECT_TIMEOUT, BROADCAST_READ_TIMEOUT))
+            status_code = response.status_code
+        except RequestException as err:
+            logger.warning('post_to_peer error: peer=%s unavailable attempt=%s %r', peer, attempts, err)
+            continue
+
+        # Peer answered, only server errors are worth retrying
+        if status_code == SUCCESS_REQUEST_STATUS:
+            status = PEER_UPDATED
+            break
+        elif status_code < 500:
+            status = PEER_REJECTED
+            break
+
+    return {'peer': peer,
+            'status': status,
+            'status_code': status_code,
+            'latency': round((perf_counter() - start_time) * 1000, 3),
+            'attempts': attempts,
+            }
+
+
+def create_inventory(transactions_ids: Optional[list[str]] = None,
+                     blocks_hashes: Optional[list[str]] = None) -> Inventory:
+    """ Creates inventory announcing transactions & blocks by id
+    :param transactions_ids: transaction ids
+    :param blocks_hashes: block hashes
+    :return: new inventory
+    """
+    return {'transactions': transactions_ids or [], 'blocks': blocks_hashes or []}
+
+
+def parse_inventory(inventory_data: Any) -> Inventory:
+    """ Parses inventory sent by peer
+    :param inventory_data: parsed json data
+    :return: inventory
+    """
+    if not isinstance(inventory_data, dict):
+        raise ValueError('inventory is not a JSON object')
+
+    inventory: Inventory = create_inventory(inventory_data.get('transactions'), inventory_data.get('blocks'))
+
+    for inventory_ids in inventory.values():
+        if not isinstance(inventory_ids, list) or len(inventory_ids) > MAX_INVENTORY_ITEMS or \
+                not all(isinstance(inventory_id, str) for inventory_id in inventory_ids):
+            raise ValueError('inventory ids invalid')
+
+    return inventory
+
+
+def announce_to_peer(peer: str, inventory: Inventory) -> Optional[Inventory]:
+    """ Announces inventory to peer, which answers with the items it is missing
+    :param peer: peer url
+    :param inventory: announced inventory
+    :return: inventory wanted by peer, None if peer did not answer
+    """
+    try:
+        response: Response = broadcast_session.post(f'{peer}/inventory',
+                                                    json=inventory,
+                                                    timeout=(BROADCAST_CONNECT_TIMEOUT, BROADCAST_READ_TIMEOUT))
+        return parse_inventory(response.json()) if response.status_code == SUCCESS_REQUEST_STATUS else None
+    except RequestException as err:
+        logger.warning('announce_to_peer error: peer=%s unavailable %r', peer, err)
+    except ValueError as err:
+        logger.warning('announce_to_peer error: peer=%s sent malformed inventory %r', peer, err)
+
+    return None
+
+
+def push_block_to_peer(peer: str, block_hash: str, block_payload: bytes) -> PeerBroadcastResult:
+    """ Announces block hash to peer, sending the whole block only if peer is missing it
+    :param peer: peer url
+    :param block_hash: block hash
+    :param block_payload: binary block
+    :return: peer broadcast result
+    """
+    start_time: float = perf_counter()
+    wanted_inventory: Optional[Inventory] = announce_to_peer(peer, create_inventory(blocks_hashes=[block_hash]))
+
+    # Peers that did not answer the announcement get the block with retries
+    if wanted_inventory is not None and block_hash not in wanted_inventory['blocks']:
+        return {'peer': peer,
+                'status': PEER_KNOWN,
+                'status_code': SUCCESS_REQUEST_STATUS,
+                'latency': round((perf_counter() - start_time) * 1000, 3),
+                'attempts': 1,
+                }
+
+    return post_to_peer(peer, '/add_block', block_payload, BINARY_MIMETYPE)
+
+
+def broadcast_block(peers: list[str], new_block: Block) -> list[PeerBroadcastResult]:
+    """ Broadcasts new block to all peers concurrently, encoding it once & sending it only to peers missing it
+    :param peers: peer urls
+    :param new_block: new block
+    :return: per-peer broadcast results
+    """
+    block_payload: bytes = encode_block(new_block)
+    return list(broadcast_executor.map(lambda peer: push_block_to_peer(peer, new_block.hash, block_payload),
+                                       list(peers)))
+
+
+def record_broadcast_results(metrics: Metrics, item_kind: str, broadcast_results: list[PeerBroadcastResult]) -> None:
+    """ Records per-peer broadcast latency & status
+    :param metrics: node metrics
+    :param item_kind: broadcast item kind, e.g. block or transactions
+    :param broadcast_results: per-peer broadcast results
+    :return: None
+    """
+    for broadcast_result in broadcast_results:
+        peer_labels: dict[str, str] = {'peer': broadcast_result['peer'], 'kind': item_kind}
+        observe_histogram(metrics, 'galleon_broadcast_latency_seconds', peer_labels,
+                          broadcast_result['latency'] / 1000)
+        increment_counter(metrics, 'galleon_broadcast_total', {**peer_labels, 'status': broadcast_result['status']})
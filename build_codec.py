@@ -0,0 +1,146 @@
+import struct
+from typing import Final
+
+UINT64 = struct.Struct('<Q')
+# Varint bytes carry 7 value bits, high bit set while more bytes follow
+VARINT_VALUE_BITS: Final = 7
+VARINT_CONTINUE_FLAG: Final = 0x80
+# Raised by decoders on truncated or malformed data
+DECODE_ERRORS: Final = (ValueError, IndexError, struct.error)
+
+
+# Build binary codec
+def encode_varint(value: int) -> bytes:
+    """ Encodes non-negative integer in as few bytes as its size needs
+    :param value: non-negative integer
+    :return: varint bytes
+    """
+    if value < 0:
+        raise ValueError(f'negative varint: {value}')
+
+    if value < VARINT_CONTINUE_FLAG:
+        return bytes((value,))
+
+    varint: bytearray = bytearray()
+
+    while value >= VARINT_CONTINUE_FLAG:
+        varint.append(value & 0x7F | VARINT_CONTINUE_FLAG)
+        value >>= VARINT_VALUE_BITS
+
+    varint.append(value)
+    return bytes(varint)
+
+
+def decode_varint(data: bytes, offset: int) -> tuple[int, int]:
+    """ Decodes varint, rejecting padded encodings so every value has a single binary form (transaction ids hash it)
+    :param data: encoded data
+    :param offset: varint position
+    :return: integer & position after varint
+    """
+    byte: int = data[offset]
+
+    if byte < VARINT_CONTINUE_FLAG:
+        return byte, offset + 1
+
+    value: int = 0
+    shift: int = 0
+
+    while byte & VARINT_CONTINUE_FLAG:
+        value |= (byte & 0x7F) << shift
+        shift += VARINT_VALUE_BITS
+        offset += 1
+        byte = data[offset]
+
+    if not byte:
+        raise ValueError('non-canonical varint')
+
+    return value | byte << shift, offset + 1
+
+
+def encode_bytes(value: bytes) -> bytes:
+    """ Encodes bytes prefixed with their length
+    :param value: bytes
+    :return: length-prefixed bytes
+    """
+    return encode_varint(len(value)) + value
+
+
+def decode_bytes(data: bytes, offset: int) -> tuple[bytes, int]:
+    """ Decodes length-prefixed bytes
+    :param data: encoded data
+    :param offset: length position
+    :return: bytes & position after them
+    """
+    length: int = data[offset]
+
+    # Most values are shorter than 128 bytes, skip varint decoding for their 1-byte length
+    if length < VARINT_CONTINUE_FLAG:
+        offset += 1
+    else:
+        length, offset = decode_varint(data, offset)
+
+    end: int = offset + length
+
+    if end > len(data):
+        raise ValueError('truncated data')
+
+    return data[offset:end], end
+
+
+def encode_string(value: str) -> bytes:
+    """ Encodes string as length-prefixed utf-8
+    :param value: string
+    :return: length-prefixed string bytes
+    """
+    return encode_bytes(value.encode())
+
+
+def decode_string(data: bytes, offset: int) -> tuple[str, int]:
+    """ Decodes length-prefixed utf-8 string
+    :param data: encoded data
+    :param offset: length position
+    :return: string & position after it
+    """
+    value, offset = decode_bytes(data, offset)
+    return value.decode(), offset
+
+
+def encode_hex(value: str) -> bytes:
+    """ Encodes lowercase hexadecimal string as length-prefixed raw bytes, e.g. 32 bytes per public key
+    :param value: lowercase hexadecimal string
+    :return: length-prefixed raw bytes
+    """
+    raw_value: bytes = bytes.fromhex(value)
+
+    # Only canonical hex decodes back to the same string
+    if raw_value.hex() != value:
+        raise ValueError(f'non-canonical hex: {value!r}')
+
+    return encode_bytes(raw_value)
+
+
+def decode_hex(data: bytes, offset: int) -> tuple[str, int]:
+    """ Decodes length-prefixed raw bytes into lowercase hexadecimal string
+    :param data: encoded data
+    :param offset: length position
+    :return: hexadecimal string & position after it
+    """
+    value, offset = decode_bytes(data, offset)
+    return value.hex(), offset
+
+
+def encode_uint64(value: int) -> bytes:
+    """ Encodes integer as fixed-size 8 bytes
+    :param value: non-negative integer below 2 ** 64
+    :return: 8 bytes
+    """
+    return UINT64.pack(value)
+
+
+def decode_uint64(data: bytes, offset: int) -> tuple[int, int]:
+    """ Decodes fixed-size 8-byte integer
+    :param data: encoded data
+    :param offset: integer position
+    :return: integer & position after it
+    """
+    return UINT64.unpack_from(data, offset)[0], offset + UINT64.size
@@ -0,0 +1,103 @@
+import logging
+from typing import Optional
+from datetime import datetime
+from common import TARGET_BLOCK_INTERVAL, RETARGET_INTERVAL, MAX_RETARGET_FACTOR, MEDIAN_TIME_BLOCKS, \
+    MAX_FUTURE_BLOCK_TIME
+from build_blockchain import MAX_TARGET, Block, compute_initial_block_target, compute_target_bits, \
+    encode_block_timestamp
+from build_storage import ChainStore, get_chain_height, get_chain_tip, read_chain_block
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+# Build difficulty retargeting
+def compute_retarget_start_height(next_block_height: int) -> int:
+    """ Finds first block of the retarget window ending at next block's parent
+    :param next_block_height: next block height
+    :return: first window block height
+    """
+    # Every node creates its own genesis, so retarget window starts after it
+    return max(next_block_height - RETARGET_INTERVAL, 2)
+
+
+def retarget_bits(prev_bits: int, start_timestamp: str, prev_timestamp: str, blocks_intervals: int) -> int:
+    """ Scales target by the time the retarget window actually took
+    :param prev_bits: bits of next block's parent
+    :param start_timestamp: timestamp of first window block
+    :param prev_timestamp: timestamp of next block's parent
+    :param blocks_intervals: number of block intervals in window
+    :return: next block target encoded in bits
+    """
+    if blocks_intervals <= 0:
+        return prev_bits
+
+    expected_time: int = int(TARGET_BLOCK_INTERVAL * 1_000_000) * blocks_intervals
+    actual_time: int = encode_block_timestamp(prev_timestamp) - encode_block_timestamp(start_timestamp)
+    # Limit single retarget step, e.g. against skewed miner clocks
+    actual_time = min(max(actual_time, expected_time // MAX_RETARGET_FACTOR), expected_time * MAX_RETARGET_FACTOR)
+    next_target: int = compute_initial_block_target(prev_bits) * actual_time // expected_time
+    return compute_target_bits(min(next_target, MAX_TARGET))
+
+
+def compute_next_bits(chain_store: ChainStore) -> int:
+    """ Computes bits of the block extending chain tip, retargeting every RETARGET_INTERVAL blocks
+    :param chain_store: chain store
+    :return: next block target encoded in bits
+    """
+    tip_block: Block = get_chain_tip(chain_store)
+    next_block_height: int = tip_block.height + 1
+
+    if (next_block_height - 1) % RETARGET_INTERVAL:
+        return tip_block.bits
+
+    start_block: Block = read_chain_block(chain_store, compute_retarget_start_height(next_block_height) - 1)
+    return retarget_bits(tip_block.bits,
+                         start_block.timestamp,
+                         tip_block.timestamp,
+                         tip_block.height - start_block.height)
+
+
+def validate_block_bits(chain_store: ChainStore, new_block: Block) -> bool:
+    """ Validates new block's bits match retargeting rules
+    :param chain_store: chain store with new block's prev block at tip
+    :param new_block: new block
+    :return: bits validation status
+    """
+    return new_block.bits == compute_next_bits(chain_store)
+
+
+def validate_timestamp_order(prev_timestamps: list[str], timestamp: str) -> bool:
+    """ Validates block timestamp is past median time of previous blocks, so it cannot be set back to ease retargeting
+    :param prev_timestamps: timestamps of up to MEDIAN_TIME_BLOCKS previous blocks, genesis excluded
+    :param timestamp: new block timestamp
+    :return: timestamp order validation status
+    """
+    if not prev_timestamps:
+        return True
+
+    median_time: int = sorted(map(encode_block_timestamp, prev_timestamps))[len(prev_timestamps) // 2]
+    return encode_block_timestamp(timestamp) > median_time
+
+
+def validate_block_timestamp(chain_store: ChainStore,
+                             new_block: Block,
+                             current_time: Optional[datetime] = None) -> bool:
+    """ Validates new block's timestamp follows median time past & leads node clock by MAX_FUTURE_BLOCK_TIME at most
+    :param chain_store: chain store with new block's prev block at tip
+    :param new_block: new block
+    :param current_time: node clock (default: now)
+    :return: timestamp validation status
+    """
+    # Every node creates its own genesis, so median time starts after it like retarget windows
+    chain_height: int = get_chain_height(chain_store)
+    prev_timestamps: list[str] = [read_chain_block(chain_store, block_index).timestamp
+                                  for block_index in range(max(chain_height - MEDIAN_TIME_BLOCKS, 1), chain_height)]
+
+    try:
+        max_timestamp: int = encode_block_timestamp(f'{current_time or datetime.now()}') + \
+            int(MAX_FUTURE_BLOCK_TIME * 1_000_000)
+        return validate_timestamp_order(prev_timestamps, new_block.timestamp) and \
+            encode_block_timestamp(new_block.timestamp) <= max_timestamp
+    except Exception as err:
+        logger.warning('validate_block_timestamp error: %r', err)
+        return False
@@ -0,0 +1,183 @@
+import logging
+from typing import TypedDict, Optional, Any
+from collections import defaultdict
+from common import GENESIS_BALANCES
+from build_blockchain import Block
+from build_transaction import AMOUNT_BASE_UNITS, Transaction, convert_amount_to_base_units
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+# Build balance ledger, amounts are kept in integer base units
+class Ledger(TypedDict):
+    balances: dict[str, int]
+    height: int
+    tip_hash: Optional[str]
+
+
+def create_ledger() -> Ledger:
+    """ Creates a ledger holding genesis balances only
+    :return: new ledger
+    """
+    return {'balances': {address: convert_amount_to_base_units(amount) for address, amount in GENESIS_BALANCES.items()},
+            'height': 0,
+            'tip_hash': None,
+            }
+
+
+def compute_balance_changes(transaction: Transaction, is_coinbase: bool) -> dict[str, int]:
+    """ Computes net balance change per address, coinbase inputs mint new coins
+    :param transaction: transaction
+    :param is_coinbase: transaction is block's coinbase transaction
+    :return: balance change per address in base units
+    """
+    balance_changes: defaultdict[str, int] = defaultdict(int)
+
+    if not is_coinbase:
+        for t_input in transaction.inputs:
+            balance_changes[t_input.sender] -= convert_amount_to_base_units(t_input.amount)
+
+    for t_output in transaction.outputs:
+        balance_changes[t_output.receiver] += convert_amount_to_base_units(t_output.amount)
+
+    return balance_changes
+
+
+def compute_spends(transactions: list[Transaction]) -> dict[str, int]:
+    """ Sums amounts spent per sender
+    :param transactions: non-coinbase transactions
+    :return: spent amount per sender in base units
+    """
+    spends: defaultdict[str, int] = defaultdict(int)
+
+    for transaction in transactions:
+        for t_input in transaction.inputs:
+            spends[t_input.sender] += convert_amount_to_base_units(t_input.amount)
+
+    return spends
+
+
+def compute_block_balance_changes(block: Block) -> dict[str, int]:
+    """ Sums net balance change per address over block transactions
+    :param block: block
+    :return: balance change per address in base units
+    """
+    block_balance_changes: defaultdict[str, int] = defaultdict(int)
+
+    for transaction_index, transaction in enumerate(block.transactions):
+        for address, balance_change in compute_balance_changes(transaction, transaction_index == 0).items():
+            block_balance_changes[address] += balance_change
+
+    return block_balance_changes
+
+
+def change_ledger_balances(ledger: Ledger, balance_changes: dict[str, int], sign: int) -> None:
+    """ Adds (sign 1) or reverts (sign -1) balance changes
+    :param ledger: ledger
+    :param balance_changes: balance change per address in base units
+    :param sign: change direction
+    :return: None
+    """
+    balances: dict[str, int] = ledger['balances']
+
+    for address, balance_change in balance_changes.items():
+        new_balance: int = balances.get(address, 0) + sign * balance_change
+
+        # Empty accounts take no memory
+        if new_balance:
+            balances[address] = new_balance
+        else:
+            balances.pop(address, None)
+
+
+def apply_block_to_ledger(ledger: Ledger, block: Block) -> None:
+    """ Applies block on top of ledger
+    :param ledger: ledger
+    :param block: new chain tip block
+    :return: None
+    """
+    change_ledger_balances(ledger, compute_block_balance_changes(block), 1)
+    ledger['height'] = block.height
+    ledger['tip_hash'] = block.hash
+
+
+def rollback_block_from_ledger(ledger: Ledger, block: Block) -> None:
+    """ Reverts ledger's tip block
+    :param ledger: ledger
+    :param block: current chain tip block
+    :return: None
+    """
+    change_ledger_balances(ledger, compute_block_balance_changes(block), -1)
+    ledger['height'] = block.height - 1
+    ledger['tip_hash'] = block.prev_hash
+
+
+def validate_spent_amounts(ledger: Ledger, spends: dict[str, int]) -> bool:
+    """ Validates senders' balances cover their spent amounts, shared by live & startup chain validation
+    :param ledger: ledger
+    :param spends: spent amount per sender in base units
+    :return: spends validation status
+    """
+    return all(ledger['balances'].get(sender, 0) >= spent_amount for sender, spent_amount in spends.items())
+
+
+def validate_spends(ledger: Ledger, transactions: list[Transaction]) -> bool:
+    """ Validates senders own the amounts they spend
+    :param ledger: ledger
+    :param transactions: non-coinbase transactions
+    :return: spends validation status
+    """
+    try:
+        return validate_spent_amounts(ledger, compute_spends(transactions))
+    except Exception as err:
+        logger.warning('validate_spends error: %r', err)
+        return False
+
+
+def validate_transaction_spends(ledger: Ledger, transaction: Transaction) -> bool:
+    """ Validates transaction senders own the amounts they spend, in O(inputs)
+    :param ledger: ledger
+    :param transaction: new transaction
+    :return: transaction spends validation status
+    """
+    return validate_spends(ledger, [transaction])
+
+
+def validate_block_spends(ledger: Ledger, block: Block) -> bool:
+    """ Validates block senders own the amounts they spend across all block transactions
+    :param ledger: ledger at block's prev block
+    :param block: new block
+    :return: block spends validation status
+    """
+    return validate_spends(ledger, block.transactions[1:])
+
+
+def get_balance(ledger: Ledger, address: str) -> float:
+    """ Reads address balance
+    :param ledger: ledger
+    :param address: sender or receiver address
+    :return: balance
+    """
+    return ledger['balances'].get(address, 0) / AMOUNT_BASE_UNITS
+
+
+def export_ledger(ledger: Ledger) -> dict[str, Any]:
+    """ Exports ledger as json-serializable snapshot
+    :param ledger: ledger
+    :return: ledger snapshot
+    """
+    return {'balances': dict(ledger['balances']),
+            'height': ledger['height'],
+            'tip_hash': ledger['tip_hash'],
+            }
+
+
+def import_ledger(ledger_snapshot: dict[str, Any]) -> Ledger:
+    """ Imports ledger from snapshot
+    :param ledger_snapshot: ledger snapshot
+    :return: ledger
+    """
+    return {'balances': {address: int(balance) for address, balance in ledger_snapshot['balances'].items()},
+            'height': ledger_snapshot['height'],
+            'tip_hash': ledger_snapshot['tip_hash'],
+            }
@@ -0,0 +1,378 @@
+import heapq
+import logging
+from time import time
+from typing import TypedDict, Optional, Iterable, Iterator
+from collections import OrderedDict
+from common import MAX_MEMPOOL_TRANSACTIONS, MAX_MEMPOOL_BYTES, MEMPOOL_EXPIRY, REPLACEMENT_FEE_RATE, \
+    MAX_REPLACED_TRANSACTIONS
+from build_transaction import Transaction, compute_transaction_amounts, compute_transaction_size, \
+    convert_amount_to_base_units
+from build_ledger import Ledger, compute_spends
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Stale heap items (removed transactions) allowed before the heap is rebuilt
+FEE_HEAP_SLACK: int = 1024
+MEMPOOL_ADDED: str = 'added'
+MEMPOOL_DUPLICATE: str = 'duplicate'
+MEMPOOL_CONFLICT: str = 'conflict'
+MEMPOOL_FULL: str = 'full'
+
+# Signed fee rate, arrival number & transaction id
+HeapItem = tuple[float, int, str]
+
+
+# Build mempool, fees & spends are kept in integer base units
+class MempoolEntry(TypedDict):
+    transaction: Transaction
+    fee: int
+    size: int
+    fee_rate: float
+    sequence: int
+    time: float
+    spends: dict[str, int]
+
+
+class MempoolSender(TypedDict):
+    spends: int
+    count: int
+    heap: list[HeapItem]
+
+
+class Mempool(TypedDict):
+    entries: OrderedDict[str, MempoolEntry]
+    fee_heap: list[HeapItem]
+    eviction_heap: list[HeapItem]
+    senders: dict[str, MempoolSender]
+    sequence: int
+    bytes: int
+    max_size: int
+    max_bytes: int
+    expiry: float
+
+
+def create_mempool(max_size: int = MAX_MEMPOOL_TRANSACTIONS,
+                   max_bytes: int = MAX_MEMPOOL_BYTES,
+                   expiry: float = MEMPOOL_EXPIRY) -> Mempool:
+    """ Creates an empty mempool keyed by transaction id in arrival order
+    :param max_size: max number of transactions kept
+    :param max_bytes: max binary size of transactions kept
+    :param expiry: seconds before a transaction expires
+    :return: new mempool
+    """
+    return {'entries': OrderedDict(),
+            'fee_heap': [],
+            'eviction_heap': [],
+            'senders': {},
+            'sequence': 0,
+            'bytes': 0,
+            'max_size': max_size,
+            'max_bytes': max_bytes,
+            'expiry': expiry,
+            }
+
+
+def create_mempool_entry(new_transaction: Transaction, sequence: int) -> MempoolEntry:
+    """ Creates mempool entry with transaction fee, size & spends per sender
+    :param new_transaction: new transaction
+    :param sequence: mempool arrival number
+    :return: new mempool entry
+    """
+    transaction_inputs, transaction_outputs = compute_transaction_amounts(new_transaction)
+    transaction_fee: int = transaction_inputs - transaction_outputs
+    transaction_size: int = compute_transaction_size(new_transaction)
+    return {'transaction': new_transaction,
+            'fee': transaction_fee,
+            'size': transaction_size,
+            'fee_rate': transaction_fee / transaction_size,
+            'sequence': sequence,
+            'time': time(),
+            'spends': compute_spends([new_transaction]),
+            }
+
+
+def insert_mempool_entry(mempool: Mempool, mempool_entry: MempoolEntry) -> None:
+    """ Adds entry to mempool & its fee, eviction & sender indexes, O(log n)
+    :param mempool: mempool
+    :param mempool_entry: new mempool entry
+    :return: None
+    """
+    transaction_id: str = mempool_entry['transaction'].id
+    mempool['entries'][transaction_id] = mempool_entry
+    mempool['bytes'] += mempool_entry['size']
+    # Highest fee rate first, oldest first among equal fee rates
+    heapq.heappush(mempool['fee_heap'], (-mempool_entry['fee_rate'], mempool_entry['sequence'], transaction_id))
+    # Lowest fee rate first, evicted & replaced before others
+    heapq.heappush(mempool['eviction_heap'], (mempool_entry['fee_rate'], mempool_entry['sequence'], transaction_id))
+
+    for sender, spent_amount in mempool_entry['spends'].items():
+        mempool_sender: MempoolSender = mempool['senders'].setdefault(sender,
+                                                                      {'spends': 0, 'count': 0, 'heap': []})
+        mempool_sender['spends'] += spent_amount
+        mempool_sender['count'] += 1
+        heapq.heappush(mempool_sender['heap'],
+                       (mempool_entry['fee_rate'], mempool_entry['sequence'], transaction_id))
+
+
+def remove_mempool_entry(mempool: Mempool, transaction_id: str) -> Optional[MempoolEntry]:
+    """ Removes entry from mempool & sender indexes, heap items are dropped lazily
+    :param mempool: mempool
+    :param transaction_id: transaction id
+    :return: removed entry or None if transaction not in mempool
+    """
+    mempool_entry: Optional[MempoolEntry] = mempool['entries'].pop(transaction_id, None)
+
+    if mempool_entry is None:
+        return None
+
+    mempool['bytes'] -= mempool_entry['size']
+
+    for sender, spent_amount in mempool_entry['spends'].items():
+        mempool_sender: MempoolSender = mempool['senders'][sender]
+        mempool_sender['spends'] -= spent_amount
+        mempool_sender['count'] -= 1
+
+        if not mempool_sender['count']:
+            del mempool['senders'][sender]
+        elif len(mempool_sender['heap']) > 2 * mempool_sender['count']:
+            mempool_sender['heap'] = [i for i in mempool_sender['heap'] if is_fee_heap_item_live(mempool, i)]
+            heapq.heapify(mempool_sender['heap'])
+
+    return mempool_entry
+
+
+def expire_mempool_transactions(mempool: Mempool) -> int:
+    """ Removes transactions older than mempool expiry, found at the front of arrival order
+    :param mempool: mempool
+    :return: number of expired transactions
+    """
+    expiry_time: float = time() - mempool['expiry']
+    expired_count: int = 0
+
+    while mempool['entries'] and next(iter(mempool['entries'].values()))['time'] < expiry_time:
+        remove_mempool_entry(mempool, next(iter(mempool['entries'])))
+        expired_count += 1
+
+    return expired_count
+
+
+def select_replaced_entries(mempool: Mempool,
+                            ledger: Ledger,
+                            new_entry: MempoolEntry) -> Optional[dict[str, MempoolEntry]]:
+    """ Selects senders' lowest fee rate transactions to replace, so new transaction's senders stay within balances
+    :param mempool: mempool
+    :param ledger: ledger at chain tip
+    :param new_entry: new mempool entry
+    :return: replaced entries by transaction id (empty without conflicts), None if conflicts cannot be resolved
+    """
+    replaced_entries: dict[str, MempoolEntry] = {}
+    freed_spends: dict[str, int] = {}
+
+    for sender, spent_amount in new_entry['spends'].items():
+        mempool_sender: Optional[MempoolSender] = mempool['senders'].get(sender)
+        pending_spends: int = mempool_sender['spends'] if mempool_sender is not None else 0
+        shortfall: int = pending_spends - freed_spends.get(sender, 0) + spent_amount - ledger['balances'].get(sender, 0)
+
+        if shortfall <= 0:
+            continue
+
+        for mempool_entry in iterate_heap_entries(mempool, mempool_sender['heap'] if mempool_sender else []):
+            if shortfall <= 0:
+                break
+
+            if mempool_entry['transaction'].id in replaced_entries:
+                continue
+
+            replaced_entries[mempool_entry['transaction'].id] = mempool_entry
+
+            # Stop walking a large sender's heap as soon as replacement is too big
+            if len(replaced_entries) > MAX_REPLACED_TRANSACTIONS:
+                return None
+
+            shortfall -= mempool_entry['spends'][sender]
+
+            for replaced_sender, replaced_amount in mempool_entry['spends'].items():
+                freed_spends[replaced_sender] = freed_spends.get(replaced_sender, 0) + replaced_amount
+
+        if shortfall > 0:
+            return None
+
+    return replaced_entries
+
+
+def is_replacement_paid(new_entry: MempoolEntry, replaced_entries: dict[str, MempoolEntry]) -> bool:
+    """ Checks replacement pays a higher fee rate than each replaced transaction & their fees plus relay of its size
+    :param new_entry: new mempool entry
+    :param replaced_entries: replaced entries
+    :return: replacement status
+    """
+    replaced_fees: int = sum(e['fee'] for e in replaced_entries.values())
+    return all(new_entry['fee_rate'] > e['fee_rate'] for e in replaced_entries.values()) and \
+        new_entry['fee'] >= replaced_fees + convert_amount_to_base_units(REPLACEMENT_FEE_RATE) * new_entry['size']
+
+
+def select_evicted_entries(mempool: Mempool,
+                           new_entry: MempoolEntry,
+                           replaced_entries: dict[str, MempoolEntry]) -> Optional[list[MempoolEntry]]:
+    """ Selects lowest fee rate transactions to evict, so mempool stays within count & byte budget
+    :param mempool: mempool
+    :param new_entry: new mempool entry
+    :param replaced_entries: entries removed by replacement
+    :return: evicted entries, None if mempool only holds transactions paying at least new one's fee rate
+    """
+    excess_count: int = len(mempool['entries']) - len(replaced_entries) + 1 - mempool['max_size']
+    excess_bytes: int = mempool['bytes'] - sum(e['size'] for e in replaced_entries.values()) + new_entry['size'] - \
+        mempool['max_bytes']
+    evicted_entries: list[MempoolEntry] = []
+
+    for mempool_entry in iterate_heap_entries(mempool, mempool['eviction_heap']):
+        if excess_count <= 0 and excess_bytes <= 0:
+            break
+
+        if mempool_entry['transaction'].id in replaced_entries:
+            continue
+
+        if mempool_entry['fee_rate'] >= new_entry['fee_rate']:
+            return None
+
+        evicted_entries.append(mempool_entry)
+        excess_count -= 1
+        excess_bytes -= mempool_entry['size']
+
+    return evicted_entries if excess_count <= 0 and excess_bytes <= 0 else None
+
+
+def add_mempool_transaction(mempool: Mempool, new_transaction: Transaction, ledger: Optional[Ledger] = None) -> str:
+    """ Adds transaction to mempool, replacing conflicting ones it outbids & evicting lower fee rates when full
+    :param mempool: mempool
+    :param new_transaction: new transaction
+    :param ledger: ledger at chain tip, conflicts are checked against its balances (None skips conflict checks)
+    :return: admission status: added, duplicate, conflict (not paying replacement) or full (fee rate too low)
+    """
+    expire_mempool_transactions(mempool)
+
+    if new_transaction.id in mempool['entries']:
+        return MEMPOOL_DUPLICATE
+
+    new_entry: MempoolEntry = create_mempool_entry(new_transaction, mempool['sequence'] + 1)
+    # Transactions conflict when their senders' combined spends exceed balances
+    replaced_entries: Optional[dict[str, MempoolEntry]] = select_replaced_entries(mempool, ledger, new_entry) \
+        if ledger is not None else {}
+
+    if replaced_entries is None or (replaced_entries and not is_replacement_paid(new_entry, replaced_entries)):
+        return MEMPOOL_CONFLICT
+
+    evicted_entries: Optional[list[MempoolEntry]] = select_evicted_entries(mempool, new_entry, replaced_entries)
+
+    if evicted_entries is None:
+        return MEMPOOL_FULL
+
+    for removed_entry in list(replaced_entries.values()) + evicted_entries:
+        remove_mempool_entry(mempool, removed_entry['transaction'].id)
+
+    if replaced_entries or evicted_entries:
+        logger.debug('add_mempool_transaction: %s replaced=%s evicted=%s', new_transaction.id, list(replaced_entries),
+                     [e['transaction'].id for e in evicted_entries])
+
+    mempool['sequence'] += 1
+    insert_mempool_entry(mempool, new_entry)
+    compact_fee_heap(mempool)
+    return MEMPOOL_ADDED
+
+
+def remove_mempool_transactions(mempool: Mempool, transactions_ids: Iterable[str]) -> int:
+    """ Removes transactions from mempool
+    :param mempool: mempool
+    :param transactions_ids: ids of transactions to remove
+    :return: number of removed transactions
+    """
+    removed_count: int = sum(remove_mempool_entry(mempool, t_id) is not None for t_id in transactions_ids)
+    compact_fee_heap(mempool)
+    return removed_count
+
+
+def remove_mempool_conflicts(mempool: Mempool, ledger: Ledger, senders: Iterable[str]) -> int:
+    """ Removes senders' lowest fee rate transactions until their spends fit balances, e.g. after a block spent them
+    :param mempool: mempool
+    :param ledger: ledger at chain tip
+    :param senders: senders whose balances changed
+    :return: number of removed transactions
+    """
+    removed_count: int = 0
+
+    for sender in senders:
+        while sender in mempool['senders'] and \
+                mempool['senders'][sender]['spends'] > ledger['balances'].get(sender, 0):
+            sender_heap: list[HeapItem] = mempool['senders'][sender]['heap']
+
+            # Removed entry's item is popped as stale on the next pass
+            if is_fee_heap_item_live(mempool, sender_heap[0]):
+                remove_mempool_entry(mempool, sender_heap[0][2])
+                removed_count += 1
+            else:
+                heapq.heappop(sender_heap)
+
+    compact_fee_heap(mempool)
+    return removed_count
+
+
+def compact_fee_heap(mempool: Mempool) -> None:
+    """ Rebuilds fee & eviction heaps once removed transactions dominate them
+    :param mempool: mempool
+    :return: None
+    """
+    if len(mempool['fee_heap']) > 2 * len(mempool['entries']) + FEE_HEAP_SLACK:
+        mempool['fee_heap'] = [(-entry['fee_rate'], entry['sequence'], transaction_id)
+                               for transaction_id, entry in mempool['entries'].items()]
+        heapq.heapify(mempool['fee_heap'])
+
+    if len(mempool['eviction_heap']) > 2 * len(mempool['entries']) + FEE_HEAP_SLACK:
+        mempool['eviction_heap'] = [(entry['fee_rate'], entry['sequence'], transaction_id)
+                                    for transaction_id, entry in mempool['entries'].items()]
+        heapq.heapify(mempool['eviction_heap'])
+
+
+def is_fee_heap_item_live(mempool: Mempool, heap_item: HeapItem) -> bool:
+    """ Checks fee heap item still points to a mempool transaction
+    :param mempool: mempool
+    :param heap_item: fee heap item
+    :return: heap item status
+    """
+    mempool_entry = mempool['entries'].get(heap_item[2])
+    return mempool_entry is not None and mempool_entry['sequence'] == heap_item[1]
+
+
+def iterate_heap_entries(mempool: Mempool, heap: list[HeapItem]) -> Iterator[MempoolEntry]:
+    """ Iterates mempool entries in heap order without popping the heap
+    :param mempool: mempool
+    :param heap: fee, eviction or sender heap
+    :return: mempool entries, O(log k) each for the first k
+    """
+    # Best-first walk over the heap tree: a node is visited only after its parent
+    frontier: list[tuple[HeapItem, int]] = [(heap[0], 0)] if heap else []
+
+    while frontier:
+        heap_item, heap_index = heapq.heappop(frontier)
+
+        for child_index in (2 * heap_index + 1, 2 * heap_index + 2):
+            if child_index < len(heap):
+                heapq.heappush(frontier, (heap[child_index], child_index))
+
+        if is_fee_heap_item_live(mempool, heap_item):
+            yield mempool['entries'][heap_item[2]]
+
+
+def iterate_mempool_by_fee_rate(mempool: Mempool) -> Iterator[MempoolEntry]:
+    """ Iterates mempool entries from highest fee rate without popping the fee heap
+    :param mempool: mempool
+    :return: mempool entries, O(log k) each for the first k
+    """
+    return iterate_heap_entries(mempool, mempool['fee_heap'])
+
+
+def list_mempool_transactions(mempool: Mempool) -> list[Transaction]:
+    """ Lists all mempool transactions
+    :param mempool: mempool
+    :return: transactions in arrival order
+    """
+    return [entry['transaction'] for entry in mempool['entries'].values()]
@@ -0,0 +1,133 @@
+import logging
+from typing import TypedDict, Optional
+from collections import OrderedDict
+from hashlib import sha256
+from common import MERKLE_CACHE_SIZE
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+MERKLE_EMPTY_ROOT: bytes = bytes(32)
+# Trees of recently requested blocks, keyed by merkle root
+merkle_tree_cache: OrderedDict[bytes, 'MerkleTree'] = OrderedDict()
+
+
+# Build merkle tree
+class MerkleTree(TypedDict):
+    levels: list[list[bytes]]
+
+
+class MerkleProofStep(TypedDict):
+    hash: str
+    is_left: bool
+
+
+def hash_merkle_node(node_data: bytes) -> bytes:
+    """ Double hashes merkle tree node
+    :param node_data: leaf data or concatenated child hashes
+    :return: node hash
+    """
+    return sha256(sha256(node_data).digest()).digest()
+
+
+def hash_merkle_leaf(transaction_id: str) -> bytes:
+    """ Reads merkle tree leaf from transaction id, already a double SHA-256 of the transaction
+    :param transaction_id: hexadecimal transaction id
+    :return: leaf hash
+    """
+    return bytes.fromhex(transaction_id)
+
+
+def create_merkle_tree(transactions_ids: list[str]) -> MerkleTree:
+    """ Builds merkle tree keeping every level, odd last node is paired with itself
+    :param transactions_ids: block transactions ids
+    :return: new merkle tree
+    """
+    levels: list[list[bytes]] = [[hash_merkle_leaf(transaction_id) for transaction_id in transactions_ids]]
+
+    while len(levels[-1]) > 1:
+        level: list[bytes] = levels[-1]
+        levels.append([hash_merkle_node(level[i] + level[min(i + 1, len(level) - 1)])
+                       for i in range(0, len(level), 2)])
+
+    return {'levels': levels}
+
+
+def is_merkle_tree_mutated(merkle_tree: MerkleTree) -> bool:
+    """ Checks for an equal last pair at any level, i.e. last nodes repeated to match the root of an odd level
+    :param merkle_tree: merkle tree
+    :return: mutation status, such a tree's root also commits to the transactions without the repeats
+    """
+    return any(len(level) % 2 == 0 and level[-2] == level[-1] for level in merkle_tree['levels'][:-1])
+
+
+def get_merkle_root(merkle_tree: MerkleTree) -> bytes:
+    """ Reads merkle tree root
+    :param merkle_tree: merkle tree
+    :return: merkle root
+    """
+    return merkle_tree['levels'][-1][0] if merkle_tree['levels'][0] else MERKLE_EMPTY_ROOT
+
+
+def compute_merkle_root(transactions_ids: list[str]) -> str:
+    """ Computes merkle root of transactions ids
+    :param transactions_ids: block transactions ids
+    :return: hexadecimal merkle root
+    """
+    return get_merkle_root(create_merkle_tree(transactions_ids)).hex()
+
+
+def get_cached_merkle_tree(merkle_root: str, transactions_ids: list[str]) -> MerkleTree:
+    """ Reads merkle tree from cache, building it on a miss
+    :param merkle_root: hexadecimal merkle root
+    :param transactions_ids: block transactions ids
+    :return: merkle tree
+    """
+    merkle_root_key: bytes = bytes.fromhex(merkle_root)
+    merkle_tree: Optional[MerkleTree] = merkle_tree_cache.get(merkle_root_key)
+
+    if merkle_tree is None:
+        merkle_tree = create_merkle_tree(transactions_ids)
+        merkle_tree_cache[merkle_root_key] = merkle_tree
+
+        while len(merkle_tree_cache) > MERKLE_CACHE_SIZE:
+            merkle_tree_cache.popitem(last=False)
+    else:
+        merkle_tree_cache.move_to_end(merkle_root_key)
+
+    return merkle_tree
+
+
+def create_merkle_proof(merkle_tree: MerkleTree, leaf_index: int) -> list[MerkleProofStep]:
+    """ Collects sibling hashes on the path from leaf to root, O(log n)
+    :param merkle_tree: merkle tree
+    :param leaf_index: transaction position in block
+    :return: merkle proof
+    """
+    merkle_proof: list[MerkleProofStep] = []
+
+    for level in merkle_tree['levels'][:-1]:
+        sibling_index: int = min(leaf_index ^ 1, len(level) - 1)
+        merkle_proof.append({'hash': level[sibling_index].hex(), 'is_left': sibling_index < leaf_index})
+        leaf_index //= 2
+
+    return merkle_proof
+
+
+def verify_merkle_proof(transaction_id: str, merkle_proof: list[MerkleProofStep], merkle_root: str) -> bool:
+    """ Verifies transaction is included in block without the block's other transactions
+    :param transaction_id: transaction id
+    :param merkle_proof: merkle proof
+    :param merkle_root: hexadecimal merkle root from block header
+    :return: inclusion validation status
+    """
+    try:
+        node_hash: bytes = hash_merkle_leaf(transaction_id)
+
+        for proof_step in merkle_proof:
+            sibling_hash: bytes = bytes.fromhex(proof_step['hash'])
+            node_hash = hash_merkle_node(sibling_hash + node_hash if proof_step['is_left'] else node_hash + sibling_hash)
+
+        return node_hash.hex() == merkle_root
+    except Exception as err:
+        logger.warning('verify_merkle_proof error: %r', err)
+        return False
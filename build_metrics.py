@@ -0,0 +1,173 @@
+from typing import TypedDict, Callable, Final
+from bisect import bisect_left
+from threading import Lock
+
+METRICS_MIMETYPE: Final = 'text/plain; version=0.0.4; charset=utf-8'
+COUNTER: Final = 'counter'
+GAUGE: Final = 'gauge'
+HISTOGRAM: Final = 'histogram'
+# Latency buckets in seconds, from sub-millisecond handlers to multi-second mining rounds
+LATENCY_BUCKETS: Final = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRICS_DEFINITIONS: Final = {
+    'galleon_requests_total': (COUNTER, 'Handled requests by route, method & status'),
+    'galleon_request_duration_seconds': (HISTOGRAM, 'Request handling latency by route & method'),
+    'galleon_mining_hashes_total': (COUNTER, 'Hashes computed by successful mining rounds'),
+    'galleon_mining_hashrate': (GAUGE, 'Hashes per second of the last mined block'),
+    'galleon_mining_duration_seconds': (HISTOGRAM, 'Time from mining job start to mined block'),
+    'galleon_mining_templates_total': (COUNTER, 'Block templates built, including cancelled ones'),
+    'galleon_mined_blocks_total': (COUNTER, 'Blocks mined by node'),
+    'galleon_block_validation_seconds': (HISTOGRAM, 'Validation & connection latency of blocks from peers'),
+    'galleon_blocks_total': (COUNTER, 'Blocks received from peers by status'),
+    'galleon_broadcast_latency_seconds': (HISTOGRAM, 'Per-peer broadcast latency, retries included'),
+    'galleon_broadcast_total': (COUNTER, 'Per-peer broadcasts by item kind & status'),
+    'galleon_mempool_transactions': (GAUGE, 'Transactions in mempool'),
+    'galleon_mempool_bytes': (GAUGE, 'Binary size of mempool transactions'),
+    'galleon_mempool_oldest_age_seconds': (GAUGE, 'Age of the oldest mempool transaction'),
+    'galleon_chain_height': (GAUGE, 'Main chain height'),
+}
+
+# Metric name & sorted label pairs
+MetricKey = tuple[str, tuple[tuple[str, str], ...]]
+
+
+# Build metrics
+class Histogram(TypedDict):
+    counts: list[int]
+    sum: float
+    count: int
+
+
+class Metrics(TypedDict):
+    lock: Lock
+    counters: dict[MetricKey, float]
+    gauges: dict[MetricKey, float]
+    histograms: dict[MetricKey, Histogram]
+    collectors: list[Callable[[], None]]
+
+
+def create_metrics() -> Metrics:
+    """ Creates an empty metrics registry
+    :return: new metrics
+    """
+    return {'lock': Lock(), 'counters': {}, 'gauges': {}, 'histograms': {}, 'collectors': []}
+
+
+def create_metric_key(name: str, labels: dict[str, str]) -> MetricKey:
+    """ Creates metric key from metric name & labels
+    :param name: metric name
+    :param labels: metric labels
+    :return: metric key
+    """
+    return name, tuple(sorted(labels.items()))
+
+
+def increment_counter(metrics: Metrics, name: str, labels: dict[str, str], value: float = 1) -> None:
+    """ Increments counter
+    :param metrics: metrics
+    :param name: metric name
+    :param labels: metric labels
+    :param value: increment
+    :return: None
+    """
+    metric_key: MetricKey = create_metric_key(name, labels)
+
+    with metrics['lock']:
+        metrics['counters'][metric_key] = metrics['counters'].get(metric_key, 0) + value
+
+
+def set_gauge(metrics: Metrics, name: str, labels: dict[str, str], value: float) -> None:
+    """ Sets gauge
+    :param metrics: metrics
+    :param name: metric name
+    :param labels: metric labels
+    :param value: gauge value
+    :return: None
+    """
+    metric_key: MetricKey = create_metric_key(name, labels)
+
+    with metrics['lock']:
+        metrics['gauges'][metric_key] = value
+
+
+def observe_histogram(metrics: Metrics, name: str, labels: dict[str, str], value: float) -> None:
+    """ Counts value in the first bucket it fits, cumulative counts are summed on export
+    :param metrics: metrics
+    :param name: metric name
+    :param labels: metric labels
+    :param value: observed value
+    :return: None
+    """
+    metric_key: MetricKey = create_metric_key(name, labels)
+    bucket_index: int = bisect_left(LATENCY_BUCKETS, value)
+
+    with metrics['lock']:
+        histogram: Histogram = metrics['histograms'].setdefault(metric_key,
+                                                                {'counts': [0] * (len(LATENCY_BUCKETS) + 1),
+                                                                 'sum': 0.0,
+                                                                 'count': 0})
+        histogram['counts'][bucket_index] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+def add_metrics_collector(metrics: Metrics, collector: Callable[[], None]) -> None:
+    """ Registers callback setting gauges read only on export, e.g. mempool size
+    :param metrics: metrics
+    :param collector: callback
+    :return: None
+    """
+    metrics['collectors'].append(collector)
+
+
+def escape_label_value(value: str) -> str:
+    """ Escapes backslashes, quotes & newlines in label value
+    :param value: label value
+    :return: escaped label value
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_metric_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    """ Formats labels in exposition format
+    :param labels: sorted label pairs
+    :return: formatted labels, empty without labels
+    """
+    if not labels:
+        return ''
+
+    escaped_labels: list[str] = [f'{label}="{escape_label_value(value)}"' for label, value in labels]
+    return '{' + ','.join(escaped_labels) + '}'
+
+
+def export_metrics(metrics: Metrics) -> str:
+    """ Exports metrics in Prometheus text exposition format
+    :param metrics: metrics
+    :return: metrics text
+    """
+    for collector in metrics['collectors']:
+        collector()
+
+    lines_by_name: dict[str, list[str]] = {name: [] for name in METRICS_DEFINITIONS}
+
+    with metrics['lock']:
+        for (name, labels), value in list(metrics['counters'].items()) + list(metrics['gauges'].items()):
+            lines_by_name[name].append(f'{name}{format_metric_labels(labels)} {value}')
+
+        for (name, labels), histogram in metrics['histograms'].items():
+            cumulative_count: int = 0
+
+            for bucket, bucket_count in zip(LATENCY_BUCKETS + ('+Inf',), histogram['counts']):
+                cumulative_count += bucket_count
+                lines_by_name[name].append(f'{name}_bucket{format_metric_labels(labels + (("le", str(bucket)),))} '
+                                           f'{cumulative_count}')
+
+            lines_by_name[name].append(f'{name}_sum{format_metric_labels(labels)} {histogram["sum"]}')
+            lines_by_name[name].append(f'{name}_count{format_metric_labels(labels)} {histogram["count"]}')
+
+    metrics_lines: list[str] = []
+
+    for name, (metric_type, metric_help) in METRICS_DEFINITIONS.items():
+        if lines_by_name[name]:
+            metrics_lines.extend([f'# HELP {name} {metric_help}', f'# TYPE {name} {metric_type}', *lines_by_name[name]])
+
+    return '\n'.join(metrics_lines) + '\n'
@@ -0,0 +1,176 @@
+from typing import TypedDict, Optional, Protocol
+from hashlib import sha256
+from threading import Lock
+from multiprocessing import Event
+from multiprocessing.synchronize import Event as ProcessEvent
+from concurrent.futures import Future, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from build_blockchain import INITIAL_BLOCK_NONCE, BLOCK_HEADER_NONCE, InitialBlock, encode_block_header_prefix
+
+HASH_SIZE: int = 32
+NONCE_CHUNK_SIZE: int = 1 << 16
+CANCEL_POLL_INTERVAL: float = 0.05
+# Set inside every pool worker process by init_mining_worker
+worker_stop_event: Optional[ProcessEvent] = None
+
+
+class CancelEvent(Protocol):
+    def is_set(self) -> bool: ...
+
+
+class MiningPool(TypedDict):
+    executor: ProcessPoolExecutor
+    stop_event: ProcessEvent
+    workers: int
+    lock: Lock
+
+
+# Build miner
+def search_nonce_range(block_header_prefix: bytes,
+                       target_value: int,
+                       start_nonce: int,
+                       stop_nonce: int,
+                       step: int = 1) -> Optional[tuple[str, int]]:
+    """ Searches nonce range for a block hash below target
+    :param block_header_prefix: binary block header without nonce
+    :param target_value: integer block target
+    :param start_nonce: first nonce to try
+    :param stop_nonce: nonce to stop at (exclusive)
+    :param step: nonce stride
+    :return: new block hash & nonce or None if range exhausted
+    """
+    # Equal length big-endian bytes compare the same way as their integer values
+    target_bytes: bytes = target_value.to_bytes(HASH_SIZE, 'big')
+    pack_nonce = BLOCK_HEADER_NONCE.pack
+
+    for block_nonce in range(start_nonce, stop_nonce, step):
+        block_digest: bytes = sha256(sha256(block_header_prefix + pack_nonce(block_nonce)).digest()).digest()
+
+        if block_digest < target_bytes:
+            return block_digest.hex(), block_nonce
+
+    return None
+
+
+def mine_initial_block(initial_block: InitialBlock,
+                       initial_block_target: int,
+                       cancel_event: Optional[CancelEvent] = None) -> Optional[tuple[str, int]]:
+    """ Computes block hash & nonce packing block header once
+    :param initial_block: initial block
+    :param initial_block_target: initial block target
+    :param cancel_event: event aborting mining when set
+    :return: new block hash & nonce or None if mining cancelled
+    """
+    block_header_prefix: bytes = encode_block_header_prefix(initial_block)
+    # Same nonce order as proof_of_work, so both find the same golden nonce
+    start_nonce: int = INITIAL_BLOCK_NONCE
+
+    while cancel_event is None or not cancel_event.is_set():
+        stop_nonce: int = start_nonce + NONCE_CHUNK_SIZE
+        mining_result = search_nonce_range(block_header_prefix, initial_block_target, start_nonce, stop_nonce)
+
+        if mining_result is not None:
+            return mining_result
+
+        start_nonce = stop_nonce
+
+    return None
+
+
+def init_mining_worker(stop_event: ProcessEvent) -> None:
+    """ Stores pool-wide stop event in mining worker process
+    :param stop_event: event stopping all workers once a nonce is found
+    :return: None
+    """
+    global worker_stop_event
+    worker_stop_event = stop_event
+
+
+def search_nonce_stride(block_header_prefix: bytes,
+                        target_value: int,
+                        start_nonce: int,
+                        step: int) -> Optional[tuple[str, int]]:
+    """ Searches every step-th nonce from start nonce until found or stopped
+    :param block_header_prefix: binary block header without nonce
+    :param target_value: integer block target
+    :param start_nonce: worker's first nonce
+    :param step: nonce stride (number of workers)
+    :return: new block hash & nonce or None if stopped by another worker
+    """
+    chunk_span: int = NONCE_CHUNK_SIZE * step
+
+    while not worker_stop_event.is_set():
+        stop_nonce: int = start_nonce + chunk_span
+        mining_result = search_nonce_range(block_header_prefix, target_value, start_nonce, stop_nonce, step)
+
+        if mining_result is not None:
+            # Stop sibling workers right away
+            worker_stop_event.set()
+            return mining_result
+
+        start_nonce = stop_nonce
+
+    return None
+
+
+def create_mining_pool(mining_workers: int) -> MiningPool:
+    """ Creates a process pool for parallel mining
+    :param mining_workers: number of mining processes
+    :return: new mining pool
+    """
+    stop_event: ProcessEvent = Event()
+    executor = ProcessPoolExecutor(max_workers=mining_workers,
+                                   initializer=init_mining_worker,
+                                   initargs=(stop_event,))
+    return {'executor': executor, 'stop_event': stop_event, 'workers': mining_workers, 'lock': Lock()}
+
+
+def mine_initial_block_parallel(mining_pool: MiningPool,
+                                initial_block: InitialBlock,
+                                initial_block_target: int,
+                                cancel_event: Optional[CancelEvent] = None) -> Optional[tuple[str, int]]:
+    """ Computes block hash & nonce across all pool workers using strided nonce ranges
+    :param mining_pool: mining pool
+    :param initial_block: initial block
+    :param initial_block_target: initial block target
+    :param cancel_event: event aborting mining when set
+    :return: new block hash & nonce or None if mining cancelled
+    """
+    block_header_prefix: bytes = encode_block_header_prefix(initial_block)
+    mining_result: Optional[tuple[str, int]] = None
+
+    # One mining job per pool at a time, since workers share the stop event
+    with mining_pool['lock']:
+        mining_pool['stop_event'].clear()
+        pending_futures: set[Future] = {mining_pool['executor'].submit(search_nonce_stride,
+                                                                       block_header_prefix,
+                                                                       initial_block_target,
+                                                                       INITIAL_BLOCK_NONCE + worker_index,
+                                                                       mining_pool['workers'])
+                                        for worker_index in range(mining_pool['workers'])}
+
+        try:
+            while mining_result is None and pending_futures:
+                done_futures, pending_futures = wait(pending_futures,
+                                                     timeout=CANCEL_POLL_INTERVAL,
+                                                     return_when=FIRST_COMPLETED)
+
+                for done_future in done_futures:
+                    mining_result = mining_result or done_future.result()
+
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+        finally:
+            # Stop remaining workers & wait for them before the next job reuses the pool
+            mining_pool['stop_event'].set()
+            wait(pending_futures)
+
+    return mining_result
+
+
+def shutdown_mining_pool(mining_pool: MiningPool) -> None:
+    """ Stops mining pool processes
+    :param mining_pool: mining pool
+    :return: None
+    """
+    mining_pool['stop_event'].set()
+    mining_pool['executor'].shutdown(cancel_futures=True)
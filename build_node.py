@@ -1,59 +1,281 @@
-import requests
-from typing import TypedDict
-from requests import Response, RequestException
-from common import NODE_PORTS, SUCCESS_REQUEST_STATUS
+import logging
+from typing import TypedDict, Optional, Any
+from collections import OrderedDict
+from threading import Lock
+from time import sleep, time
+from common import MEMPOOL_SNAPSHOT_INTERVAL, SUCCESS_REQUEST_STATUS, BAD_REQUEST_STATUS, CONFLICT_REQUEST_STATUS
 from build_blockchain import Block, create_chain
-from build_transaction import Transaction
+from build_broadcast import PeerBroadcastResult
+from build_transaction import Transaction, TransactionResult, create_transaction, export_transaction
+from build_mempool import MEMPOOL_ADDED, MEMPOOL_DUPLICATE, MEMPOOL_CONFLICT, Mempool, MempoolEntry, create_mempool, \
+    add_mempool_transaction, remove_mempool_transactions, remove_mempool_conflicts, expire_mempool_transactions, \
+    list_mempool_transactions
+from build_ledger import Ledger, create_ledger, apply_block_to_ledger, rollback_block_from_ledger, export_ledger, \
+    import_ledger, validate_transaction_spends
+from build_validator import ValidationPool, ChainValidation, validate_chain
+from build_metrics import Metrics, create_metrics, set_gauge
+from build_transaction_index import TransactionIndex, create_transaction_index, load_transaction_index, \
+    export_transaction_index, import_transaction_index, index_block_transactions, unindex_block_transactions, \
+    find_transaction_ref
+from build_storage import MEMPOOL_FILE_NAME, LEDGER_FILE_NAME, TRANSACTION_INDEX_FILE_NAME, ChainStore, \
+    open_chain_store, get_chain_height, read_chain_block, append_chain_block, iterate_chain_blocks, \
+    truncate_chain_store, save_snapshot, load_snapshot
+
+logger: logging.Logger = logging.getLogger(__name__)
 
 
 # Build node
 class Node(TypedDict):
     port: int
-    mempool: list[Transaction]
-    chain: list[Block]
+    peers: list[str]
+    mempool: Mempool
+    chain: ChainStore
+    ledger: Ledger
+    transaction_index: TransactionIndex
+    data_dir: Optional[str]
+    metrics: Metrics
+
 
+class MineBlockResponse(TypedDict):
+    new_block: Block
+    updated_nodes: list[PeerBroadcastResult]
 
-def create_node(node_port: int) -> Node:
-    """ Creates a new node with data
+
+def create_node(node_port: int, data_dir: Optional[str] = None, peers: Optional[list[str]] = None) -> Node:
+    """ Creates a node, reloading chain & mempool snapshot stored in data dir
     :param node_port: node port
+    :param data_dir: node data directory (None keeps node state until exit only)
+    :param peers: peer urls
     :return: new node
     """
-    node_address: str = f'Node:{node_port}'
-    miner_address: str = f'Miner:{node_port}'
-    node_chain: list[Block] = create_chain(node_address, miner_address)
-    return {'port': node_port, 'mempool': [], 'chain': node_chain}
+    node_chain: ChainStore = open_chain_store(data_dir)
+
+    # Start a fresh chain with genesis block
+    if get_chain_height(node_chain) == 0:
+        node_address: str = f'Node:{node_port}'
+        miner_address: str = f'Miner:{node_port}'
+
+        for genesis_block in create_chain(node_address, miner_address):
+            append_chain_block(node_chain, genesis_block)
+
+    node_ledger: Ledger = load_node_ledger(node_chain, data_dir)
+    node_transaction_index: TransactionIndex = load_node_transaction_index(node_chain, data_dir)
+    node_mempool: Mempool = create_mempool()
+
+    # Snapshot may predate blocks mining some of its transactions
+    for mempool_transaction in map(create_transaction, load_snapshot(data_dir, MEMPOOL_FILE_NAME) or []):
+        if find_transaction_ref(node_transaction_index, mempool_transaction.id) is None:
+            add_mempool_transaction(node_mempool, mempool_transaction, node_ledger)
+
+    return {'port': node_port,
+            'peers': list(peers or []),
+            'mempool': node_mempool,
+            'chain': node_chain,
+            'ledger': node_ledger,
+            'transaction_index': node_transaction_index,
+            'data_dir': data_dir,
+            'metrics': create_metrics(),
+            }
+
+
+def load_node_ledger(node_chain: ChainStore, data_dir: Optional[str]) -> Ledger:
+    """ Loads ledger snapshot & applies blocks stored after it
+    :param node_chain: node chain
+    :param data_dir: node data directory
+    :return: ledger at chain tip
+    """
+    ledger_snapshot: Optional[dict[str, Any]] = load_snapshot(data_dir, LEDGER_FILE_NAME)
+    node_ledger: Ledger = create_ledger()
+
+    # Snapshot is only usable if its tip is still in chain
+    if ledger_snapshot is not None and 0 < ledger_snapshot['height'] <= get_chain_height(node_chain):
+        if read_chain_block(node_chain, ledger_snapshot['height'] - 1).hash == ledger_snapshot['tip_hash']:
+            node_ledger = import_ledger(ledger_snapshot)
+
+    for block in iterate_chain_blocks(node_chain, node_ledger['height']):
+        apply_block_to_ledger(node_ledger, block)
+
+    return node_ledger
+
+
+def load_node_transaction_index(node_chain: ChainStore, data_dir: Optional[str]) -> TransactionIndex:
+    """ Loads transaction index snapshot & indexes blocks stored after it
+    :param node_chain: node chain
+    :param data_dir: node data directory
+    :return: transaction index at chain tip
+    """
+    index_snapshot: Optional[dict[str, Any]] = load_snapshot(data_dir, TRANSACTION_INDEX_FILE_NAME)
+    node_transaction_index: TransactionIndex = create_transaction_index()
+
+    # Snapshot is only usable if its tip is still in chain
+    if index_snapshot is not None and 0 < index_snapshot['height'] <= get_chain_height(node_chain):
+        if read_chain_block(node_chain, index_snapshot['height'] - 1).hash == index_snapshot['tip_hash']:
+            node_transaction_index = import_transaction_index(index_snapshot)
+
+    for block in iterate_chain_blocks(node_chain, len(node_transaction_index['block_transactions'])):
+        index_block_transactions(node_transaction_index, block)
 
+    return node_transaction_index
 
-def broadcast_block(broadcast_node: int, new_block: Block) -> list[int]:
-    """ Broadcasts new mined block across entire network
-    :param broadcast_node: current node port
-    :param new_block: new mined block
-    :return: updated nodes
+
+def verify_node_chain(node: Node, validation_pool: ValidationPool) -> ChainValidation:
+    """ Validates node's whole chain, cutting it before the first invalid block & rebuilding ledger & index
+    :param node: node
+    :param validation_pool: validation pool
+    :return: chain validation
     """
-    updated_nodes: list[int] = []
+    def log_progress(valid_height: int, chain_height: int) -> None:
+        logger.info('Node:%s chain verified height=%s/%s', node['port'], valid_height, chain_height)
 
-    for node_port in NODE_PORTS:
-        if node_port != broadcast_node:
-            try:
-                response: Response = requests.post(f'http://127.0.0.1:{node_port}/add_block', json=new_block)
+    chain_validation: ChainValidation = validate_chain(node['chain'], validation_pool, log_progress)
 
-                if response.status_code == SUCCESS_REQUEST_STATUS:
-                    updated_nodes.append(node_port)
-            except RequestException as err:
-                print(f'broadcast_block error: node:{node_port} unavailable')
-                print(repr(err))
+    if chain_validation['invalid_height'] is not None:
+        logger.error('Node:%s chain invalid, truncating height=%s', node['port'], chain_validation['invalid_height'])
+        truncate_chain_store(node['chain'], chain_validation['valid_height'])
+        node['transaction_index'] = load_transaction_index(node['chain'])
 
-    return updated_nodes
+    node['ledger'] = chain_validation['ledger']
+    return chain_validation
 
 
 def update_node(node: Node, new_block: Block) -> None:
-    """ Updates node's chain & mempool
+    """ Updates node's chain, ledger, transaction index & mempool
     :param node: node
     :param new_block: new block
     :return: None
     """
-    # Add new block to chain
-    node['chain'].append(new_block)
-    # Remove block transactions from mempool
-    block_transactions_ids: list[str] = list(map(lambda t: t['id'], new_block['transactions']))[1:]
-    node['mempool'] = list(filter(lambda t: t['id'] not in block_transactions_ids, node['mempool']))
+    # Add new block to chain, ledger & transaction index
+    append_chain_block(node['chain'], new_block)
+    apply_block_to_ledger(node['ledger'], new_block)
+    index_block_transactions(node['transaction_index'], new_block)
+    # Remove block transactions from mempool (coinbase transaction is never there)
+    remove_mempool_transactions(node['mempool'], (t.id for t in new_block.transactions[1:]))
+    # Remove transactions block senders can no longer fund, e.g. double spends mined by another node, & expired ones
+    remove_mempool_conflicts(node['mempool'], node['ledger'],
+                             dict.fromkeys(t_input.sender for t in new_block.transactions[1:] for t_input in t.inputs))
+    expire_mempool_transactions(node['mempool'])
+
+
+def rollback_node(node: Node, chain_height: int) -> list[Block]:
+    """ Disconnects node's chain blocks above chain height
+    :param node: node
+    :param chain_height: number of blocks to keep
+    :return: disconnected blocks in chain order
+    """
+    disconnected_blocks: list[Block] = list(iterate_chain_blocks(node['chain'], chain_height))
+
+    for block in reversed(disconnected_blocks):
+        rollback_block_from_ledger(node['ledger'], block)
+        unindex_block_transactions(node['transaction_index'], block)
+
+    truncate_chain_store(node['chain'], chain_height)
+    return disconnected_blocks
+
+
+def add_node_transactions(node: Node,
+                          new_transactions: list[Optional[Transaction]],
+                          validation_results: list[bool]) -> list[TransactionResult]:
+    """ Adds validated batch transactions funded by senders' balances to node's mempool, replacing conflicting ones
+    :param node: node
+    :param new_transactions: new transactions, None for malformed batch items
+    :param validation_results: validation status per transaction
+    :return: result per transaction
+    """
+    transaction_results: list[TransactionResult] = []
+
+    for new_transaction, is_new_transaction_valid in zip(new_transactions, validation_results):
+        transaction_id: Optional[str] = new_transaction.id if new_transaction is not None else None
+
+        if not is_new_transaction_valid:
+            transaction_status, transaction_error = BAD_REQUEST_STATUS, 'Transaction data invalid'
+        elif find_transaction_ref(node['transaction_index'], new_transaction.id) is not None:
+            # Ids follow from signed contents, so a mined transaction sent again is a replay
+            transaction_status, transaction_error = CONFLICT_REQUEST_STATUS, 'Transaction already in chain'
+        elif not validate_transaction_spends(node['ledger'], new_transaction):
+            transaction_status, transaction_error = BAD_REQUEST_STATUS, 'Transaction spends exceed balance'
+        else:
+            transaction_status, transaction_error = {
+                MEMPOOL_ADDED: (SUCCESS_REQUEST_STATUS, None),
+                MEMPOOL_DUPLICATE: (CONFLICT_REQUEST_STATUS, 'Transaction already in mempool'),
+                MEMPOOL_CONFLICT: (CONFLICT_REQUEST_STATUS, 'Transaction conflicts, fee too low to replace'),
+            }.get(add_mempool_transaction(node['mempool'], new_transaction, node['ledger']),
+                  (BAD_REQUEST_STATUS, 'Transaction fee rate too low for full mempool'))
+
+        transaction_results.append({'id': transaction_id, 'status': transaction_status, 'error': transaction_error})
+
+    return transaction_results
+
+
+def add_node_peers(node: Node, peers: list[str]) -> list[str]:
+    """ Adds new peers to node's peer list
+    :param node: node
+    :param peers: peer urls
+    :return: added peer urls
+    """
+    added_peers: list[str] = []
+
+    for peer in peers:
+        peer = peer.rstrip('/')
+
+        if peer not in node['peers'] and peer not in added_peers:
+            added_peers.append(peer)
+
+    # Replace list instead of mutating it, broadcasts & syncs iterate it without the node lock
+    node['peers'] = node['peers'] + added_peers
+    return added_peers
+
+
+def export_node(node: Node) -> dict[str, Any]:
+    """ Exports node as json-serializable data
+    :param node: node
+    :return: node port, chain & mempool transactions
+    """
+    return {'port': node['port'],
+            'mempool': list_mempool_transactions(node['mempool']),
+            'chain': list(iterate_chain_blocks(node['chain'])),
+            }
+
+
+def collect_node_metrics(node: Node, node_lock: Lock) -> None:
+    """ Sets node's mempool & chain gauges, read on metrics export only
+    :param node: node
+    :param node_lock: lock guarding node's chain, mempool & ledger
+    :return: None
+    """
+    with node_lock:
+        mempool_entries: OrderedDict[str, MempoolEntry] = node['mempool']['entries']
+        # Entries are kept in arrival order
+        oldest_time: Optional[float] = next(iter(mempool_entries.values()))['time'] if mempool_entries else None
+        set_gauge(node['metrics'], 'galleon_mempool_transactions', {}, len(mempool_entries))
+        set_gauge(node['metrics'], 'galleon_mempool_bytes', {}, node['mempool']['bytes'])
+        set_gauge(node['metrics'], 'galleon_mempool_oldest_age_seconds', {},
+                  round(time() - oldest_time, 3) if oldest_time is not None else 0)
+        set_gauge(node['metrics'], 'galleon_chain_height', {}, get_chain_height(node['chain']))
+
+
+def run_node_snapshots(node: Node, node_lock: Lock) -> None:
+    """ Snapshots node's mempool, ledger & transaction index to data dir every snapshot interval
+    :param node: node
+    :param node_lock: lock guarding node's chain, mempool & ledger
+    :return: None
+    """
+    index_tip_hash: Optional[str] = None
+
+    while True:
+        sleep(MEMPOOL_SNAPSHOT_INTERVAL)
+
+        with node_lock:
+            mempool_transactions: list[Transaction] = list_mempool_transactions(node['mempool'])
+            ledger_snapshot: dict[str, Any] = export_ledger(node['ledger'])
+            # Index only changes with chain tip, it is exported again after new blocks
+            index_snapshot: Optional[dict[str, Any]] = \
+                export_transaction_index(node['transaction_index'], ledger_snapshot['tip_hash']) \
+                if ledger_snapshot['tip_hash'] != index_tip_hash else None
+
+        # Transactions are immutable, so they are exported outside node lock
+        save_snapshot(node['data_dir'], MEMPOOL_FILE_NAME, [export_transaction(t) for t in mempool_transactions])
+        save_snapshot(node['data_dir'], LEDGER_FILE_NAME, ledger_snapshot)
+
+        if index_snapshot is not None:
+            save_snapshot(node['data_dir'], TRANSACTION_INDEX_FILE_NAME, index_snapshot)
+            index_tip_hash = index_snapshot['tip_hash']
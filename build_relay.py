@@ -0,0 +1,206 @@
+import logging
+from typing import TypedDict, Optional, Callable
+from collections import OrderedDict
+from threading import Thread, Lock, Condition
+from time import monotonic, sleep
+from common import RELAY_INTERVAL, MAX_INVENTORY_ITEMS, MAX_RELAY_SEEN, RELAY_REQUEST_TIMEOUT, BINARY_MIMETYPE
+from build_blockchain import Block
+from build_transaction import Transaction, encode_transactions
+from build_broadcast import Inventory, PeerBroadcastResult, broadcast_executor, create_inventory, announce_to_peer, \
+    post_to_peer, broadcast_block, record_broadcast_results
+from build_mempool import MempoolEntry
+from build_node import Node
+from build_block_index import BlockIndex
+from build_storage import ChainStore, find_chain_block_index
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+# Build transaction & block relay
+class Relay(TypedDict):
+    node: Node
+    node_lock: Lock
+    block_index: BlockIndex
+    seen: OrderedDict[str, None]
+    requested: OrderedDict[str, float]
+    pending: list[str]
+    wakeup: Condition
+    clock: Callable[[], float]
+
+
+def create_relay(node: Node,
+                 node_lock: Lock,
+                 block_index: BlockIndex,
+                 clock: Callable[[], float] = monotonic) -> Relay:
+    """ Creates relay for node, announcing nothing until started
+    :param node: node
+    :param node_lock: lock guarding node's chain, mempool & ledger, also relay's seen & requested items
+    :param block_index: node's block index
+    :param clock: current time in seconds, e.g. simulator's virtual clock
+    :return: new relay
+    """
+    return {'node': node,
+            'node_lock': node_lock,
+            'block_index': block_index,
+            'seen': OrderedDict(),
+            'requested': OrderedDict(),
+            'pending': [],
+            'wakeup': Condition(),
+            'clock': clock,
+            }
+
+
+def start_relay(relay: Relay) -> None:
+    """ Starts relay's background announcement thread
+    :param relay: relay
+    :return: None
+    """
+    Thread(target=run_relay_loop, args=(relay,), name=f'relay:{relay["node"]["port"]}', daemon=True).start()
+
+
+def mark_inventory_seen(relay: Relay, inventory_ids: list[str]) -> None:
+    """ Remembers relayed items, forgetting the oldest ones past MAX_RELAY_SEEN
+    :param relay: relay
+    :param inventory_ids: relayed item ids
+    :return: None
+    """
+    for inventory_id in inventory_ids:
+        relay['seen'][inventory_id] = None
+        relay['seen'].move_to_end(inventory_id)
+
+    while len(relay['seen']) > MAX_RELAY_SEEN:
+        relay['seen'].popitem(last=False)
+
+
+def is_inventory_requested(requested: OrderedDict[str, float], inventory_id: str, current_time: float) -> bool:
+    """ Checks item was requested from another peer recently, expiring requests older than RELAY_REQUEST_TIMEOUT
+    :param requested: request times by item id, in request order
+    :param inventory_id: item id
+    :param current_time: current time of relay's clock
+    :return: item request status
+    """
+    expired_time: float = current_time - RELAY_REQUEST_TIMEOUT
+
+    # Requests are kept in request order, so expired ones are at the front
+    while requested and next(iter(requested.values())) < expired_time:
+        requested.popitem(last=False)
+
+    return inventory_id in requested
+
+
+def is_block_known(chain_store: ChainStore, block_index: BlockIndex, block_hash: str) -> bool:
+    """ Checks block is stored on main chain, side branch or as orphan
+    :param chain_store: chain store
+    :param block_index: block index
+    :param block_hash: block hash
+    :return: block status
+    """
+    return find_chain_block_index(chain_store, block_hash) is not None or \
+        block_hash in block_index['side_blocks'] or block_hash in block_index['orphans']
+
+
+def select_wanted_inventory(relay: Relay, inventory: Inventory) -> Inventory:
+    """ Selects announced items node is missing & has not requested from another peer yet
+    :param relay: relay
+    :param inventory: inventory announced by peer
+    :return: wanted inventory, requested from announcing peer
+    """
+    mempool_entries: OrderedDict[str, MempoolEntry] = relay['node']['mempool']['entries']
+    requested: OrderedDict[str, float] = relay['requested']
+    request_time: float = relay['clock']()
+    wanted_inventory: Inventory = create_inventory(
+        [t_id for t_id in dict.fromkeys(inventory['transactions'])
+         if t_id not in relay['seen'] and t_id not in mempool_entries and
+         not is_inventory_requested(requested, t_id, request_time)],
+        [b_hash for b_hash in dict.fromkeys(inventory['blocks'])
+         if not is_block_known(relay['node']['chain'], relay['block_index'], b_hash) and
+         not is_inventory_requested(requested, b_hash, request_time)])
+
+    for inventory_id in wanted_inventory['transactions'] + wanted_inventory['blocks']:
+        relay['requested'][inventory_id] = request_time
+
+    return wanted_inventory
+
+
+def relay_transactions(relay: Relay, transactions_ids: list[str]) -> None:
+    """ Queues ids of transactions added to mempool for the next announcement to peers
+    :param relay: relay
+    :param transactions_ids: new transaction ids
+    :return: None
+    """
+    mark_inventory_seen(relay, transactions_ids)
+
+    with relay['wakeup']:
+        relay['pending'].extend(transactions_ids)
+        relay['wakeup'].notify()
+
+
+def relay_block(relay: Relay, new_block: Block) -> None:
+    """ Announces block accepted from a peer to own peers in background
+    :param relay: relay
+    :param new_block: new block
+    :return: None
+    """
+    def run_block_broadcast() -> None:
+        record_broadcast_results(relay['node']['metrics'], 'block', broadcast_block(relay['node']['peers'], new_block))
+
+    Thread(target=run_block_broadcast, name=f'relay-block:{relay["node"]["port"]}', daemon=True).start()
+
+
+def push_transactions_to_peer(relay: Relay, peer: str, transactions_ids: list[str]) -> Optional[PeerBroadcastResult]:
+    """ Announces transaction ids to peer, then sends the transactions peer is missing in one batch
+    :param relay: relay
+    :param peer: peer url
+    :param transactions_ids: announced transaction ids
+    :return: peer broadcast result, None if peer is missing no transactions
+    """
+    wanted_inventory: Optional[Inventory] = announce_to_peer(peer, create_inventory(transactions_ids))
+
+    if not wanted_inventory or not wanted_inventory['transactions']:
+        return None
+
+    # Transactions mined or evicted since the announcement are skipped
+    with relay['node_lock']:
+        mempool_entries: OrderedDict[str, MempoolEntry] = relay['node']['mempool']['entries']
+        wanted_transactions: list[Transaction] = [mempool_entries[t_id]['transaction']
+                                                  for t_id in wanted_inventory['transactions']
+                                                  if t_id in mempool_entries]
+
+    if not wanted_transactions:
+        return None
+
+    return post_to_peer(peer, '/add_transactions', encode_transactions(wanted_transactions), BINARY_MIMETYPE)
+
+
+def announce_transactions(relay: Relay, transactions_ids: list[str]) -> list[Optional[PeerBroadcastResult]]:
+    """ Announces transaction ids to all peers concurrently
+    :param relay: relay
+    :param transactions_ids: announced transaction ids
+    :return: per-peer broadcast results
+    """
+    return list(broadcast_executor.map(lambda peer: push_transactions_to_peer(relay, peer, transactions_ids),
+                                       list(relay['node']['peers'])))
+
+
+def run_relay_loop(relay: Relay) -> None:
+    """ Announces queued transactions in batches, collecting ids over relay interval first
+    :param relay: relay
+    :return: None
+    """
+    while True:
+        with relay['wakeup']:
+            while not relay['pending']:
+                relay['wakeup'].wait()
+
+        # One announcement per interval instead of one per transaction
+        sleep(RELAY_INTERVAL)
+
+        with relay['wakeup']:
+            transactions_ids: list[str] = relay['pending'][:MAX_INVENTORY_ITEMS]
+            del relay['pending'][:MAX_INVENTORY_ITEMS]
+
+        try:
+            broadcast_results: list[Optional[PeerBroadcastResult]] = announce_transactions(relay, transactions_ids)
+            record_broadcast_results(relay['node']['metrics'], 'transactions', [r for r in broadcast_results if r])
+        except Exception as err:
+            logger.exception('run_relay_loop error: %r', err)
@@ -0,0 +1,246 @@
+import logging
+from typing import TypedDict, Optional
+from collections import OrderedDict, deque
+from itertools import islice
+from datetime import datetime
+from threading import Thread, Lock, Condition
+from time import monotonic, perf_counter
+from uuid import uuid4
+from common import TEMPLATE_REFRESH_INTERVAL, MAX_MINING_JOBS, MAX_QUEUED_MINING_JOBS
+from build_blockchain import InitialBlock, Block, compute_initial_block_target, compute_initial_block_difficulty, \
+    update_initial_block
+from build_node import Node, MineBlockResponse, update_node
+from build_assembler import create_block_template
+from build_storage import get_chain_tip
+from build_broadcast import PeerBroadcastResult, broadcast_block, record_broadcast_results
+from build_metrics import increment_counter, set_gauge, observe_histogram
+from build_miner import MiningPool, mine_initial_block_parallel
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+JOB_QUEUED: str = 'queued'
+JOB_MINING: str = 'mining'
+JOB_MINED: str = 'mined'
+JOB_FAILED: str = 'failed'
+
+
+# Build mining scheduler
+class MiningJob(TypedDict):
+    id: str
+    status: str
+    created: str
+    height: Optional[int]
+    templates: int
+    result: Optional[MineBlockResponse]
+    error: Optional[str]
+
+
+class TemplateCancelEvent:
+    """ Cancels mining of a block template once the chain tip changes,
+    or once the mempool changes & the template is older than refresh interval
+    """
+    __slots__ = ('created_at', 'is_cancelled', 'is_stale')
+
+    def __init__(self) -> None:
+        self.created_at: float = monotonic()
+        self.is_cancelled: bool = False
+        self.is_stale: bool = False
+
+    def is_set(self) -> bool:
+        if self.is_cancelled:
+            return True
+        return self.is_stale and monotonic() - self.created_at >= TEMPLATE_REFRESH_INTERVAL
+
+
+class MiningScheduler(TypedDict):
+    node: Node
+    node_lock: Lock
+    mining_pool: MiningPool
+    jobs: OrderedDict[str, MiningJob]
+    pending_jobs: deque[str]
+    continuous: bool
+    wakeup: Condition
+    template_cancel: TemplateCancelEvent
+
+
+def create_mining_scheduler(node: Node, node_lock: Lock, mining_pool: MiningPool, continuous: bool) -> MiningScheduler:
+    """ Creates a mining scheduler & starts its background mining thread
+    :param node: node
+    :param node_lock: lock guarding node's chain & mempool
+    :param mining_pool: mining pool
+    :param continuous: keep mining new blocks without jobs
+    :return: new mining scheduler
+    """
+    scheduler: MiningScheduler = {'node': node,
+                                  'node_lock': node_lock,
+                                  'mining_pool': mining_pool,
+                                  'jobs': OrderedDict(),
+                                  'pending_jobs': deque(),
+                                  'continuous': continuous,
+                                  'wakeup': Condition(),
+                                  'template_cancel': TemplateCancelEvent(),
+                                  }
+    Thread(target=run_mining_loop, args=(scheduler,), name=f'miner:{node["port"]}', daemon=True).start()
+    return scheduler
+
+
+def create_mining_job(scheduler: MiningScheduler) -> MiningJob:
+    """ Creates & registers a new mining job, dropping the oldest finished jobs past MAX_MINING_JOBS
+    :param scheduler: mining scheduler
+    :return: new mining job
+    """
+    mining_job: MiningJob = {'id': uuid4().hex,
+                             'status': JOB_QUEUED,
+                             'created': f'{datetime.now()}',
+                             'height': None,
+                             'templates': 0,
+                             'result': None,
+                             'error': None,
+                             }
+    scheduler['jobs'][mining_job['id']] = mining_job
+    # Queued & running jobs stay until finished, there are at most MAX_QUEUED_MINING_JOBS + 1 of them
+    finished_jobs_ids: list[str] = list(islice((job_id for job_id, job in scheduler['jobs'].items()
+                                                if job['status'] in (JOB_MINED, JOB_FAILED)),
+                                               max(len(scheduler['jobs']) - MAX_MINING_JOBS, 0)))
+
+    for job_id in finished_jobs_ids:
+        del scheduler['jobs'][job_id]
+
+    return mining_job
+
+
+def submit_mining_job(scheduler: MiningScheduler) -> Optional[MiningJob]:
+    """ Queues a new block mining job
+    :param scheduler: mining scheduler
+    :return: queued mining job or None if MAX_QUEUED_MINING_JOBS are already waiting
+    """
+    with scheduler['wakeup']:
+        if len(scheduler['pending_jobs']) >= MAX_QUEUED_MINING_JOBS:
+            return None
+
+        mining_job: MiningJob = create_mining_job(scheduler)
+        scheduler['pending_jobs'].append(mining_job['id'])
+        scheduler['wakeup'].notify()
+    return mining_job
+
+
+def get_mining_job(scheduler: MiningScheduler, job_id: str) -> Optional[MiningJob]:
+    """ Finds mining job by id
+    :param scheduler: mining scheduler
+    :param job_id: mining job id
+    :return: mining job or None if unknown
+    """
+    return scheduler['jobs'].get(job_id)
+
+
+def set_continuous_mining(scheduler: MiningScheduler, continuous: bool) -> None:
+    """ Enables or disables continuous background mining
+    :param scheduler: mining scheduler
+    :param continuous: keep mining new blocks without jobs
+    :return: None
+    """
+    with scheduler['wakeup']:
+        scheduler['continuous'] = continuous
+        scheduler['wakeup'].notify()
+
+
+def notify_mempool_change(scheduler: MiningScheduler) -> None:
+    """ Marks current block template stale, rebuilt once refresh interval passes
+    :param scheduler: mining scheduler
+    :return: None
+    """
+    scheduler['template_cancel'].is_stale = True
+
+
+def notify_chain_tip_change(scheduler: MiningScheduler) -> None:
+    """ Cancels current block template right away
+    :param scheduler: mining scheduler
+    :return: None
+    """
+    scheduler['template_cancel'].is_cancelled = True
+
+
+def next_mining_job(scheduler: MiningScheduler) -> MiningJob:
+    """ Waits for a queued job, or creates one in continuous mode
+    :param scheduler: mining scheduler
+    :return: mining job
+    """
+    with scheduler['wakeup']:
+        while not scheduler['pending_jobs'] and not scheduler['continuous']:
+            scheduler['wakeup'].wait()
+
+        if scheduler['pending_jobs']:
+            return scheduler['jobs'][scheduler['pending_jobs'].popleft()]
+
+        return create_mining_job(scheduler)
+
+
+def mine_job_block(scheduler: MiningScheduler, mining_job: MiningJob) -> MineBlockResponse:
+    """ Mines block templates until one extends the chain tip
+    :param scheduler: mining scheduler
+    :param mining_job: mining job
+    :return: mine_block response
+    """
+    node: Node = scheduler['node']
+    job_start_time: float = perf_counter()
+
+    while True:
+        # Build template from a consistent chain & mempool snapshot
+        with scheduler['node_lock']:
+            template_cancel = TemplateCancelEvent()
+            scheduler['template_cancel'] = template_cancel
+            initial_block: InitialBlock = create_block_template(node)
+
+        mining_job['height'] = initial_block.height
+        mining_job['templates'] += 1
+        increment_counter(node['metrics'], 'galleon_mining_templates_total', {})
+        initial_block_target: int = compute_initial_block_target(initial_block.bits)
+        mining_start_time: float = perf_counter()
+        mining_result = mine_initial_block_parallel(scheduler['mining_pool'],
+                                                    initial_block,
+                                                    initial_block_target,
+                                                    template_cancel)
+
+        if mining_result is None:
+            continue
+
+        new_block_hash, new_block_nonce = mining_result
+        mining_time: float = perf_counter() - mining_start_time
+        # Strided workers cover nonces below the golden one roughly evenly, so nonce approximates hashes computed
+        increment_counter(node['metrics'], 'galleon_mining_hashes_total', {}, new_block_nonce)
+        set_gauge(node['metrics'], 'galleon_mining_hashrate', {}, round(new_block_nonce / max(mining_time, 1e-9)))
+        new_block_difficulty: float = compute_initial_block_difficulty(initial_block_target)
+        new_block: Block = update_initial_block(initial_block, new_block_hash, new_block_nonce, new_block_difficulty)
+
+        with scheduler['node_lock']:
+            # A peer block may have landed between the last cancel check & now
+            if get_chain_tip(node['chain']).hash != initial_block.prev_hash:
+                continue
+            update_node(node, new_block)
+
+        observe_histogram(node['metrics'], 'galleon_mining_duration_seconds', {}, perf_counter() - job_start_time)
+        increment_counter(node['metrics'], 'galleon_mined_blocks_total', {})
+        logger.info('Node:%s mined block height=%s hash=%s transactions=%s',
+                    node['port'], new_block.height, new_block.hash, len(new_block.transactions))
+        # Broadcasts new block across network
+        updated_nodes: list[PeerBroadcastResult] = broadcast_block(node['peers'], new_block)
+        record_broadcast_results(node['metrics'], 'block', updated_nodes)
+        return {'new_block': new_block, 'updated_nodes': updated_nodes}
+
+
+def run_mining_loop(scheduler: MiningScheduler) -> None:
+    """ Runs mining jobs one after another in background
+    :param scheduler: mining scheduler
+    :return: None
+    """
+    while True:
+        mining_job: MiningJob = next_mining_job(scheduler)
+        mining_job['status'] = JOB_MINING
+
+        try:
+            mining_job['result'] = mine_job_block(scheduler, mining_job)
+            mining_job['status'] = JOB_MINED
+        except Exception as err:
+            logger.exception('run_mining_loop error: job=%s %r', mining_job['id'], err)
+            mining_job['error'] = repr(err)
+            mining_job['status'] = JOB_FAILED
@@ -0,0 +1,76 @@
+from typing import Final
+from hashlib import sha256
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+KEY_SIZE: Final = 32
+SIGNATURE_SIZE: Final = 64
+# Addresses are the first 20 bytes of public key's SHA-256
+ADDRESS_SIZE: Final = 20
+
+
+# Build signatures
+def load_private_key(private_key: str) -> Ed25519PrivateKey:
+    """ Loads Ed25519 private key from its seed
+    :param private_key: hexadecimal 32-byte private key
+    :return: private key
+    """
+    seed: bytes = bytes.fromhex(private_key)
+
+    if len(seed) != KEY_SIZE:
+        raise ValueError(f'invalid private key size: {len(seed)}')
+
+    return Ed25519PrivateKey.from_private_bytes(seed)
+
+
+def create_private_key(seed: str) -> str:
+    """ Derives private key from seed phrase, e.g. sample accounts' names
+    :param seed: seed phrase
+    :return: hexadecimal private key
+    """
+    return sha256(seed.encode()).hexdigest()
+
+
+def derive_public_key(private_key: str) -> str:
+    """ Derives public key from private key
+    :param private_key: hexadecimal private key
+    :return: hexadecimal public key
+    """
+    return load_private_key(private_key).public_key().public_bytes(Encoding.Raw, PublicFormat.Raw).hex()
+
+
+def create_address(public_key: str) -> str:
+    """ Derives address from public key, transaction senders must match the key signing their inputs
+    :param public_key: hexadecimal public key
+    :return: hexadecimal address
+    """
+    return sha256(bytes.fromhex(public_key)).digest()[:ADDRESS_SIZE].hex()
+
+
+def sign_message(private_key: str, message: bytes) -> str:
+    """ Signs message with Ed25519 (RFC 8032), same key & message always give the same signature
+    :param private_key: hexadecimal private key
+    :param message: message
+    :return: hexadecimal signature
+    """
+    return load_private_key(private_key).sign(message).hex()
+
+
+def verify_signature(public_key: str, message: bytes, signature: str) -> bool:
+    """ Verifies Ed25519 signature, rejecting non-canonical ones so a signed transaction has a single id
+    :param public_key: hexadecimal public key
+    :param message: signed message
+    :param signature: hexadecimal signature
+    :return: signature validation status
+    """
+    try:
+        encoded_signature: bytes = bytes.fromhex(signature)
+
+        if len(encoded_signature) != SIGNATURE_SIZE:
+            return False
+
+        Ed25519PublicKey.from_public_bytes(bytes.fromhex(public_key)).verify(encoded_signature, message)
+        return True
+    except (ValueError, InvalidSignature):
+        return False
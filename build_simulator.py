@@ -0,0 +1,653 @@
+import heapq
+import logging
+from math import ceil
+from random import Random
+from datetime import datetime, timedelta
+from dataclasses import replace
+from statistics import median
+from threading import Lock
+from collections import Counter, OrderedDict
+from typing import TypedDict, Optional, Callable, Any
+from common import RELAY_INTERVAL, MAX_INVENTORY_ITEMS, SUCCESS_REQUEST_STATUS
+from build_blockchain import InitialBlock, Block, encode_block, compute_initial_block_target, \
+    compute_initial_block_difficulty, update_initial_block
+from build_transaction import Transaction, validate_transactions, verify_transaction_signatures, \
+    compute_transaction_size
+from build_broadcast import Inventory, create_inventory
+from build_relay import Relay, create_relay, select_wanted_inventory, relay_transactions, is_block_known
+from build_mempool import MempoolEntry
+from build_node import Node, create_node, add_node_transactions
+from build_block_index import BLOCK_EXTENDED, BLOCK_REORGANIZED, BLOCK_SIDE, BLOCK_ORPHAN, BlockIndex, \
+    create_block_index, process_new_block
+from build_assembler import create_block_template
+from build_miner import mine_initial_block
+from build_storage import get_chain_tip, read_chain_block, find_chain_block_index, iterate_chain_blocks, \
+    close_chain_store
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Virtual clock starts at a fixed date, so block timestamps, hashes & nonces repeat between runs with the same seed
+SIMULATION_EPOCH: datetime = datetime(2024, 1, 1)
+# Simulated nodes are named after ports like real ones, e.g. Miner:7001
+SIMULATION_BASE_PORT: int = 7001
+# Announced transaction id or block hash
+INVENTORY_ITEM_SIZE: int = 32
+EVENT_MESSAGE: str = 'message'
+EVENT_TRANSACTION: str = 'transaction'
+EVENT_MINING: str = 'mining'
+EVENT_RELAY: str = 'relay'
+EVENT_PARTITION: str = 'partition'
+MESSAGE_INVENTORY: str = 'inventory'
+MESSAGE_GET_DATA: str = 'get_data'
+MESSAGE_TRANSACTIONS: str = 'transactions'
+MESSAGE_BLOCK: str = 'block'
+# Share of nodes a block or transaction has reached when its propagation delay is reported
+PROPAGATION_FRACTIONS: tuple[float, ...] = (0.5, 0.9, 1.0)
+
+
+# Build network simulator
+class LinkConditions(TypedDict):
+    latency: float
+    jitter: float
+    loss: float
+    bandwidth: Optional[float]
+
+
+class Partition(TypedDict):
+    start: float
+    end: float
+    groups: int
+
+
+class SimulationConfig(TypedDict):
+    nodes: int
+    peers: int
+    seed: int
+    duration: float
+    block_interval: float
+    transaction_rate: float
+    conditions: LinkConditions
+    partitions: list[Partition]
+
+
+class SimulationMessage(TypedDict):
+    kind: str
+    source: int
+    target: int
+    size: int
+    inventory: Inventory
+    transactions: list[Transaction]
+    block: Optional[Block]
+
+
+class NetworkModel(TypedDict):
+    conditions: LinkConditions
+    groups: dict[int, int]
+    random: Random
+
+
+class SimulatedNode(TypedDict):
+    node: Node
+    block_index: BlockIndex
+    peers: list[int]
+    relay: Relay
+    is_relay_scheduled: bool
+
+
+class SimulationStats(TypedDict):
+    messages: int
+    dropped: int
+    bytes: int
+    submitted: int
+    accepted: int
+    reorganizations: int
+    orphans: int
+    mined_blocks: dict[str, float]
+    block_arrivals: dict[str, list[float]]
+    transaction_arrivals: dict[str, list[float]]
+
+
+# Delivery delay of message in virtual seconds, None drops it
+Transport = Callable[[SimulationMessage], Optional[float]]
+
+
+class Simulation(TypedDict):
+    config: SimulationConfig
+    nodes: list[SimulatedNode]
+    network: NetworkModel
+    transport: Transport
+    random: Random
+    events: list[tuple[float, int, str, Any]]
+    sequence: int
+    clock: float
+    stats: SimulationStats
+
+
+def create_link_conditions(latency: float = 0.05,
+                           jitter: float = 0.0,
+                           loss: float = 0.0,
+                           bandwidth: Optional[float] = None) -> LinkConditions:
+    """ Creates conditions shared by all simulated links
+    :param latency: one-way delay in seconds
+    :param jitter: max extra delay in seconds, drawn uniformly per message
+    :param loss: probability of a message being dropped
+    :param bandwidth: link throughput in bytes per second (None for unlimited)
+    :return: new link conditions
+    """
+    return {'latency': latency, 'jitter': jitter, 'loss': loss, 'bandwidth': bandwidth}
+
+
+def create_simulation_config(nodes_count: int,
+                             peers_count: int,
+                             duration: float,
+                             block_interval: float,
+                             transaction_rate: float,
+                             conditions: LinkConditions,
+                             partitions: Optional[list[Partition]] = None,
+                             seed: int = 0) -> SimulationConfig:
+    """ Creates simulation config
+    :param nodes_count: number of simulated nodes
+    :param peers_count: outbound peers picked per node, links carry messages both ways
+    :param duration: virtual seconds of mining & workload, in-flight messages are delivered after it
+    :param block_interval: mean virtual seconds between blocks found by the whole network
+    :param transaction_rate: workload transactions submitted per virtual second
+    :param conditions: link conditions
+    :param partitions: network splits by virtual time
+    :param seed: random seed, same seed & config replay the same run
+    :return: new simulation config
+    """
+    return {'nodes': nodes_count,
+            'peers': peers_count,
+            'seed': seed,
+            'duration': duration,
+            'block_interval': block_interval,
+            'transaction_rate': transaction_rate,
+            'conditions': conditions,
+            'partitions': list(partitions or []),
+            }
+
+
+def route_message(network: NetworkModel, message: SimulationMessage) -> Optional[float]:
+    """ Delivers message over simulated link: dropped across partition groups or by loss, delayed otherwise
+    :param network: network model
+    :param message: message
+    :return: delivery delay in virtual seconds, None if message is dropped
+    """
+    conditions: LinkConditions = network['conditions']
+
+    if network['groups'].get(message['source'], 0) != network['groups'].get(message['target'], 0):
+        return None
+
+    if conditions['loss'] and network['random'].random() < conditions['loss']:
+        return None
+
+    transfer_time: float = message['size'] / conditions['bandwidth'] if conditions['bandwidth'] else 0.0
+    return conditions['latency'] + network['random'].uniform(0, conditions['jitter']) + transfer_time
+
+
+def select_simulation_peers(nodes_count: int, peers_count: int, random: Random) -> list[list[int]]:
+    """ Connects every node to random outbound peers, links are used both ways
+    :param nodes_count: number of nodes
+    :param peers_count: outbound peers per node
+    :param random: random generator
+    :return: peer positions per node
+    """
+    peers: list[dict[int, None]] = [{} for _ in range(nodes_count)]
+
+    for node_position in range(nodes_count):
+        other_positions: list[int] = [p for p in range(nodes_count) if p != node_position]
+
+        for peer_position in random.sample(other_positions, min(peers_count, len(other_positions))):
+            peers[node_position][peer_position] = None
+            peers[peer_position][node_position] = None
+
+    return [list(node_peers) for node_peers in peers]
+
+
+def create_simulated_node(node_port: int, peers: list[int], clock: Callable[[], float]) -> SimulatedNode:
+    """ Creates node with the relay state live nodes keep, announcements are scheduled by the simulation instead
+    :param node_port: node port, names node & miner addresses
+    :param peers: peer positions
+    :param clock: simulation's virtual clock
+    :return: new simulated node
+    """
+    node: Node = create_node(node_port)
+    block_index: BlockIndex = create_block_index()
+    return {'node': node,
+            'block_index': block_index,
+            'peers': peers,
+            'relay': create_relay(node, Lock(), block_index, clock),
+            'is_relay_scheduled': False,
+            }
+
+
+def create_simulation(config: SimulationConfig, transport: Optional[Transport] = None) -> Simulation:
+    """ Creates in-process network of nodes driven by a virtual clock
+    :param config: simulation config
+    :param transport: message delivery, default routes messages by config's link conditions & partitions
+    :return: new simulation
+    """
+    random: Random = Random(config['seed'])
+    network: NetworkModel = {'conditions': config['conditions'], 'groups': {}, 'random': Random(config['seed'] + 1)}
+    nodes_peers: list[list[int]] = select_simulation_peers(config['nodes'], config['peers'], random)
+    simulation: Simulation = {
+        'config': config,
+        # Relays read simulation clock once it is running
+        'nodes': [create_simulated_node(SIMULATION_BASE_PORT + position, node_peers, lambda: simulation['clock'])
+                  for position, node_peers in enumerate(nodes_peers)],
+        'network': network,
+        'transport': transport or (lambda message: route_message(network, message)),
+        'random': random,
+        'events': [],
+        'sequence': 0,
+        'clock': 0.0,
+        'stats': {'messages': 0,
+                  'dropped': 0,
+                  'bytes': 0,
+                  'submitted': 0,
+                  'accepted': 0,
+                  'reorganizations': 0,
+                  'orphans': 0,
+                  'mined_blocks': {},
+                  'block_arrivals': {},
+                  'transaction_arrivals': {},
+                  },
+    }
+
+    for partition in config['partitions']:
+        schedule_event(simulation, partition['start'], EVENT_PARTITION, partition['groups'])
+        schedule_event(simulation, partition['end'], EVENT_PARTITION, 1)
+
+    schedule_next_block(simulation)
+    return simulation
+
+
+def schedule_event(simulation: Simulation, delay: float, kind: str, payload: Any) -> None:
+    """ Queues event on virtual clock, events due at the same time run in scheduling order
+    :param simulation: simulation
+    :param delay: virtual seconds from now
+    :param kind: event kind
+    :param payload: event payload
+    :return: None
+    """
+    simulation['sequence'] += 1
+    heapq.heappush(simulation['events'], (simulation['clock'] + delay, simulation['sequence'], kind, payload))
+
+
+def schedule_workload(simulation: Simulation, transactions: list[Transaction]) -> int:
+    """ Submits workload transactions at config's rate to random nodes, as many as fit in simulation duration
+    :param simulation: simulation
+    :param transactions: workload transactions in submission order
+    :return: number of scheduled transactions
+    """
+    transaction_interval: float = 1 / simulation['config']['transaction_rate']
+    scheduled_count: int = min(len(transactions), ceil(simulation['config']['duration'] / transaction_interval))
+
+    for transaction_position, transaction in enumerate(transactions[:scheduled_count]):
+        node_position: int = simulation['random'].randrange(len(simulation['nodes']))
+        schedule_event(simulation, transaction_position * transaction_interval, EVENT_TRANSACTION,
+                       (node_position, transaction))
+
+    return scheduled_count
+
+
+def schedule_next_block(simulation: Simulation) -> None:
+    """ Draws next block finder & time, blocks are found network-wide at exponential intervals
+    :param simulation: simulation
+    :return: None
+    """
+    block_delay: float = simulation['random'].expovariate(1 / simulation['config']['block_interval'])
+
+    if simulation['clock'] + block_delay < simulation['config']['duration']:
+        schedule_event(simulation, block_delay, EVENT_MINING, simulation['random'].randrange(len(simulation['nodes'])))
+
+
+def format_virtual_time(simulation: Simulation) -> str:
+    """ Formats virtual clock as block timestamp, so retargeting follows simulated block intervals
+    :param simulation: simulation
+    :return: block timestamp
+    """
+    return f'{SIMULATION_EPOCH + timedelta(seconds=simulation["clock"])}'
+
+
+def send_message(simulation: Simulation,
+                 kind: str,
+                 source: int,
+                 target: int,
+                 inventory: Optional[Inventory] = None,
+                 transactions: Optional[list[Transaction]] = None,
+                 block: Optional[Block] = None,
+                 block_size: int = 0) -> None:
+    """ Sends message through transport, counting its size as on the wire
+    :param simulation: simulation
+    :param kind: message kind
+    :param source: sending node position
+    :param target: receiving node position
+    :param inventory: announced or requested ids
+    :param transactions: sent transactions
+    :param block: sent block
+    :param block_size: binary size of sent block
+    :return: None
+    """
+    inventory = inventory or create_inventory([], [])
+    transactions = transactions or []
+    message: SimulationMessage = {
+        'kind': kind,
+        'source': source,
+        'target': target,
+        'size': INVENTORY_ITEM_SIZE * (len(inventory['transactions']) + len(inventory['blocks'])) +
+        sum(compute_transaction_size(t) for t in transactions) + block_size,
+        'inventory': inventory,
+        'transactions': transactions,
+        'block': block,
+    }
+    simulation['stats']['messages'] += 1
+    simulation['stats']['bytes'] += message['size']
+    delivery_delay: Optional[float] = simulation['transport'](message)
+
+    if delivery_delay is None:
+        simulation['stats']['dropped'] += 1
+        return
+
+    schedule_event(simulation, delivery_delay, EVENT_MESSAGE, message)
+
+
+def find_known_block(simulated_node: SimulatedNode, block_hash: str) -> Optional[Block]:
+    """ Finds block on main chain, side branch or among orphans
+    :param simulated_node: simulated node
+    :param block_hash: block hash
+    :return: block or None if unknown
+    """
+    block_index: Optional[int] = find_chain_block_index(simulated_node['node']['chain'], block_hash)
+
+    if block_index is not None:
+        return read_chain_block(simulated_node['node']['chain'], block_index)
+    elif block_hash in simulated_node['block_index']['side_blocks']:
+        return simulated_node['block_index']['side_blocks'][block_hash]['block']
+
+    return simulated_node['block_index']['orphans'].get(block_hash)
+
+
+def schedule_relay(simulation: Simulation, node_position: int) -> None:
+    """ Schedules node's next announcement of relay's pending transactions, one announcement per relay interval
+    :param simulation: simulation
+    :param node_position: node position
+    :return: None
+    """
+    simulated_node: SimulatedNode = simulation['nodes'][node_position]
+
+    if simulated_node['relay']['pending'] and not simulated_node['is_relay_scheduled']:
+        simulated_node['is_relay_scheduled'] = True
+        schedule_event(simulation, RELAY_INTERVAL, EVENT_RELAY, node_position)
+
+
+def handle_relay(simulation: Simulation, node_position: int) -> None:
+    """ Announces a batch of queued transaction ids to every peer
+    :param simulation: simulation
+    :param node_position: node position
+    :return: None
+    """
+    simulated_node: SimulatedNode = simulation['nodes'][node_position]
+    transactions_ids: list[str] = simulated_node['relay']['pending'][:MAX_INVENTORY_ITEMS]
+    del simulated_node['relay']['pending'][:MAX_INVENTORY_ITEMS]
+    simulated_node['is_relay_scheduled'] = False
+
+    for peer_position in simulated_node['peers']:
+        send_message(simulation, MESSAGE_INVENTORY, node_position, peer_position,
+                     inventory=create_inventory(transactions_ids, []))
+
+    schedule_relay(simulation, node_position)
+
+
+def receive_transactions(simulation: Simulation, node_position: int, transactions: list[Transaction]) -> list[str]:
+    """ Adds valid, signed & funded transactions to node's mempool, then queues them for relay as /add_transactions does
+    :param simulation: simulation
+    :param node_position: node position
+    :param transactions: received transactions
+    :return: added transaction ids
+    """
+    simulated_node: SimulatedNode = simulation['nodes'][node_position]
+    # Signature cache is shared by all simulated nodes, so every transaction is verified once per run
+    validation_results: list[bool] = [is_valid and verify_transaction_signatures(t)
+                                      for t, is_valid in zip(transactions, validate_transactions(transactions))]
+    added_ids: list[str] = [r['id'] for r in add_node_transactions(simulated_node['node'], transactions,
+                                                                   validation_results)
+                            if r['status'] == SUCCESS_REQUEST_STATUS]
+
+    for transaction_id in added_ids:
+        simulation['stats']['transaction_arrivals'].setdefault(transaction_id, []).append(simulation['clock'])
+
+    relay_transactions(simulated_node['relay'], added_ids)
+    schedule_relay(simulation, node_position)
+    return added_ids
+
+
+def receive_block(simulation: Simulation, node_position: int, source: Optional[int], new_block: Block) -> str:
+    """ Stores block on main chain, side branch or as orphan, announcing stored blocks & fetching missing parents
+    :param simulation: simulation
+    :param node_position: node position
+    :param source: sending node position, None for node's own block
+    :param new_block: new block
+    :return: block status
+    """
+    simulated_node: SimulatedNode = simulation['nodes'][node_position]
+    waiting_orphans: list[str] = list(simulated_node['block_index']['orphans'])
+    block_status: str = process_new_block(simulated_node['node'], simulated_node['block_index'], new_block)
+
+    if block_status == BLOCK_ORPHAN:
+        simulation['stats']['orphans'] += 1
+
+        if source is not None:
+            send_message(simulation, MESSAGE_GET_DATA, node_position, source,
+                         inventory=create_inventory([], [new_block.prev_hash]))
+
+    if block_status not in (BLOCK_EXTENDED, BLOCK_REORGANIZED, BLOCK_SIDE):
+        return block_status
+
+    simulation['stats']['reorganizations'] += block_status == BLOCK_REORGANIZED
+    # Orphans waiting for new block are stored along with it
+    stored_hashes: list[str] = [new_block.hash] + [
+        b_hash for b_hash in waiting_orphans
+        if b_hash not in simulated_node['block_index']['orphans'] and
+        is_block_known(simulated_node['node']['chain'], simulated_node['block_index'], b_hash)]
+
+    for block_hash in stored_hashes:
+        simulation['stats']['block_arrivals'].setdefault(block_hash, []).append(simulation['clock'])
+
+    for peer_position in simulated_node['peers']:
+        send_message(simulation, MESSAGE_INVENTORY, node_position, peer_position,
+                     inventory=create_inventory([], stored_hashes))
+
+    return block_status
+
+
+def handle_message(simulation: Simulation, message: SimulationMessage) -> None:
+    """ Handles message delivered to its target node, the way node routes handle peer requests
+    :param simulation: simulation
+    :param message: message
+    :return: None
+    """
+    simulated_node: SimulatedNode = simulation['nodes'][message['target']]
+    mempool_entries: OrderedDict[str, MempoolEntry] = simulated_node['node']['mempool']['entries']
+
+    if message['kind'] == MESSAGE_INVENTORY:
+        # Request announced items node is missing & has not requested from another peer yet, as /inventory does
+        wanted_inventory: Inventory = select_wanted_inventory(simulated_node['relay'], message['inventory'])
+
+        if wanted_inventory['transactions'] or wanted_inventory['blocks']:
+            send_message(simulation, MESSAGE_GET_DATA, message['target'], message['source'], inventory=wanted_inventory)
+    elif message['kind'] == MESSAGE_GET_DATA:
+        # Send requested items still held, transactions in one batch & blocks one by one
+        wanted_transactions: list[Transaction] = [mempool_entries[t_id]['transaction']
+                                                  for t_id in message['inventory']['transactions']
+                                                  if t_id in mempool_entries]
+
+        if wanted_transactions:
+            send_message(simulation, MESSAGE_TRANSACTIONS, message['target'], message['source'],
+                         transactions=wanted_transactions)
+
+        for block_hash in message['inventory']['blocks']:
+            wanted_block: Optional[Block] = find_known_block(simulated_node, block_hash)
+
+            if wanted_block is not None:
+                send_message(simulation, MESSAGE_BLOCK, message['target'], message['source'], block=wanted_block,
+                             block_size=len(encode_block(wanted_block)))
+    elif message['kind'] == MESSAGE_TRANSACTIONS:
+        receive_transactions(simulation, message['target'], message['transactions'])
+    elif message['kind'] == MESSAGE_BLOCK:
+        receive_block(simulation, message['target'], message['source'], message['block'])
+
+
+def handle_transaction(simulation: Simulation, payload: tuple[int, Transaction]) -> None:
+    """ Submits workload transaction to node, as a client posting to /add_transaction
+    :param simulation: simulation
+    :param payload: node position & transaction
+    :return: None
+    """
+    node_position, transaction = payload
+    simulation['stats']['submitted'] += 1
+    simulation['stats']['accepted'] += len(receive_transactions(simulation, node_position, [transaction]))
+
+
+def handle_mining(simulation: Simulation, node_position: int) -> None:
+    """ Mines a block on top of node's chain tip with real proof of work & virtual timestamp
+    :param simulation: simulation
+    :param node_position: block finder position
+    :return: None
+    """
+    initial_block: InitialBlock = replace(create_block_template(simulation['nodes'][node_position]['node']),
+                                          timestamp=format_virtual_time(simulation))
+    initial_block_target: int = compute_initial_block_target(initial_block.bits)
+    new_block_hash, new_block_nonce = mine_initial_block(initial_block, initial_block_target)
+    new_block: Block = update_initial_block(initial_block, new_block_hash, new_block_nonce,
+                                            compute_initial_block_difficulty(initial_block_target))
+    simulation['stats']['mined_blocks'][new_block.hash] = simulation['clock']
+    logger.info('Simulation t=%.3f node=%s mined height=%s hash=%s transactions=%s', simulation['clock'],
+                node_position, new_block.height, new_block.hash, len(new_block.transactions))
+    receive_block(simulation, node_position, None, new_block)
+    schedule_next_block(simulation)
+
+
+def handle_partition(simulation: Simulation, groups_count: int) -> None:
+    """ Splits nodes into groups of consecutive positions unable to reach each other, one group heals the network
+    :param simulation: simulation
+    :param groups_count: number of groups
+    :return: None
+    """
+    nodes_count: int = len(simulation['nodes'])
+    simulation['network']['groups'] = {position: position * groups_count // nodes_count
+                                       for position in range(nodes_count)} if groups_count > 1 else {}
+    logger.info('Simulation t=%.3f partition groups=%s', simulation['clock'], groups_count)
+
+
+EVENT_HANDLERS: dict[str, Callable[[Simulation, Any], None]] = {
+    EVENT_MESSAGE: handle_message,
+    EVENT_TRANSACTION: handle_transaction,
+    EVENT_MINING: handle_mining,
+    EVENT_RELAY: handle_relay,
+    EVENT_PARTITION: handle_partition,
+}
+
+
+def run_simulation(simulation: Simulation) -> None:
+    """ Runs events in virtual time order until mining & workload stop & every message is delivered
+    :param simulation: simulation
+    :return: None
+    """
+    while simulation['events']:
+        event_time, _, kind, payload = heapq.heappop(simulation['events'])
+        simulation['clock'] = event_time
+        EVENT_HANDLERS[kind](simulation, payload)
+
+
+def close_simulation(simulation: Simulation) -> None:
+    """ Closes simulated nodes' chain storage
+    :param simulation: simulation
+    :return: None
+    """
+    for simulated_node in simulation['nodes']:
+        close_chain_store(simulated_node['node']['chain'])
+
+
+def compute_percentile(values: list[float], fraction: float) -> Optional[float]:
+    """ Picks nearest-rank percentile
+    :param values: values
+    :param fraction: percentile as a fraction, e.g. 0.9
+    :return: percentile or None without values
+    """
+    if not values:
+        return None
+
+    return sorted(values)[max(ceil(fraction * len(values)) - 1, 0)]
+
+
+def compute_propagation_delays(arrivals: dict[str, list[float]],
+                               start_times: dict[str, float],
+                               nodes_count: int,
+                               fraction: float) -> list[float]:
+    """ Computes delays until items reached a share of nodes, items that never did are left out
+    :param arrivals: arrival times per item
+    :param start_times: creation time per item
+    :param nodes_count: number of nodes
+    :param fraction: share of nodes
+    :return: delay per item that reached the share of nodes
+    """
+    reached_count: int = max(ceil(fraction * nodes_count), 1)
+    return [sorted(arrivals[item_id])[reached_count - 1] - start_times[item_id]
+            for item_id in start_times if len(arrivals.get(item_id, [])) >= reached_count]
+
+
+def summarize_simulation(simulation: Simulation) -> dict[str, Any]:
+    """ Summarizes throughput, propagation delays & fork rate of a finished simulation
+    :param simulation: finished simulation
+    :return: simulation summary
+    """
+    stats: SimulationStats = simulation['stats']
+    nodes_count: int = len(simulation['nodes'])
+    duration: float = simulation['config']['duration']
+    # Main chain is the tip most nodes ended on, first node holding it reads it
+    tips: Counter[str] = Counter(get_chain_tip(n['node']['chain']).hash for n in simulation['nodes'])
+    main_tip_hash: str = tips.most_common(1)[0][0]
+    main_node: Node = next(n['node'] for n in simulation['nodes']
+                           if get_chain_tip(n['node']['chain']).hash == main_tip_hash)
+    main_hashes: set[str] = set()
+    confirmed_count: int = 0
+
+    for block in iterate_chain_blocks(main_node['chain'], 1):
+        main_hashes.add(block.hash)
+        confirmed_count += len(block.transactions) - 1
+
+    stale_count: int = sum(b_hash not in main_hashes for b_hash in stats['mined_blocks'])
+    transaction_starts: dict[str, float] = {t_id: arrivals[0] for t_id, arrivals in
+                                            stats['transaction_arrivals'].items()}
+    summary: dict[str, Any] = {
+        'nodes': nodes_count,
+        'duration': duration,
+        'end_time': round(simulation['clock'], 6),
+        'submitted_transactions': stats['submitted'],
+        'accepted_transactions': stats['accepted'],
+        'confirmed_transactions': confirmed_count,
+        'throughput': round(confirmed_count / duration, 3),
+        'mined_blocks': len(stats['mined_blocks']),
+        'main_chain_height': get_chain_tip(main_node['chain']).height,
+        'stale_blocks': stale_count,
+        'fork_rate': round(stale_count / len(stats['mined_blocks']), 4) if stats['mined_blocks'] else 0.0,
+        'reorganizations': stats['reorganizations'],
+        'orphans': stats['orphans'],
+        'nodes_on_main_tip': tips[main_tip_hash],
+        'distinct_tips': len(tips),
+        'messages': stats['messages'],
+        'dropped_messages': stats['dropped'],
+        'bytes': stats['bytes'],
+    }
+
+    for item_name, arrivals, start_times in (('block', stats['block_arrivals'], stats['mined_blocks']),
+                                             ('transaction', stats['transaction_arrivals'], transaction_starts)):
+        for fraction in PROPAGATION_FRACTIONS:
+            delays: list[float] = compute_propagation_delays(arrivals, start_times, nodes_count, fraction)
+            delay_name: str = f'{item_name}_propagation_{round(fraction * 100)}'
+            summary[f'{delay_name}_median'] = round(median(delays), 6) if delays else None
+            summary[f'{delay_name}_p90'] = round(compute_percentile(delays, 0.9), 6) if delays else None
+            summary[f'{delay_name}_reached'] = len(delays)
+
+    return summary
@@ -0,0 +1,396 @@
+import os
+import json
+import struct
+import tempfile
+from typing import TypedDict, Optional, BinaryIO, Iterator, Any
+from array import array
+from collections import OrderedDict
+from threading import Lock
+from common import BLOCK_CACHE_SIZE
+from build_blockchain import INITIAL_BLOCK_HASH, Block, validate_block, encode_block_hash, encode_block, decode_block
+
+BLOCKS_FILE_NAME: str = 'blocks.dat'
+INDEX_FILE_NAME: str = 'blocks.idx'
+HASHES_FILE_NAME: str = 'hashes.idx'
+MEMPOOL_FILE_NAME: str = 'mempool.json'
+LEDGER_FILE_NAME: str = 'ledger.json'
+TRANSACTION_INDEX_FILE_NAME: str = 'transaction_index.json'
+# Block record: 4-byte big-endian payload length, then binary block
+RECORD_HEADER = struct.Struct('>I')
+# Index entry: 8-byte record offset per block height
+INDEX_ENTRY_SIZE: int = 8
+# Hash entry: 32-byte block hash per block height
+HASH_ENTRY_SIZE: int = 32
+
+
+# Build chain storage
+class ChainStore(TypedDict):
+    block_file: BinaryIO
+    index_file: BinaryIO
+    hashes_file: BinaryIO
+    offsets: array
+    hash_index: dict[bytes, int]
+    cache: OrderedDict[int, Block]
+    lock: Lock
+
+
+def open_chain_file(data_dir: Optional[str], file_name: str) -> BinaryIO:
+    """ Opens storage file for reading & appending, or an anonymous temporary file without data dir
+    :param data_dir: node data directory
+    :param file_name: storage file name
+    :return: binary file
+    """
+    if data_dir is None:
+        return tempfile.TemporaryFile()
+
+    file_path: str = os.path.join(data_dir, file_name)
+    return open(file_path, 'r+b' if os.path.exists(file_path) else 'w+b')
+
+
+def open_chain_store(data_dir: Optional[str]) -> ChainStore:
+    """ Opens append-only chain storage, recovering from interrupted writes & verifying the tip
+    :param data_dir: node data directory (None keeps chain in temporary files)
+    :return: chain store
+    """
+    if data_dir is not None:
+        os.makedirs(data_dir, exist_ok=True)
+
+    chain_store: ChainStore = {'block_file': open_chain_file(data_dir, BLOCKS_FILE_NAME),
+                               'index_file': open_chain_file(data_dir, INDEX_FILE_NAME),
+                               'hashes_file': open_chain_file(data_dir, HASHES_FILE_NAME),
+                               'offsets': array('Q'),
+                               'hash_index': {},
+                               'cache': OrderedDict(),
+                               'lock': Lock(),
+                               }
+    load_chain_index(chain_store)
+
+    # Drop tip blocks failing verification, e.g. corrupted by a crash
+    while chain_store['offsets'] and not verify_chain_tip(chain_store):
+        truncate_chain_store(chain_store, len(chain_store['offsets']) - 1)
+
+    load_hash_index(chain_store)
+
+    return chain_store
+
+
+def load_chain_index(chain_store: ChainStore) -> None:
+    """ Loads block offsets, re-indexing complete records written after the last index entry
+    :param chain_store: chain store
+    :return: None
+    """
+    block_file_size: int = os.fstat(chain_store['block_file'].fileno()).st_size
+    index_file_size: int = os.fstat(chain_store['index_file'].fileno()).st_size
+    chain_store['index_file'].seek(0)
+    offsets: array = array('Q')
+    offsets.frombytes(chain_store['index_file'].read(index_file_size - index_file_size % INDEX_ENTRY_SIZE))
+    indexed_count: int = len(offsets)
+
+    # Forget index entries pointing past the block file
+    while offsets and offsets[-1] + RECORD_HEADER.size > block_file_size:
+        offsets.pop()
+
+    # Re-scan from last indexed record reading record headers only, no block is parsed or hashed
+    next_offset: int = offsets.pop() if offsets else 0
+
+    while next_offset + RECORD_HEADER.size <= block_file_size:
+        record_end: int = next_offset + RECORD_HEADER.size + read_record_length(chain_store, next_offset)
+
+        if record_end > block_file_size:
+            break
+
+        offsets.append(next_offset)
+        next_offset = record_end
+
+    chain_store['offsets'] = offsets
+
+    # Only files left by an interrupted write need rewriting
+    if len(offsets) != indexed_count or next_offset != block_file_size or index_file_size % INDEX_ENTRY_SIZE:
+        rewrite_chain_files(chain_store, next_offset)
+
+    chain_store['block_file'].seek(0, os.SEEK_END)
+
+
+def load_hash_index(chain_store: ChainStore) -> None:
+    """ Loads block hash to chain position index, hashing keys of blocks indexed after the last hash entry
+    :param chain_store: chain store
+    :return: None
+    """
+    chain_height: int = get_chain_height(chain_store)
+    hashes_file_size: int = os.fstat(chain_store['hashes_file'].fileno()).st_size
+    hashes_count: int = min(hashes_file_size // HASH_ENTRY_SIZE, chain_height)
+    chain_store['hashes_file'].seek(0)
+    stored_hashes: bytes = chain_store['hashes_file'].read(hashes_count * HASH_ENTRY_SIZE)
+    chain_store['hash_index'] = {stored_hashes[i * HASH_ENTRY_SIZE:(i + 1) * HASH_ENTRY_SIZE]: i
+                                 for i in range(hashes_count)}
+    chain_store['hashes_file'].truncate(hashes_count * HASH_ENTRY_SIZE)
+    chain_store['hashes_file'].seek(0, os.SEEK_END)
+
+    for block_index in range(hashes_count, chain_height):
+        hash_key: bytes = encode_block_hash(read_chain_block(chain_store, block_index, use_cache=False).hash)
+        chain_store['hashes_file'].write(hash_key)
+        chain_store['hash_index'][hash_key] = block_index
+
+    chain_store['hashes_file'].flush()
+
+
+def find_chain_block_index(chain_store: ChainStore, block_hash: str) -> Optional[int]:
+    """ Finds chain position of block by hash
+    :param chain_store: chain store
+    :param block_hash: hexadecimal block hash
+    :return: chain position or None if block not in chain
+    """
+    try:
+        return chain_store['hash_index'].get(encode_block_hash(block_hash))
+    except ValueError:
+        return None
+
+
+def read_chain_block_hash(chain_store: ChainStore, block_index: int) -> str:
+    """ Reads block hash from hash index file without reading the block
+    :param chain_store: chain store
+    :param block_index: chain position
+    :return: hexadecimal block hash (zero-padded to 64 digits)
+    """
+    return os.pread(chain_store['hashes_file'].fileno(), HASH_ENTRY_SIZE, block_index * HASH_ENTRY_SIZE).hex()
+
+
+def rewrite_chain_files(chain_store: ChainStore, block_file_size: int) -> None:
+    """ Cuts block file after last indexed record & rewrites index to match offsets
+    :param chain_store: chain store
+    :param block_file_size: size of indexed block records
+    :return: None
+    """
+    chain_store['block_file'].truncate(block_file_size)
+    chain_store['block_file'].seek(0, os.SEEK_END)
+    chain_store['index_file'].truncate(0)
+    chain_store['index_file'].seek(0)
+    chain_store['index_file'].write(chain_store['offsets'].tobytes())
+    chain_store['index_file'].flush()
+
+
+def read_record_length(chain_store: ChainStore, record_offset: int) -> int:
+    """ Reads block record payload length
+    :param chain_store: chain store
+    :param record_offset: block record offset
+    :return: payload length in bytes
+    """
+    record_header: bytes = os.pread(chain_store['block_file'].fileno(), RECORD_HEADER.size, record_offset)
+    return RECORD_HEADER.unpack(record_header)[0]
+
+
+def verify_chain_tip(chain_store: ChainStore) -> bool:
+    """ Verifies tip block proof of work & link to previous block
+    :param chain_store: chain store
+    :return: tip verification status
+    """
+    try:
+        tip_block: Block = read_chain_block(chain_store, -1)
+    except ValueError:
+        return False
+
+    if get_chain_height(chain_store) == 1:
+        return tip_block.prev_hash == INITIAL_BLOCK_HASH
+
+    prev_block: Block = read_chain_block(chain_store, -2)
+    return validate_block(prev_block.hash, tip_block)
+
+
+def get_chain_height(chain_store: ChainStore) -> int:
+    """ Counts stored blocks
+    :param chain_store: chain store
+    :return: number of blocks
+    """
+    return len(chain_store['offsets'])
+
+
+def read_chain_record(chain_store: ChainStore, block_index: int) -> bytes:
+    """ Reads serialized block by chain position, bypassing cache
+    :param chain_store: chain store
+    :param block_index: chain position
+    :return: block record payload
+    """
+    with chain_store['lock']:
+        record_offset: int = chain_store['offsets'][block_index]
+
+    record_length: int = read_record_length(chain_store, record_offset)
+    return os.pread(chain_store['block_file'].fileno(), record_length, record_offset + RECORD_HEADER.size)
+
+
+def decode_chain_record(record_payload: bytes) -> Block:
+    """ Decodes binary block record payload
+    :param record_payload: block record payload
+    :return: block
+    """
+    return decode_block(record_payload)[0]
+
+
+def read_chain_block(chain_store: ChainStore, block_index: int, use_cache: bool = True) -> Block:
+    """ Reads block by chain position, recent blocks served from cache
+    :param chain_store: chain store
+    :param block_index: chain position (negative counts from tip)
+    :param use_cache: keep block read from file in cache
+    :return: block
+    """
+    if block_index < 0:
+        block_index += len(chain_store['offsets'])
+
+    with chain_store['lock']:
+        if block_index in chain_store['cache']:
+            chain_store['cache'].move_to_end(block_index)
+            return chain_store['cache'][block_index]
+
+    block: Block = decode_chain_record(read_chain_record(chain_store, block_index))
+
+    if use_cache:
+        cache_chain_block(chain_store, block_index, block)
+
+    return block
+
+
+def cache_chain_block(chain_store: ChainStore, block_index: int, block: Block) -> None:
+    """ Keeps block in bounded cache of recently used blocks
+    :param chain_store: chain store
+    :param block_index: chain position
+    :param block: block
+    :return: None
+    """
+    with chain_store['lock']:
+        chain_store['cache'][block_index] = block
+        chain_store['cache'].move_to_end(block_index)
+
+        while len(chain_store['cache']) > BLOCK_CACHE_SIZE:
+            chain_store['cache'].popitem(last=False)
+
+
+def get_chain_tip(chain_store: ChainStore) -> Block:
+    """ Reads chain tip block
+    :param chain_store: chain store
+    :return: tip block
+    """
+    return read_chain_block(chain_store, -1)
+
+
+def iterate_chain_blocks(chain_store: ChainStore, start: int = 0, stop: Optional[int] = None) -> Iterator[Block]:
+    """ Iterates blocks by chain position without loading the whole chain or flushing block cache
+    :param chain_store: chain store
+    :param start: first chain position
+    :param stop: chain position to stop at (exclusive, default chain height)
+    :return: blocks
+    """
+    stop = get_chain_height(chain_store) if stop is None else min(stop, get_chain_height(chain_store))
+
+    for block_index in range(max(start, 0), stop):
+        yield read_chain_block(chain_store, block_index, use_cache=False)
+
+
+def iterate_chain_records(chain_store: ChainStore, start: int = 0, stop: Optional[int] = None) -> Iterator[bytes]:
+    """ Iterates serialized blocks by chain position, leaving parsing to the caller
+    :param chain_store: chain store
+    :param start: first chain position
+    :param stop: chain position to stop at (exclusive, default chain height)
+    :return: block record payloads
+    """
+    stop = get_chain_height(chain_store) if stop is None else min(stop, get_chain_height(chain_store))
+
+    for block_index in range(max(start, 0), stop):
+        yield read_chain_record(chain_store, block_index)
+
+
+def append_chain_block(chain_store: ChainStore, new_block: Block) -> None:
+    """ Appends block record, then its index entry, so a crash never indexes a partial record
+    :param chain_store: chain store
+    :param new_block: new block
+    :return: None
+    """
+    record_payload: bytes = encode_block(new_block)
+
+    with chain_store['lock']:
+        record_offset: int = chain_store['block_file'].seek(0, os.SEEK_END)
+        chain_store['block_file'].write(RECORD_HEADER.pack(len(record_payload)) + record_payload)
+        chain_store['block_file'].flush()
+        chain_store['index_file'].seek(0, os.SEEK_END)
+        chain_store['index_file'].write(struct.pack('=Q', record_offset))
+        chain_store['index_file'].flush()
+        hash_key: bytes = encode_block_hash(new_block.hash)
+        chain_store['hashes_file'].seek(0, os.SEEK_END)
+        chain_store['hashes_file'].write(hash_key)
+        chain_store['hashes_file'].flush()
+        chain_store['hash_index'][hash_key] = len(chain_store['offsets'])
+        chain_store['offsets'].append(record_offset)
+
+    cache_chain_block(chain_store, len(chain_store['offsets']) - 1, new_block)
+
+
+def truncate_chain_store(chain_store: ChainStore, chain_height: int) -> None:
+    """ Drops blocks above chain height
+    :param chain_store: chain store
+    :param chain_height: number of blocks to keep
+    :return: None
+    """
+    if chain_height >= get_chain_height(chain_store):
+        return
+
+    with chain_store['lock']:
+        block_file_size: int = chain_store['offsets'][chain_height]
+        dropped_count: int = len(chain_store['offsets']) - chain_height
+        dropped_hashes: bytes = os.pread(chain_store['hashes_file'].fileno(),
+                                         dropped_count * HASH_ENTRY_SIZE,
+                                         chain_height * HASH_ENTRY_SIZE)
+
+        for i in range(0, len(dropped_hashes), HASH_ENTRY_SIZE):
+            chain_store['hash_index'].pop(dropped_hashes[i:i + HASH_ENTRY_SIZE], None)
+
+        del chain_store['offsets'][chain_height:]
+
+        for block_index in [i for i in chain_store['cache'] if i >= chain_height]:
+            del chain_store['cache'][block_index]
+
+        # Cut files at dropped blocks only, cost grows with dropped blocks, not chain height
+        for chain_file, file_size in ((chain_store['block_file'], block_file_size),
+                                      (chain_store['index_file'], chain_height * INDEX_ENTRY_SIZE),
+                                      (chain_store['hashes_file'], chain_height * HASH_ENTRY_SIZE)):
+            if os.fstat(chain_file.fileno()).st_size > file_size:
+                chain_file.truncate(file_size)
+            chain_file.seek(0, os.SEEK_END)
+
+
+def close_chain_store(chain_store: ChainStore) -> None:
+    """ Closes chain storage files
+    :param chain_store: chain store
+    :return: None
+    """
+    chain_store['block_file'].close()
+    chain_store['index_file'].close()
+    chain_store['hashes_file'].close()
+
+
+def save_snapshot(data_dir: Optional[str], file_name: str, snapshot: Any) -> None:
+    """ Atomically replaces json snapshot in data dir
+    :param data_dir: node data directory (None skips snapshot)
+    :param file_name: snapshot file name
+    :param snapshot: json-serializable snapshot
+    :return: None
+    """
+    if data_dir is None:
+        return
+
+    snapshot_path: str = os.path.join(data_dir, file_name)
+
+    with open(f'{snapshot_path}.tmp', 'w') as snapshot_file:
+        json.dump(snapshot, snapshot_file)
+
+    os.replace(f'{snapshot_path}.tmp', snapshot_path)
+
+
+def load_snapshot(data_dir: Optional[str], file_name: str) -> Optional[Any]:
+    """ Loads last json snapshot from data dir
+    :param data_dir: node data directory
+    :param file_name: snapshot file name
+    :return: snapshot or None if missing
+    """
+    if data_dir is None or not os.path.exists(os.path.join(data_dir, file_name)):
+        return None
+
+    with open(os.path.join(data_dir, file_name)) as snapshot_file:
+        return json.load(snapshot_file)
@@ -0,0 +1,274 @@
+import logging
+from typing import TypedDict, Optional, Callable, Any
+from threading import Thread, Lock
+from requests import Response, RequestException
+from common import SUCCESS_REQUEST_STATUS, MAX_SYNC_HEADERS, MAX_SYNC_BLOCKS, BINARY_MIMETYPE, \
+    BROADCAST_CONNECT_TIMEOUT, BROADCAST_READ_TIMEOUT
+from build_blockchain import Block, BlockData, BlockHeader, downgrade_block_to_header, import_block, encode_blocks, \
+    decode_blocks
+from build_codec import DECODE_ERRORS, encode_varint, decode_varint
+from build_broadcast import broadcast_session
+from build_node import Node
+from build_validator import BlockCheck, ValidationPool, check_blocks_parallel
+from build_block_index import BLOCK_DUPLICATE, BLOCK_INVALID, BLOCK_ORPHAN, BlockIndex, process_new_block
+from build_storage import ChainStore, get_chain_height, get_chain_tip, read_chain_block_hash, iterate_chain_blocks, \
+    find_chain_block_index
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Locator lists this many recent blocks one by one, then steps back exponentially
+LOCATOR_DENSE_BLOCKS: int = 10
+# Longest locator accepted from peers, exponential steps cover any chain well below it
+MAX_LOCATOR_HASHES: int = 101
+
+
+# Build chain sync
+class SyncBlocksRequest(TypedDict):
+    locator: list[str]
+    limit: int
+
+
+class SyncBlocksResponse(TypedDict):
+    fork_height: int
+    tip_height: int
+    blocks: list[Block]
+
+
+class ChainSync(TypedDict):
+    node: Node
+    node_lock: Lock
+    block_index: BlockIndex
+    validation_pool: ValidationPool
+    lock: Lock
+    on_chain_update: Callable[[], None]
+
+
+def collect_headers(chain_store: ChainStore, start_height: int, limit: int) -> list[BlockHeader]:
+    """ Collects headers of consecutive blocks
+    :param chain_store: chain store
+    :param start_height: first block height
+    :param limit: max number of headers
+    :return: block headers
+    """
+    limit = min(limit, MAX_SYNC_HEADERS)
+    return [downgrade_block_to_header(block)
+            for block in iterate_chain_blocks(chain_store, start_height - 1, start_height - 1 + limit)]
+
+
+def collect_blocks(chain_store: ChainStore, start_height: int, limit: int) -> list[Block]:
+    """ Collects consecutive blocks
+    :param chain_store: chain store
+    :param start_height: first block height
+    :param limit: max number of blocks
+    :return: blocks
+    """
+    limit = min(limit, MAX_SYNC_BLOCKS)
+    return list(iterate_chain_blocks(chain_store, start_height - 1, start_height - 1 + limit))
+
+
+def create_block_locator(chain_store: ChainStore) -> list[str]:
+    """ Lists hashes of recent blocks densely & older blocks exponentially sparser, down to genesis
+    :param chain_store: chain store
+    :return: block hashes from tip
+    """
+    block_locator: list[str] = []
+    block_index: int = get_chain_height(chain_store) - 1
+    step: int = 1
+
+    while block_index > 0:
+        block_locator.append(read_chain_block_hash(chain_store, block_index))
+
+        if len(block_locator) >= LOCATOR_DENSE_BLOCKS:
+            step *= 2
+
+        block_index -= step
+
+    block_locator.append(read_chain_block_hash(chain_store, 0))
+    return block_locator
+
+
+def parse_sync_request(sync_data: Any) -> SyncBlocksRequest:
+    """ Parses sync request sent by peer
+    :param sync_data: parsed json data
+    :return: sync request
+    """
+    if not isinstance(sync_data, dict):
+        raise ValueError('sync request is not a JSON object')
+
+    block_locator: Any = sync_data.get('locator')
+    limit: Any = sync_data.get('limit', MAX_SYNC_BLOCKS)
+
+    if not isinstance(block_locator, list) or len(block_locator) > MAX_LOCATOR_HASHES or \
+            not all(isinstance(block_hash, str) for block_hash in block_locator):
+        raise ValueError('sync locator invalid')
+
+    if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+        raise ValueError('sync limit invalid')
+
+    return {'locator': block_locator, 'limit': limit}
+
+
+def collect_sync_blocks(chain_store: ChainStore, block_locator: list[str], limit: int) -> SyncBlocksResponse:
+    """ Collects blocks following the most recent locator block found in chain
+    :param chain_store: chain store
+    :param block_locator: requesting node's block locator
+    :param limit: max number of blocks
+    :return: fork height, tip height & missing blocks
+    """
+    fork_index: int = 0
+
+    for block_hash in block_locator:
+        block_index: Optional[int] = find_chain_block_index(chain_store, block_hash)
+
+        if block_index is not None:
+            fork_index = block_index
+            break
+
+    return {'fork_height': fork_index + 1,
+            'tip_height': get_chain_height(chain_store),
+            'blocks': collect_blocks(chain_store, fork_index + 2, limit),
+            }
+
+
+def encode_sync_blocks(sync_response: SyncBlocksResponse) -> bytes:
+    """ Encodes sync response as varint fork & tip heights, then binary blocks
+    :param sync_response: sync response
+    :return: binary sync response
+    """
+    return encode_varint(sync_response['fork_height']) + encode_varint(sync_response['tip_height']) + \
+        encode_blocks(sync_response['blocks'])
+
+
+def decode_sync_blocks(data: bytes) -> SyncBlocksResponse:
+    """ Decodes binary sync response
+    :param data: encoded data
+    :return: sync response
+    """
+    fork_height, offset = decode_varint(data, 0)
+    tip_height, offset = decode_varint(data, offset)
+    return {'fork_height': fork_height, 'tip_height': tip_height, 'blocks': decode_blocks(data, offset)[0]}
+
+
+def parse_blocks_response(response: Response, is_sync_response: bool) -> list[Block]:
+    """ Parses blocks sent by peer, binary unless peer answered with json
+    :param response: peer response
+    :param is_sync_response: response to sync blocks request, with fork & tip heights
+    :return: blocks
+    """
+    if response.status_code != SUCCESS_REQUEST_STATUS:
+        return []
+
+    if response.headers.get('Content-Type') != BINARY_MIMETYPE:
+        json_blocks: list[BlockData] = response.json()['blocks'] if is_sync_response else response.json()
+        return [import_block(json_block) for json_block in json_blocks]
+
+    return decode_sync_blocks(response.content)['blocks'] if is_sync_response else decode_blocks(response.content)[0]
+
+
+def sync_with_peer(chain_sync: ChainSync, peer: str) -> int:
+    """ Fetches blocks missing from node's chain, starting at fork point, batch by batch
+    :param chain_sync: chain sync
+    :param peer: peer url
+    :return: number of stored blocks
+    """
+    node: Node = chain_sync['node']
+    added_count: int = 0
+
+    with chain_sync['node_lock']:
+        block_locator: list[str] = create_block_locator(node['chain'])
+
+    try:
+        response: Response = broadcast_session.post(f'{peer}/sync_blocks',
+                                                    json={'locator': block_locator, 'limit': MAX_SYNC_BLOCKS},
+                                                    headers={'Accept': BINARY_MIMETYPE},
+                                                    timeout=(BROADCAST_CONNECT_TIMEOUT, BROADCAST_READ_TIMEOUT))
+        new_blocks: list[Block] = parse_blocks_response(response, True)
+
+        while new_blocks:
+            batch_count: int = 0
+            # Check proof of work & transactions across cores before taking node lock
+            block_checks: list[BlockCheck] = check_blocks_parallel(chain_sync['validation_pool'], new_blocks)
+
+            with chain_sync['node_lock']:
+                prev_tip_hash: str = get_chain_tip(node['chain']).hash
+
+                for new_block, block_check in zip(new_blocks, block_checks):
+                    block_status: str = process_new_block(node, chain_sync['block_index'], new_block, True) \
+                        if block_check['is_valid'] else BLOCK_INVALID
+
+                    # Stop at blocks peer should not have sent
+                    if block_status in (BLOCK_INVALID, BLOCK_ORPHAN):
+                        break
+
+                    batch_count += block_status != BLOCK_DUPLICATE
+
+                is_tip_changed: bool = get_chain_tip(node['chain']).hash != prev_tip_hash
+
+            added_count += batch_count
+
+            if is_tip_changed:
+                chain_sync['on_chain_update']()
+
+            # Page through peer's chain by height, locator of a node on another branch would not move
+            if block_status in (BLOCK_INVALID, BLOCK_ORPHAN) or len(new_blocks) < MAX_SYNC_BLOCKS:
+                break
+
+            response = broadcast_session.get(f'{peer}/get_blocks',
+                                             params={'start': new_blocks[-1].height + 1, 'limit': MAX_SYNC_BLOCKS},
+                                             headers={'Accept': BINARY_MIMETYPE},
+                                             timeout=(BROADCAST_CONNECT_TIMEOUT, BROADCAST_READ_TIMEOUT))
+            new_blocks = parse_blocks_response(response, False)
+    except RequestException as err:
+        logger.warning('sync_with_peer error: peer=%s unavailable %r', peer, err)
+    except DECODE_ERRORS as err:
+        logger.warning('sync_with_peer error: peer=%s sent malformed blocks %r', peer, err)
+
+    return added_count
+
+
+def sync_with_peers(chain_sync: ChainSync) -> dict[str, int]:
+    """ Syncs node's chain with every peer
+    :param chain_sync: chain sync
+    :return: number of added blocks per peer
+    """
+    return {peer: sync_with_peer(chain_sync, peer) for peer in list(chain_sync['node']['peers'])}
+
+
+def create_chain_sync(node: Node,
+                      node_lock: Lock,
+                      block_index: BlockIndex,
+                      validation_pool: ValidationPool,
+                      on_chain_update: Callable[[], None]) -> ChainSync:
+    """ Creates chain sync for node
+    :param node: node
+    :param node_lock: lock guarding node's chain, mempool & ledger
+    :param block_index: node's block index
+    :param validation_pool: validation pool checking fetched blocks
+    :param on_chain_update: called after blocks are added
+    :return: new chain sync
+    """
+    return {'node': node,
+            'node_lock': node_lock,
+            'block_index': block_index,
+            'validation_pool': validation_pool,
+            'lock': Lock(),
+            'on_chain_update': on_chain_update,
+            }
+
+
+def start_chain_sync(chain_sync: ChainSync) -> bool:
+    """ Syncs with peers in background unless a sync is already running
+    :param chain_sync: chain sync
+    :return: False if a sync is already running
+    """
+    if not chain_sync['lock'].acquire(blocking=False):
+        return False
+
+    def run_chain_sync() -> None:
+        try:
+            sync_with_peers(chain_sync)
+        finally:
+            chain_sync['lock'].release()
+
+    Thread(target=run_chain_sync, name=f'sync:{chain_sync["node"]["port"]}', daemon=True).start()
+    return True
@@ -1,68 +1,445 @@
-from typing import TypedDict
-from decimal import Decimal
-from functools import reduce
-from uuid import uuid4
+import logging
+import json
+import struct
+from typing import TypedDict, Final, Optional, Any
+from dataclasses import dataclass, field, replace
+from collections import OrderedDict
+from threading import Lock
+from hashlib import sha256
+from common import SIGNATURE_CACHE_SIZE
+from build_codec import encode_varint, decode_varint, encode_string, decode_string, encode_hex, decode_hex, \
+    encode_uint64, decode_uint64
+from build_signature import derive_public_key, create_address, sign_message, verify_signature
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Amounts are validated as integers of the smallest unit, 8 decimal places
+AMOUNT_BASE_UNITS: Final = 100_000_000
+# Transactions with verified signatures, keyed by id, which covers the whole signed transaction
+signature_cache: OrderedDict[str, None] = OrderedDict()
+signature_cache_lock: Lock = Lock()
 
 
-# TODO: miner fees
-# TODO: transactions choice
-# TODO: transactions hash
 # Build transaction
-class TransactionInput(TypedDict):
+@dataclass(frozen=True, slots=True)
+class TransactionInput:
+    sender: str
+    amount: float
+    # Signer's public key & signature, empty in coinbase inputs
+    public_key: str = ''
+    signature: str = ''
+
+
+@dataclass(frozen=True, slots=True)
+class TransactionOutput:
+    receiver: str
+    amount: float
+
+
+@dataclass(frozen=True, slots=True)
+class Transaction:
+    # Double SHA-256 of encoding, same transaction gets the same id on every node
+    id: str = field(init=False)
+    inputs: tuple[TransactionInput, ...]
+    outputs: tuple[TransactionOutput, ...]
+    # Canonical binary form, encoded once & reused by block encoding, relay & size checks
+    encoding: bytes = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, 'encoding', encode_transaction_content(self.inputs, self.outputs))
+        object.__setattr__(self, 'id', hash_transaction(self.encoding))
+
+
+class TransactionInputData(TypedDict):
     sender: str
     amount: float
+    public_key: str
+    signature: str
 
 
-class TransactionOutput(TypedDict):
+class TransactionOutputData(TypedDict):
     receiver: str
     amount: float
 
 
 class InitialTransaction(TypedDict):
-    inputs: list[TransactionInput]
-    outputs: list[TransactionOutput]
+    inputs: list[TransactionInputData]
+    outputs: list[TransactionOutputData]
 
 
-class Transaction(InitialTransaction):
+class TransactionData(InitialTransaction):
     id: str
 
 
-def create_coinbase_transaction(sender: str, receiver: str, amount: float) -> Transaction:
+class TransactionResult(TypedDict):
+    id: Optional[str]
+    status: int
+    error: Optional[str]
+
+
+def create_coinbase_transaction(sender: str, receiver: str, amount: float, block_height: int) -> Transaction:
     """ Creates a coinbase transaction with data
     :param sender: transaction sender
     :param receiver: transaction receiver
     :param amount: transaction amount
+    :param block_height: height of block paying coinbase
     :return: new coinbase transaction
     """
-    return {'id': uuid4().hex,
-            'inputs': [{'sender': sender, 'amount': amount}],
-            'outputs': [{'receiver': receiver, 'amount': amount}]
-            }
+    return Transaction((TransactionInput(sender, amount, signature=encode_coinbase_height(block_height)),),
+                       (TransactionOutput(receiver, amount),))
+
+
+def encode_coinbase_height(block_height: int) -> str:
+    """ Encodes block height carried by coinbase input instead of a signature, so equal payouts get distinct ids
+    :param block_height: block height
+    :return: hexadecimal block height
+    """
+    return f'{block_height:016x}'
 
 
 def create_transaction(initial_transaction: InitialTransaction) -> Transaction:
-    """ Creates a new transaction with id
-    :param initial_transaction: coinbase transaction
+    """ Creates a new transaction from request data, rejecting an id not matching its contents
+    :param initial_transaction: transaction data, id is optional
     :return: new transaction with id
     """
-    new_transaction: Transaction = {k: v for k, v in initial_transaction.items()}
-    if 'id' not in new_transaction:
-        new_transaction['id'] = uuid4().hex
+    try:
+        # Amounts are kept as encoded, so a transaction decoded from binary equals the one parsed from json
+        new_transaction: Transaction = Transaction(
+            tuple(TransactionInput(t_input['sender'],
+                                   convert_amount_to_base_units(t_input['amount']) / AMOUNT_BASE_UNITS,
+                                   t_input.get('public_key', ''),
+                                   t_input.get('signature', ''))
+                  for t_input in initial_transaction['inputs']),
+            tuple(TransactionOutput(t_output['receiver'],
+                                    convert_amount_to_base_units(t_output['amount']) / AMOUNT_BASE_UNITS)
+                  for t_output in initial_transaction['outputs']))
+    except (KeyError, TypeError, AttributeError, OverflowError, struct.error) as err:
+        raise ValueError(f'malformed transaction: {repr(err)}') from err
+
+    if initial_transaction.get('id', new_transaction.id) != new_transaction.id:
+        raise ValueError(f'transaction id mismatch: {initial_transaction["id"]!r}')
+
     return new_transaction
 
 
+def export_transaction(transaction: Transaction) -> TransactionData:
+    """ Exports transaction as json-serializable data
+    :param transaction: transaction
+    :return: transaction data
+    """
+    return {'id': transaction.id,
+            'inputs': [{'sender': t_input.sender,
+                        'amount': t_input.amount,
+                        'public_key': t_input.public_key,
+                        'signature': t_input.signature,
+                        } for t_input in transaction.inputs],
+            'outputs': [{'receiver': t_output.receiver, 'amount': t_output.amount}
+                        for t_output in transaction.outputs],
+            }
+
+
+def convert_amount_to_base_units(amount: float) -> int:
+    """ Converts transaction amount to integer base units
+    :param amount: transaction amount
+    :return: amount in base units
+    """
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or not amount >= 0:
+        raise ValueError(f'invalid amount: {amount!r}')
+
+    return round(amount * AMOUNT_BASE_UNITS)
+
+
+def compute_transaction_amounts(transaction: Transaction) -> tuple[int, int]:
+    """ Sums transaction inputs & outputs in base units
+    :param transaction: transaction
+    :return: inputs & outputs amounts in base units
+    """
+    transaction_inputs: int = sum(convert_amount_to_base_units(t_input.amount) for t_input in transaction.inputs)
+    transaction_outputs: int = sum(convert_amount_to_base_units(t_output.amount)
+                                   for t_output in transaction.outputs)
+    return transaction_inputs, transaction_outputs
+
+
 def validate_transaction(new_transaction: Transaction) -> bool:
     """ Validates transaction
     :param new_transaction: new transaction
     :return: new transaction validation status
     """
     try:
-        transaction_inputs: float = float(sum(Decimal(f'{t_input["amount"]}') for t_input in new_transaction['inputs']))
-        transaction_outputs: float = reduce(lambda x, y: float(Decimal(str(x)) + Decimal(str(y['amount']))),
-                                            new_transaction['outputs'],
-                                            0.0
-                                            )
-        return transaction_inputs == transaction_outputs
+        transaction_inputs, transaction_outputs = compute_transaction_amounts(new_transaction)
+        # Inputs left over from outputs are paid to the miner as fee, amounts fit binary encoding by construction
+        return transaction_inputs >= transaction_outputs
+    except Exception as err:
+        logger.debug('validate_transaction error: %r', err)
+        return False
+
+
+def validate_transactions(new_transactions: list[Transaction]) -> list[bool]:
+    """ Validates transactions batch in one pass, invalid transactions are reported by caller
+    :param new_transactions: new transactions
+    :return: validation status per transaction
+    """
+    validation_results: list[bool] = []
+
+    for new_transaction in new_transactions:
+        try:
+            transaction_inputs, transaction_outputs = compute_transaction_amounts(new_transaction)
+            validation_results.append(transaction_inputs >= transaction_outputs)
+        except Exception:
+            validation_results.append(False)
+
+    return validation_results
+
+
+def create_batch_transaction(batch_item: Any) -> Optional[Transaction]:
+    """ Creates transaction from batch item
+    :param batch_item: parsed batch item
+    :return: new transaction with id, None if item is malformed
+    """
+    try:
+        return create_transaction(batch_item) if isinstance(batch_item, dict) else None
+    except ValueError:
+        return None
+
+
+def parse_transactions_batch(batch_data: bytes, is_ndjson: bool) -> list[Optional[Transaction]]:
+    """ Parses JSON array or NDJSON stream of transactions, malformed items are None
+    :param batch_data: request body
+    :param is_ndjson: request body holds one transaction per line
+    :return: new transactions with ids
+    """
+    if is_ndjson:
+        batch_items: list[Any] = []
+
+        for batch_line in batch_data.splitlines():
+            if batch_line.strip():
+                try:
+                    batch_items.append(json.loads(batch_line))
+                except ValueError:
+                    batch_items.append(None)
+    else:
+        batch_items = json.loads(batch_data)
+
+        if not isinstance(batch_items, list):
+            raise ValueError('transactions batch is not a JSON array')
+
+    return [create_batch_transaction(batch_item) for batch_item in batch_items]
+
+
+def encode_transaction_content(transaction_inputs: tuple[TransactionInput, ...],
+                               transaction_outputs: tuple[TransactionOutput, ...]) -> bytes:
+    """ Encodes transaction in canonical binary form: amounts as integer base units, keys & signatures as raw bytes
+    :param transaction_inputs: transaction inputs
+    :param transaction_outputs: transaction outputs
+    :return: binary transaction
+    """
+    return b''.join([encode_varint(len(transaction_inputs)),
+                     *[encode_string(t_input.sender) + encode_uint64(convert_amount_to_base_units(t_input.amount)) +
+                       encode_hex(t_input.public_key) + encode_hex(t_input.signature)
+                       for t_input in transaction_inputs],
+                     encode_varint(len(transaction_outputs)),
+                     *[encode_string(t_output.receiver) +
+                       encode_uint64(convert_amount_to_base_units(t_output.amount))
+                       for t_output in transaction_outputs],
+                     ])
+
+
+def hash_transaction(transaction_encoding: bytes) -> str:
+    """ Double hashes binary transaction into its id
+    :param transaction_encoding: binary transaction
+    :return: hexadecimal transaction id
+    """
+    return sha256(sha256(transaction_encoding).digest()).hexdigest()
+
+
+def encode_transaction(transaction: Transaction) -> bytes:
+    """ Reads binary transaction encoded on creation, id is left out as it follows from the encoding
+    :param transaction: transaction
+    :return: binary transaction
+    """
+    return transaction.encoding
+
+
+def decode_transaction(data: bytes, offset: int = 0) -> tuple[Transaction, int]:
+    """ Decodes binary transaction, hashing its bytes into id without encoding it again
+    :param data: encoded data
+    :param offset: transaction position
+    :return: transaction & position after it
+    """
+    start_offset: int = offset
+    inputs_count, offset = decode_varint(data, offset)
+    transaction_inputs: list[TransactionInput] = []
+
+    for _ in range(inputs_count):
+        sender, offset = decode_string(data, offset)
+        amount, offset = decode_uint64(data, offset)
+        public_key, offset = decode_hex(data, offset)
+        signature, offset = decode_hex(data, offset)
+        transaction_inputs.append(TransactionInput(sender, amount / AMOUNT_BASE_UNITS, public_key, signature))
+
+    outputs_count, offset = decode_varint(data, offset)
+    transaction_outputs: list[TransactionOutput] = []
+
+    for _ in range(outputs_count):
+        receiver, offset = decode_string(data, offset)
+        amount, offset = decode_uint64(data, offset)
+        transaction_outputs.append(TransactionOutput(receiver, amount / AMOUNT_BASE_UNITS))
+
+    return restore_transaction(tuple(transaction_inputs), tuple(transaction_outputs),
+                               bytes(data[start_offset:offset])), offset
+
+
+def restore_transaction(transaction_inputs: tuple[TransactionInput, ...],
+                        transaction_outputs: tuple[TransactionOutput, ...],
+                        transaction_encoding: bytes) -> Transaction:
+    """ Creates decoded transaction around the bytes it was decoded from, skipping __init__'s encoding
+    :param transaction_inputs: transaction inputs
+    :param transaction_outputs: transaction outputs
+    :param transaction_encoding: canonical binary transaction
+    :return: transaction
+    """
+    transaction: Transaction = object.__new__(Transaction)
+    object.__setattr__(transaction, 'inputs', transaction_inputs)
+    object.__setattr__(transaction, 'outputs', transaction_outputs)
+    object.__setattr__(transaction, 'encoding', transaction_encoding)
+    object.__setattr__(transaction, 'id', hash_transaction(transaction_encoding))
+    return transaction
+
+
+def encode_transactions(transactions: list[Transaction]) -> bytes:
+    """ Encodes transactions prefixed with their count
+    :param transactions: transactions
+    :return: binary transactions
+    """
+    return encode_varint(len(transactions)) + b''.join(encode_transaction(transaction) for transaction in transactions)
+
+
+def decode_transactions(data: bytes, offset: int = 0) -> tuple[list[Transaction], int]:
+    """ Decodes count-prefixed binary transactions
+    :param data: encoded data
+    :param offset: transactions count position
+    :return: transactions & position after them
+    """
+    transactions_count, offset = decode_varint(data, offset)
+    transactions: list[Transaction] = []
+
+    for _ in range(transactions_count):
+        transaction, offset = decode_transaction(data, offset)
+        transactions.append(transaction)
+
+    return transactions, offset
+
+
+def compute_transaction_fee(transaction: Transaction) -> float:
+    """ Computes miner fee left over by transaction
+    :param transaction: transaction
+    :return: inputs amount minus outputs amount
+    """
+    transaction_inputs, transaction_outputs = compute_transaction_amounts(transaction)
+    return (transaction_inputs - transaction_outputs) / AMOUNT_BASE_UNITS
+
+
+def compute_transaction_size(transaction: Transaction) -> int:
+    """ Reads transaction binary size, in O(1)
+    :param transaction: transaction
+    :return: size in bytes
+    """
+    return len(transaction.encoding)
+
+
+def compute_signature_hash(transaction: Transaction) -> bytes:
+    """ Hashes what every input signs: senders, receivers & amounts, leaving out id, public keys & signatures
+    :param transaction: transaction
+    :return: signed digest
+    """
+    return sha256(b''.join([encode_varint(len(transaction.inputs)),
+                            *[encode_string(t_input.sender) +
+                              encode_uint64(convert_amount_to_base_units(t_input.amount))
+                              for t_input in transaction.inputs],
+                            encode_varint(len(transaction.outputs)),
+                            *[encode_string(t_output.receiver) +
+                              encode_uint64(convert_amount_to_base_units(t_output.amount))
+                              for t_output in transaction.outputs],
+                            ])).digest()
+
+
+def sign_transaction(transaction: Transaction, private_keys: list[str]) -> Transaction:
+    """ Signs every transaction input with its sender's key
+    :param transaction: transaction
+    :param private_keys: hexadecimal private key per input
+    :return: signed transaction
+    """
+    if len(private_keys) != len(transaction.inputs):
+        raise ValueError(f'expected {len(transaction.inputs)} private keys, got {len(private_keys)}')
+
+    signature_hash: bytes = compute_signature_hash(transaction)
+    return replace(transaction, inputs=tuple(replace(t_input,
+                                                     public_key=derive_public_key(private_key),
+                                                     signature=sign_message(private_key, signature_hash))
+                                             for t_input, private_key in zip(transaction.inputs, private_keys)))
+
+
+def check_transaction_signatures(transaction: Transaction) -> bool:
+    """ Checks every input is signed by the key its sender address derives from, skipping signature cache
+    :param transaction: non-coinbase transaction
+    :return: signatures validation status
+    """
+    try:
+        signature_hash: bytes = compute_signature_hash(transaction)
+        return all(create_address(t_input.public_key) == t_input.sender and
+                   verify_signature(t_input.public_key, signature_hash, t_input.signature)
+                   for t_input in transaction.inputs)
     except Exception as err:
-        print(f'validate_transaction error: {repr(err)}')
+        logger.debug('check_transaction_signatures error: %r', err)
         return False
+
+
+def check_transactions_signatures(transactions: list[Transaction]) -> list[bool]:
+    """ Checks signatures of transactions batch in pool worker
+    :param transactions: non-coinbase transactions
+    :return: signatures validation status per transaction
+    """
+    return [check_transaction_signatures(transaction) for transaction in transactions]
+
+
+def is_signature_cached(transaction: Transaction) -> bool:
+    """ Checks transaction signatures were verified before, e.g. on mempool admission before arriving in a block
+    :param transaction: transaction
+    :return: cached signatures status
+    """
+    with signature_cache_lock:
+        if transaction.id not in signature_cache:
+            return False
+
+        signature_cache.move_to_end(transaction.id)
+        return True
+
+
+def cache_signatures(transactions: list[Transaction]) -> None:
+    """ Remembers transactions with verified signatures, forgetting the oldest past SIGNATURE_CACHE_SIZE
+    :param transactions: transactions with valid signatures
+    :return: None
+    """
+    with signature_cache_lock:
+        for transaction in transactions:
+            signature_cache[transaction.id] = None
+            signature_cache.move_to_end(transaction.id)
+
+        while len(signature_cache) > SIGNATURE_CACHE_SIZE:
+            signature_cache.popitem(last=False)
+
+
+def verify_transaction_signatures(transaction: Transaction) -> bool:
+    """ Verifies transaction signatures once, later checks hit signature cache
+    :param transaction: non-coinbase transaction
+    :return: signatures validation status
+    """
+    if is_signature_cached(transaction):
+        return True
+
+    is_signature_valid: bool = check_transaction_signatures(transaction)
+
+    if is_signature_valid:
+        cache_signatures([transaction])
+
+    return is_signature_valid
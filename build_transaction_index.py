@@ -0,0 +1,170 @@
+from typing import TypedDict, Optional, Any
+from common import MAX_INDEX_RESULTS
+from build_blockchain import Block
+from build_transaction import Transaction
+from build_storage import ChainStore, iterate_chain_blocks
+
+# Chain position of a transaction: block height & position in block transactions
+TransactionRef = tuple[int, int]
+
+
+# Build transaction index
+class TransactionIndex(TypedDict):
+    block_transactions: list[list[str]]
+    positions: dict[str, TransactionRef]
+    addresses: dict[str, list[TransactionRef]]
+
+
+class IndexedTransaction(TypedDict):
+    id: str
+    height: int
+    position: int
+
+
+class AddressTransactionsPage(TypedDict):
+    address: str
+    total: int
+    offset: int
+    limit: int
+    transactions: list[IndexedTransaction]
+
+
+def create_transaction_index() -> TransactionIndex:
+    """ Creates an empty index of chain transactions by id & by address
+    :return: new transaction index
+    """
+    return {'block_transactions': [], 'positions': {}, 'addresses': {}}
+
+
+def load_transaction_index(chain_store: ChainStore) -> TransactionIndex:
+    """ Builds transaction index from stored chain, one pass over its blocks
+    :param chain_store: chain store
+    :return: transaction index at chain tip
+    """
+    transaction_index: TransactionIndex = create_transaction_index()
+
+    for block in iterate_chain_blocks(chain_store):
+        index_block_transactions(transaction_index, block)
+
+    return transaction_index
+
+
+def export_transaction_index(transaction_index: TransactionIndex, tip_hash: str) -> dict[str, Any]:
+    """ Exports transaction index as json-serializable snapshot, positions follow from block transactions
+    :param transaction_index: transaction index
+    :param tip_hash: hash of chain tip block indexed last
+    :return: transaction index snapshot
+    """
+    # Block transactions lists are never changed once indexed, only address refs lists are copied
+    return {'block_transactions': list(transaction_index['block_transactions']),
+            'addresses': {address: list(address_refs)
+                          for address, address_refs in transaction_index['addresses'].items()},
+            'height': len(transaction_index['block_transactions']),
+            'tip_hash': tip_hash,
+            }
+
+
+def import_transaction_index(index_snapshot: dict[str, Any]) -> TransactionIndex:
+    """ Imports transaction index from snapshot
+    :param index_snapshot: transaction index snapshot
+    :return: transaction index
+    """
+    block_transactions: list[list[str]] = index_snapshot['block_transactions']
+    return {'block_transactions': block_transactions,
+            'positions': {transaction_id: (height, position)
+                          for height, transactions_ids in enumerate(block_transactions, 1)
+                          for position, transaction_id in enumerate(transactions_ids)},
+            'addresses': {address: [(height, position) for height, position in address_refs]
+                          for address, address_refs in index_snapshot['addresses'].items()},
+            }
+
+
+def list_transaction_addresses(transaction: Transaction) -> list[str]:
+    """ Lists addresses sending or receiving in transaction, each once
+    :param transaction: transaction
+    :return: senders & receivers
+    """
+    return list(dict.fromkeys([t_input.sender for t_input in transaction.inputs] +
+                              [t_output.receiver for t_output in transaction.outputs]))
+
+
+def index_block_transactions(transaction_index: TransactionIndex, block: Block) -> None:
+    """ Indexes transactions of new chain tip block, O(block transactions)
+    :param transaction_index: transaction index
+    :param block: new chain tip block
+    :return: None
+    """
+    transaction_index['block_transactions'].append([t.id for t in block.transactions])
+
+    for position, transaction in enumerate(block.transactions):
+        transaction_ref: TransactionRef = (block.height, position)
+        # Blocks carrying a transaction already in chain are rejected, see validate_block_transactions_new
+        transaction_index['positions'][transaction.id] = transaction_ref
+
+        for address in list_transaction_addresses(transaction):
+            transaction_index['addresses'].setdefault(address, []).append(transaction_ref)
+
+
+def unindex_block_transactions(transaction_index: TransactionIndex, block: Block) -> None:
+    """ Drops transactions of current chain tip block, their refs are the last ones of every list
+    :param transaction_index: transaction index
+    :param block: current chain tip block
+    :return: None
+    """
+    for transaction in reversed(block.transactions):
+        transaction_index['positions'].pop(transaction.id, None)
+
+        for address in list_transaction_addresses(transaction):
+            address_refs: list[TransactionRef] = transaction_index['addresses'][address]
+            address_refs.pop()
+
+            if not address_refs:
+                del transaction_index['addresses'][address]
+
+    transaction_index['block_transactions'].pop()
+
+
+def find_transaction_ref(transaction_index: TransactionIndex, transaction_id: str) -> Optional[TransactionRef]:
+    """ Finds chain position of transaction by id
+    :param transaction_index: transaction index
+    :param transaction_id: transaction id
+    :return: block height & position or None if transaction not in chain
+    """
+    return transaction_index['positions'].get(transaction_id)
+
+
+def validate_block_transactions_new(transaction_index: TransactionIndex, block: Block) -> bool:
+    """ Validates no block transaction is in chain already, so a signed transaction cannot be mined again
+    :param transaction_index: transaction index at block's prev block
+    :param block: new block
+    :return: transactions novelty status
+    """
+    return not any(transaction.id in transaction_index['positions'] for transaction in block.transactions)
+
+
+def list_address_transactions(transaction_index: TransactionIndex,
+                              address: str,
+                              offset: int = 0,
+                              limit: int = MAX_INDEX_RESULTS) -> AddressTransactionsPage:
+    """ Lists page of address transactions, newest first, O(page size)
+    :param transaction_index: transaction index
+    :param address: sender or receiver address
+    :param offset: number of newer transactions skipped
+    :param limit: max number of transactions (at most MAX_INDEX_RESULTS)
+    :return: address, total number of its transactions & page of transaction refs
+    """
+    address_refs: list[TransactionRef] = transaction_index['addresses'].get(address, [])
+    offset = max(offset, 0)
+    limit = min(max(limit, 0), MAX_INDEX_RESULTS)
+    # Refs are kept in chain order, pages are sliced from the tip end
+    page_stop: int = max(len(address_refs) - offset, 0)
+    page_refs: list[TransactionRef] = address_refs[max(page_stop - limit, 0):page_stop][::-1]
+    return {'address': address,
+            'total': len(address_refs),
+            'offset': offset,
+            'limit': limit,
+            'transactions': [{'id': transaction_index['block_transactions'][height - 1][position],
+                              'height': height,
+                              'position': position}
+                             for height, position in page_refs],
+            }
@@ -0,0 +1,270 @@
+import logging
+from typing import TypedDict, Optional, Callable, Iterator
+from time import perf_counter
+from itertools import islice
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from common import VALIDATION_BATCH_SIZE, RETARGET_INTERVAL, MEDIAN_TIME_BLOCKS
+from build_blockchain import INITIAL_BLOCK_HASH, Block, validate_block
+from build_transaction import Transaction, check_transactions_signatures, is_signature_cached, cache_signatures
+from build_ledger import Ledger, create_ledger, compute_spends, compute_block_balance_changes, change_ledger_balances, \
+    validate_spent_amounts
+from build_difficulty import compute_retarget_start_height, retarget_bits, validate_timestamp_order
+from build_storage import ChainStore, get_chain_height, iterate_chain_records, decode_chain_record
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Progress is reported at most this often, in seconds
+VALIDATION_PROGRESS_INTERVAL: float = 1.0
+
+
+# Build chain validator
+class BlockCheck(TypedDict):
+    height: int
+    hash: str
+    prev_hash: str
+    bits: int
+    timestamp: str
+    is_valid: bool
+    transactions_ids: list[str]
+    spends: dict[str, int]
+    balance_changes: dict[str, int]
+
+
+class ChainValidation(TypedDict):
+    valid_height: int
+    invalid_height: Optional[int]
+    ledger: Ledger
+    elapsed: float
+
+
+class ValidationPool(TypedDict):
+    executor: ProcessPoolExecutor
+    workers: int
+
+
+def create_validation_pool(validation_workers: int) -> ValidationPool:
+    """ Creates a process pool for block checks
+    :param validation_workers: number of validation processes
+    :return: new validation pool
+    """
+    return {'executor': ProcessPoolExecutor(max_workers=validation_workers), 'workers': validation_workers}
+
+
+def shutdown_validation_pool(validation_pool: ValidationPool) -> None:
+    """ Stops validation pool processes
+    :param validation_pool: validation pool
+    :return: None
+    """
+    validation_pool['executor'].shutdown(cancel_futures=True)
+
+
+def check_block(block: Block) -> BlockCheck:
+    """ Runs checks needing no other block with validate_block, as live block acceptance does
+    :param block: block
+    :return: block check with summary for in-order checks
+    """
+    try:
+        # Only stored genesis has no proof of work, its children link to the same INITIAL_BLOCK_HASH
+        is_genesis: bool = block.height == 1 and block.prev_hash == INITIAL_BLOCK_HASH
+        # Worker's signature cache would only hold transactions of blocks it will not see again
+        is_valid: bool = is_genesis or validate_block(block.prev_hash, block, use_signature_cache=False)
+        return {'height': block.height,
+                'hash': block.hash,
+                'prev_hash': block.prev_hash,
+                'bits': block.bits,
+                'timestamp': block.timestamp,
+                'is_valid': is_valid,
+                'transactions_ids': [t.id for t in block.transactions] if is_valid else [],
+                'spends': compute_spends(block.transactions[1:]) if is_valid else {},
+                'balance_changes': compute_block_balance_changes(block) if is_valid else {},
+                }
+    except Exception as err:
+        logger.warning('check_block error: %r', err)
+        return create_invalid_block_check()
+
+
+def create_invalid_block_check() -> BlockCheck:
+    """ Creates check of a block that could not be read or checked
+    :return: invalid block check
+    """
+    return {'height': 0, 'hash': '', 'prev_hash': '', 'bits': 0, 'timestamp': '',
+            'is_valid': False, 'transactions_ids': [], 'spends': {}, 'balance_changes': {}}
+
+
+def check_blocks(blocks: list[Block]) -> list[BlockCheck]:
+    """ Checks batch of blocks in pool worker
+    :param blocks: blocks
+    :return: block checks
+    """
+    return [check_block(block) for block in blocks]
+
+
+def check_block_record(block_record: bytes) -> BlockCheck:
+    """ Decodes & checks stored block, a corrupted record makes an invalid block
+    :param block_record: block record payload
+    :return: block check
+    """
+    try:
+        block: Block = decode_chain_record(block_record)
+    except Exception as err:
+        logger.warning('check_block_record error: %r', err)
+        return create_invalid_block_check()
+
+    return check_block(block)
+
+
+def check_block_records(block_records: list[bytes]) -> list[BlockCheck]:
+    """ Decodes & checks batch of stored blocks in pool worker, sparing the parent process the decoding
+    :param block_records: block record payloads
+    :return: block checks
+    """
+    return [check_block_record(block_record) for block_record in block_records]
+
+
+def check_blocks_parallel(validation_pool: ValidationPool, blocks: list[Block]) -> list[BlockCheck]:
+    """ Spreads block checks evenly across pool workers
+    :param validation_pool: validation pool
+    :param blocks: blocks
+    :return: block checks in blocks order
+    """
+    batch_size: int = max(1, -(-len(blocks) // validation_pool['workers']))
+    block_batches: list[list[Block]] = [blocks[i:i + batch_size] for i in range(0, len(blocks), batch_size)]
+    return [block_check
+            for batch_checks in validation_pool['executor'].map(check_blocks, block_batches)
+            for block_check in batch_checks]
+
+
+def verify_signatures_parallel(validation_pool: ValidationPool, transactions: list[Transaction]) -> list[bool]:
+    """ Verifies signatures missing from signature cache across pool workers, caching the valid ones
+    :param validation_pool: validation pool
+    :param transactions: non-coinbase transactions
+    :return: signatures validation status per transaction
+    """
+    signature_results: list[bool] = [is_signature_cached(transaction) for transaction in transactions]
+    uncached_indexes: list[int] = [i for i, is_cached in enumerate(signature_results) if not is_cached]
+
+    if not uncached_indexes:
+        return signature_results
+
+    # Verification is CPU bound, request threads wait on worker processes instead of holding the GIL
+    batch_size: int = max(1, -(-len(uncached_indexes) // validation_pool['workers']))
+    transaction_batches: list[list[Transaction]] = [[transactions[i] for i in uncached_indexes[j:j + batch_size]]
+                                                    for j in range(0, len(uncached_indexes), batch_size)]
+    batch_results: list[bool] = [is_valid
+                                 for batch_checks in validation_pool['executor'].map(check_transactions_signatures,
+                                                                                     transaction_batches)
+                                 for is_valid in batch_checks]
+
+    for transaction_index, is_valid in zip(uncached_indexes, batch_results):
+        signature_results[transaction_index] = is_valid
+
+    cache_signatures([transactions[i] for i, is_valid in zip(uncached_indexes, batch_results) if is_valid])
+    return signature_results
+
+
+def connect_block_check(ledger: Ledger,
+                        recent_checks: deque[BlockCheck],
+                        chain_transactions_ids: set[str],
+                        block_check: BlockCheck) -> bool:
+    """ Runs in-order checks: hash linkage, retarget bits, timestamp order, spends & transactions novelty,
+    then applies block to ledger
+    :param ledger: ledger at block's parent
+    :param recent_checks: checks of last retarget window & median time blocks
+    :param chain_transactions_ids: ids of transactions in blocks up to block's parent
+    :param block_check: block check
+    :return: block validation status
+    """
+    if not recent_checks:
+        is_linked: bool = block_check['height'] == 1 and block_check['prev_hash'] == INITIAL_BLOCK_HASH
+        is_bits_valid: bool = True
+        is_timestamp_valid: bool = True
+    else:
+        prev_check: BlockCheck = recent_checks[-1]
+        is_linked = block_check['height'] == prev_check['height'] + 1 and \
+            block_check['prev_hash'] == prev_check['hash']
+
+        if (block_check['height'] - 1) % RETARGET_INTERVAL:
+            is_bits_valid = block_check['bits'] == prev_check['bits']
+        else:
+            start_height: int = compute_retarget_start_height(block_check['height'])
+            start_check: BlockCheck = recent_checks[start_height - recent_checks[0]['height']]
+            is_bits_valid = block_check['bits'] == retarget_bits(prev_check['bits'],
+                                                                 start_check['timestamp'],
+                                                                 prev_check['timestamp'],
+                                                                 prev_check['height'] - start_check['height'])
+
+        # Genesis is left out of median time, as on live acceptance
+        prev_timestamps: list[str] = [c['timestamp'] for c in list(recent_checks)[-MEDIAN_TIME_BLOCKS:]
+                                      if c['height'] > 1]
+        is_timestamp_valid = validate_timestamp_order(prev_timestamps, block_check['timestamp'])
+
+    if not is_linked or not is_bits_valid or not is_timestamp_valid or \
+            not validate_spent_amounts(ledger, block_check['spends']) or \
+            any(transaction_id in chain_transactions_ids for transaction_id in block_check['transactions_ids']):
+        return False
+
+    chain_transactions_ids.update(block_check['transactions_ids'])
+    change_ledger_balances(ledger, block_check['balance_changes'], 1)
+    ledger['height'] = block_check['height']
+    ledger['tip_hash'] = block_check['hash']
+    recent_checks.append(block_check)
+    return True
+
+
+def validate_chain(chain_store: ChainStore,
+                   validation_pool: ValidationPool,
+                   on_progress: Optional[Callable[[int, int], None]] = None) -> ChainValidation:
+    """ Validates whole stored chain, streaming blocks to pool workers & stopping at first invalid block
+    :param chain_store: chain store
+    :param validation_pool: validation pool
+    :param on_progress: called with validated & total chain height
+    :return: valid height, first invalid height & ledger rebuilt up to valid height
+    """
+    start_time: float = perf_counter()
+    progress_time: float = start_time
+    chain_height: int = get_chain_height(chain_store)
+    chain_validation: ChainValidation = {'valid_height': 0, 'invalid_height': None, 'ledger': create_ledger(),
+                                         'elapsed': 0.0}
+    recent_checks: deque[BlockCheck] = deque(maxlen=max(RETARGET_INTERVAL + 1, MEDIAN_TIME_BLOCKS))
+    chain_transactions_ids: set[str] = set()
+    block_records: Iterator[bytes] = iterate_chain_records(chain_store, 0, chain_height)
+    pending_futures: deque[Future] = deque()
+
+    def submit_records_batch() -> bool:
+        records_batch: list[bytes] = list(islice(block_records, VALIDATION_BATCH_SIZE))
+
+        if records_batch:
+            pending_futures.append(validation_pool['executor'].submit(check_block_records, records_batch))
+
+        return bool(records_batch)
+
+    # Keep every worker busy while parent process links checked batches in order
+    while len(pending_futures) < 2 * validation_pool['workers'] and submit_records_batch():
+        pass
+
+    try:
+        while pending_futures and chain_validation['invalid_height'] is None:
+            for block_check in pending_futures.popleft().result():
+                if not block_check['is_valid'] or \
+                        not connect_block_check(chain_validation['ledger'], recent_checks, chain_transactions_ids,
+                                                block_check):
+                    chain_validation['invalid_height'] = chain_validation['valid_height'] + 1
+                    break
+
+                chain_validation['valid_height'] += 1
+
+            submit_records_batch()
+
+            if on_progress is not None and perf_counter() - progress_time >= VALIDATION_PROGRESS_INTERVAL:
+                progress_time = perf_counter()
+                on_progress(chain_validation['valid_height'], chain_height)
+    finally:
+        for pending_future in pending_futures:
+            pending_future.cancel()
+
+    if on_progress is not None and progress_time == start_time:
+        on_progress(chain_validation['valid_height'], chain_height)
+
+    chain_validation['elapsed'] = perf_counter() - start_time
+    return chain_validation
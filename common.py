@@ -1,8 +1,77 @@
+import os
 from typing import Final
 
-# TODO: docker config with all ports
-NODE_PORTS: Final = [5001, 5002, 5003]
+# Default cluster started by run_nodes.py, see its --config option for other layouts
+NODE_COUNT: Final = 3
+NODE_BASE_PORT: Final = 5001
 NODE_HOST: Final = '0.0.0.0'
-MAX_BLOCK_TRANSACTIONS: Final = 2
+PEER_HOST: Final = '127.0.0.1'
+NODE_THREADS: Final = 8
+MAX_BLOCK_SIZE: Final = 1_000_000
+MAX_MEMPOOL_TRANSACTIONS: Final = 300_000
+# Mempool byte budget in binary transaction sizes, lowest fee rate transactions are evicted past it
+MAX_MEMPOOL_BYTES: Final = 64_000_000
+# Seconds before an unmined transaction expires from mempool
+MEMPOOL_EXPIRY: Final = 86_400.0
+# Replacement of conflicting transactions pays their fees plus this fee per byte of its own size (1 base unit)
+REPLACEMENT_FEE_RATE: Final = 0.00000001
+MAX_REPLACED_TRANSACTIONS: Final = 100
+MAX_TRANSACTIONS_BATCH: Final = 10_000
+# Request body bytes allowed per batched transaction, JSON transactions with a few inputs & outputs stay well below
+MAX_BATCH_TRANSACTION_SIZE: Final = 2_000
+NDJSON_MIMETYPE: Final = 'application/x-ndjson'
+JSON_MIMETYPE: Final = 'application/json'
+# Binary blocks, see encode_block in build_blockchain.py
+BINARY_MIMETYPE: Final = 'application/octet-stream'
+DATA_DIR: Final = 'data'
+# Node logs, set per run with run_nodes.py --log-level (DEBUG also logs whole blocks)
+LOG_LEVEL: Final = 'INFO'
+LOG_FORMAT: Final = '%(asctime)s %(levelname)s %(name)s [%(threadName)s] %(message)s'
+BLOCK_CACHE_SIZE: Final = 128
+MERKLE_CACHE_SIZE: Final = 128
+# Transactions with verified signatures, rechecked neither when relayed again nor when mined (as many as mempool holds)
+SIGNATURE_CACHE_SIZE: Final = 300_000
+MEMPOOL_SNAPSHOT_INTERVAL: Final = 30.0
+# Sample accounts funded from genesis, spent by transaction_new.json (addresses of 'Dan', 'Bob' & 'Stan' seed keys)
+GENESIS_BALANCES: Final = {'b799cf15a637f971991cefe37b36618df43195ae': 1000.0,
+                           'ff4508e26baef0455e6ed96acb1896984826bf5e': 1000.0,
+                           'c2f3158d3bc68745743bb9d8ee569b533ac8734a': 1000.0,
+                           }
+MINING_WORKERS: Final = os.cpu_count() or 1
+CONTINUOUS_MINING: Final = False
+TEMPLATE_REFRESH_INTERVAL: Final = 1.0
+MAX_MINING_JOBS: Final = 1000
+# Mining jobs waiting for the miner, /mine_block answers 429 past it
+MAX_QUEUED_MINING_JOBS: Final = 100
+VALIDATION_WORKERS: Final = os.cpu_count() or 1
+VALIDATION_BATCH_SIZE: Final = 500
+VERIFY_CHAIN_ON_STARTUP: Final = True
+BROADCAST_WORKERS: Final = 32
+BROADCAST_PEER_POOLS: Final = 64
+BROADCAST_CONNECT_TIMEOUT: Final = 0.5
+BROADCAST_READ_TIMEOUT: Final = 2.0
+BROADCAST_RETRIES: Final = 2
+BROADCAST_BACKOFF: Final = 0.1
+# Transactions are announced by id in batches collected over relay interval, peers fetch only missing ones
+RELAY_INTERVAL: Final = 0.1
+MAX_INVENTORY_ITEMS: Final = 1000
+MAX_RELAY_SEEN: Final = 100_000
+RELAY_REQUEST_TIMEOUT: Final = 5.0
+MAX_SYNC_HEADERS: Final = 2000
+MAX_SYNC_BLOCKS: Final = 100
+# Page size cap of address transaction lookups
+MAX_INDEX_RESULTS: Final = 100
+MAX_REORG_DEPTH: Final = 100
+MAX_ORPHAN_BLOCKS: Final = 100
+TARGET_BLOCK_INTERVAL: Final = 5.0
+RETARGET_INTERVAL: Final = 20
+MAX_RETARGET_FACTOR: Final = 4
+# Block timestamps must pass the median of this many previous blocks & lead node clock by at most MAX_FUTURE_BLOCK_TIME
+MEDIAN_TIME_BLOCKS: Final = 11
+MAX_FUTURE_BLOCK_TIME: Final = 15.0
 SUCCESS_REQUEST_STATUS: Final = 200
+ACCEPTED_REQUEST_STATUS: Final = 202
 BAD_REQUEST_STATUS: Final = 400
+NOT_FOUND_REQUEST_STATUS: Final = 404
+CONFLICT_REQUEST_STATUS: Final = 409
+TOO_MANY_REQUESTS_STATUS: Final = 429
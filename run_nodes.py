@@ -0,0 +1,204 @@
+import json
+import logging
+import signal
+from argparse import ArgumentParser, Namespace
+from types import FrameType
+from typing import TypedDict, Optional
+from threading import Thread
+from multiprocessing import Process, set_start_method
+from waitress import create_server
+from common import NODE_COUNT, NODE_BASE_PORT, NODE_HOST, PEER_HOST, NODE_THREADS, DATA_DIR, MINING_WORKERS, \
+    CONTINUOUS_MINING, VALIDATION_WORKERS, LOG_LEVEL, LOG_FORMAT
+from build_app import NodeConfig, NodeApp, create_node_config, create_app, shutdown_app
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+# Build node cluster
+class ClusterConfig(TypedDict):
+    host: str
+    processes: int
+    log_level: str
+    nodes: list[NodeConfig]
+
+
+def create_peer_url(node_port: int) -> str:
+    """ Creates url other nodes reach node at
+    :param node_port: node port
+    :return: peer url
+    """
+    return f'http://{PEER_HOST}:{node_port}'
+
+
+def select_node_peers(nodes_ports: list[int], node_position: int, max_peers: Optional[int]) -> list[str]:
+    """ Connects node to every other node, or to the next max peers nodes in a ring
+    :param nodes_ports: ports of all cluster nodes
+    :param node_position: node position in cluster
+    :param max_peers: max number of peers per node (None for full mesh)
+    :return: peer urls
+    """
+    peers_count: int = len(nodes_ports) - 1 if max_peers is None else min(max_peers, len(nodes_ports) - 1)
+    return [create_peer_url(nodes_ports[(node_position + i) % len(nodes_ports)]) for i in range(1, peers_count + 1)]
+
+
+def create_cluster_config(args: Namespace) -> ClusterConfig:
+    """ Creates cluster config from a config file, or a local cluster on consecutive ports
+    :param args: command line arguments
+    :return: new cluster config
+    """
+    node_defaults: dict = {}
+    nodes_overrides: list[dict] = [{}] * args.nodes
+
+    if args.config is not None:
+        with open(args.config) as config_file:
+            config: dict = json.load(config_file)
+
+        node_defaults = config.get('defaults', {})
+        nodes_overrides = config['nodes']
+
+    nodes_ports: list[int] = [node_overrides.get('port', args.base_port + i)
+                              for i, node_overrides in enumerate(nodes_overrides)]
+    max_peers: Optional[int] = node_defaults.get('max_peers', args.max_peers)
+    data_dir: Optional[str] = node_defaults.get('data_dir', args.data_dir)
+    # A single node gets every core, cluster nodes share them
+    is_single_node: bool = len(nodes_overrides) == 1
+    mining_workers: int = args.mining_workers if args.mining_workers is not None \
+        else MINING_WORKERS if is_single_node else 1
+    validation_workers: int = args.validation_workers if args.validation_workers is not None \
+        else VALIDATION_WORKERS if is_single_node else 1
+    nodes: list[NodeConfig] = []
+
+    for i, node_overrides in enumerate(nodes_overrides):
+        node_settings: dict = {**node_defaults, **node_overrides}
+        node_data_dir: Optional[str] = node_settings.get('data_dir', data_dir)
+        # Nodes share base data directory, each storing its chain in own port subdirectory
+        node_data_dir = f'{node_data_dir}/{nodes_ports[i]}' if node_data_dir and 'data_dir' not in node_overrides \
+            else node_data_dir or None
+        nodes.append(create_node_config(nodes_ports[i],
+                                        node_settings.get('peers', select_node_peers(nodes_ports, i, max_peers)),
+                                        node_data_dir,
+                                        node_settings.get('mining_workers', mining_workers),
+                                        node_settings.get('validation_workers', validation_workers),
+                                        node_settings.get('continuous_mining', args.continuous_mining),
+                                        node_settings.get('threads', args.threads)))
+
+    return {'host': node_defaults.get('host', args.host),
+            'processes': max(1, min(args.processes, len(nodes))),
+            'log_level': node_defaults.get('log_level', args.log_level),
+            'nodes': nodes,
+            }
+
+
+def run_nodes(host: str, nodes_configs: list[NodeConfig]) -> None:
+    """ Serves nodes with production WSGI servers, one server thread per node, until interrupted
+    :param host: host nodes listen on
+    :param nodes_configs: configs of nodes served by current process
+    :return: None
+    """
+    nodes_apps: list[NodeApp] = []
+    server_threads: list[Thread] = []
+
+    try:
+        for node_config in nodes_configs:
+            node_app: NodeApp = create_app(node_config)
+            nodes_apps.append(node_app)
+            server = create_server(node_app['app'], host=host, port=node_config['port'], threads=node_config['threads'])
+            server_thread = Thread(target=server.run, name=f'server:{node_config["port"]}', daemon=True)
+            server_thread.start()
+            server_threads.append(server_thread)
+            logger.info('Node:%s serving threads=%s peers=%s',
+                        node_config['port'], node_config['threads'], ','.join(node_config['peers']) or 'none')
+
+        for server_thread in server_threads:
+            server_thread.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for node_app in nodes_apps:
+            shutdown_app(node_app)
+
+
+def configure_logging(log_level: str) -> None:
+    """ Sends node logs to stderr, dropping records below log level before they are formatted
+    :param log_level: log level name, e.g. INFO
+    :return: None
+    """
+    logging.basicConfig(level=log_level.upper(), format=LOG_FORMAT)
+
+
+def stop_nodes_process(signal_number: int, frame: Optional[FrameType]) -> None:
+    """ Stops child process nodes the same way as an interrupted cluster process
+    :param signal_number: received signal number
+    :param frame: interrupted stack frame
+    :return: None
+    """
+    raise KeyboardInterrupt
+
+
+def run_nodes_process(host: str, nodes_configs: list[NodeConfig], log_level: str) -> None:
+    """ Serves nodes in a child process, which cluster process stops on exit
+    :param host: host nodes listen on
+    :param nodes_configs: configs of nodes served by child process
+    :param log_level: log level name
+    :return: None
+    """
+    configure_logging(log_level)
+    # Cluster process alone handles Ctrl+C, so child shutdown is not interrupted twice
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, stop_nodes_process)
+    run_nodes(host, nodes_configs)
+
+
+def run_cluster(cluster_config: ClusterConfig) -> None:
+    """ Splits nodes between processes, running the first group in current process
+    :param cluster_config: cluster config
+    :return: None
+    """
+    processes_count: int = cluster_config['processes']
+    nodes_groups: list[list[NodeConfig]] = [cluster_config['nodes'][i::processes_count]
+                                            for i in range(processes_count)]
+    node_processes: list[Process] = [Process(target=run_nodes_process,
+                                             args=(cluster_config['host'], nodes_group, cluster_config['log_level']))
+                                     for nodes_group in nodes_groups[1:]]
+
+    for node_process in node_processes:
+        node_process.start()
+
+    try:
+        run_nodes(cluster_config['host'], nodes_groups[0])
+    finally:
+        for node_process in node_processes:
+            node_process.terminate()
+            node_process.join()
+
+
+def parse_args() -> Namespace:
+    """ Parses command line arguments
+    :return: command line arguments
+    """
+    parser = ArgumentParser(description='Runs a cluster of nodes')
+    parser.add_argument('--config', help='JSON file with "defaults" & per node "nodes" settings')
+    parser.add_argument('--nodes', type=int, default=NODE_COUNT, help='number of nodes on consecutive ports')
+    parser.add_argument('--base-port', type=int, default=NODE_BASE_PORT, help='first node port')
+    parser.add_argument('--host', default=NODE_HOST, help='host nodes listen on')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='base data directory, empty to keep state in memory')
+    parser.add_argument('--mining-workers', type=int,
+                        help='mining processes per node (default all cores for a single node, else 1)')
+    parser.add_argument('--validation-workers', type=int,
+                        help='block validation processes per node (default all cores for a single node, else 1)')
+    parser.add_argument('--threads', type=int, default=NODE_THREADS, help='request handling threads per node')
+    parser.add_argument('--processes', type=int, default=1, help='processes sharing the nodes')
+    parser.add_argument('--max-peers', type=int, help='peers per node, next nodes in a ring (default all nodes)')
+    parser.add_argument('--log-level', default=LOG_LEVEL, choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'),
+                        type=str.upper, help='lowest logged level')
+    parser.add_argument('--continuous-mining', action='store_true', default=CONTINUOUS_MINING,
+                        help='mine blocks in background')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    # Worker pools start after node threads, forked children would inherit locks held by those threads
+    set_start_method('forkserver')
+    cluster_config: ClusterConfig = create_cluster_config(parse_args())
+    configure_logging(cluster_config['log_level'])
+    run_cluster(cluster_config)
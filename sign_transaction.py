@@ -0,0 +1,57 @@
+import json
+from argparse import ArgumentParser, Namespace
+from typing import Any
+from build_signature import create_private_key, derive_public_key, create_address
+from build_transaction import Transaction, InitialTransaction, create_transaction, export_transaction, sign_transaction
+
+
+# Sign transaction files
+def sign_transaction_data(initial_transaction: InitialTransaction, private_keys: list[str]) -> dict[str, Any]:
+    """ Signs transaction data, setting each input's sender to its key's address
+    :param initial_transaction: transaction data, with or without id
+    :param private_keys: hexadecimal private key per input
+    :return: signed transaction data, with signed transaction's id only if data had an id
+    """
+    # Id follows from the signed contents
+    unsigned_data: InitialTransaction = {'inputs': initial_transaction['inputs'],
+                                         'outputs': initial_transaction['outputs']}
+
+    for t_input, private_key in zip(initial_transaction['inputs'], private_keys):
+        t_input['sender'] = create_address(derive_public_key(private_key))
+
+    signed_transaction: Transaction = sign_transaction(create_transaction(unsigned_data), private_keys)
+    signed_transaction_data: dict[str, Any] = dict(export_transaction(signed_transaction))
+
+    if 'id' not in initial_transaction:
+        del signed_transaction_data['id']
+
+    return signed_transaction_data
+
+
+def parse_args() -> Namespace:
+    """ Parses command line arguments
+    :return: command line arguments
+    """
+    parser = ArgumentParser(description='Signs transaction inputs, one key per input in inputs order')
+    parser.add_argument('transaction_file', help='JSON transaction, e.g. transaction_new.json')
+    parser.add_argument('--keys', nargs='+', default=[], help='hexadecimal private keys')
+    parser.add_argument('--seeds', nargs='+', default=[], help='seed phrases of private keys, e.g. Dan Bob Stan')
+    parser.add_argument('--output', help='signed transaction file (default: print)')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args: Namespace = parse_args()
+
+    with open(args.transaction_file) as transaction_file:
+        transaction_data: InitialTransaction = json.load(transaction_file)
+
+    signed_data: dict[str, Any] = sign_transaction_data(transaction_data,
+                                                        args.keys + [create_private_key(s) for s in args.seeds])
+    signed_json: str = json.dumps(signed_data, indent=2)
+
+    if args.output is None:
+        print(signed_json)
+    else:
+        with open(args.output, 'w') as output_file:
+            output_file.write(signed_json + '\n')
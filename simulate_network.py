@@ -0,0 +1,110 @@
+import json
+import logging
+from argparse import ArgumentParser, Namespace
+from datetime import datetime
+from time import perf_counter
+from typing import Any
+from common import TARGET_BLOCK_INTERVAL, LOG_FORMAT
+from build_signature import create_private_key, derive_public_key, create_address
+from build_transaction import Transaction, create_transaction, sign_transaction, parse_transactions_batch
+from build_simulator import Simulation, SimulationConfig, Partition, create_link_conditions, \
+    create_simulation_config, create_simulation, schedule_workload, run_simulation, summarize_simulation, \
+    close_simulation
+
+# Generated workload spends from genesis accounts in turn
+WORKLOAD_SEEDS: tuple[str, ...] = ('Dan', 'Bob', 'Stan')
+
+
+# Simulate network
+def create_simulation_workload(transactions_count: int) -> list[Transaction]:
+    """ Creates signed transfers from genesis accounts, unique per position
+    :param transactions_count: number of transactions
+    :return: workload transactions
+    """
+    private_keys: list[str] = [create_private_key(seed) for seed in WORKLOAD_SEEDS]
+    senders: list[str] = [create_address(derive_public_key(private_key)) for private_key in private_keys]
+    workload: list[Transaction] = []
+
+    for i in range(transactions_count):
+        transaction: Transaction = create_transaction({
+            'inputs': [{'sender': senders[i % len(senders)], 'amount': 0.0011}],
+            'outputs': [{'receiver': f'Receiver:{i}', 'amount': 0.001}],
+        })
+        workload.append(sign_transaction(transaction, [private_keys[i % len(senders)]]))
+
+    return workload
+
+
+def load_simulation_workload(workload_path: str) -> list[Transaction]:
+    """ Loads workload from JSON array or NDJSON file of transactions, malformed items are skipped
+    :param workload_path: workload file path
+    :return: workload transactions in file order
+    """
+    with open(workload_path, 'rb') as workload_file:
+        workload_data: bytes = workload_file.read()
+
+    return [t for t in parse_transactions_batch(workload_data, not workload_data.lstrip().startswith(b'['))
+            if t is not None]
+
+
+def parse_partition(value: str) -> Partition:
+    """ Parses network split
+    :param value: command line value, start:end:groups in virtual seconds, e.g. 30:60:2
+    :return: partition
+    """
+    start, end, groups = value.split(':')
+    return {'start': float(start), 'end': float(end), 'groups': int(groups)}
+
+
+def parse_args() -> Namespace:
+    """ Parses command line arguments
+    :return: command line arguments
+    """
+    parser = ArgumentParser(description='Simulates a network of nodes in one process on a virtual clock')
+    parser.add_argument('--nodes', type=int, default=50, help='number of simulated nodes')
+    parser.add_argument('--peers', type=int, default=4, help='random outbound peers per node')
+    parser.add_argument('--duration', type=float, default=120.0, help='virtual seconds of mining & workload')
+    parser.add_argument('--block-interval', type=float, default=TARGET_BLOCK_INTERVAL,
+                        help='mean virtual seconds between blocks found by the whole network')
+    parser.add_argument('--transaction-rate', type=float, default=10.0,
+                        help='workload transactions submitted per virtual second')
+    parser.add_argument('--workload', help='JSON array or NDJSON file of signed transactions to replay '
+                                           '(default generated transfers between genesis accounts)')
+    parser.add_argument('--latency', type=float, default=0.05, help='one-way link delay in virtual seconds')
+    parser.add_argument('--jitter', type=float, default=0.05, help='max extra random link delay per message')
+    parser.add_argument('--loss', type=float, default=0.0, help='probability of a message being dropped')
+    parser.add_argument('--bandwidth', type=float, help='link throughput in bytes per second (default unlimited)')
+    parser.add_argument('--partition', type=parse_partition, action='append', default=[],
+                        help='network split start:end:groups, e.g. 30:60:2 (repeatable)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed, same seed replays the same run')
+    parser.add_argument('--output', help='JSON file to write summary to')
+    parser.add_argument('--log-level', default='WARNING', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'),
+                        type=str.upper, help='lowest logged level')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args: Namespace = parse_args()
+    logging.basicConfig(level=args.log_level, format=LOG_FORMAT)
+    simulation_config: SimulationConfig = create_simulation_config(
+        args.nodes, args.peers, args.duration, args.block_interval, args.transaction_rate,
+        create_link_conditions(args.latency, args.jitter, args.loss, args.bandwidth), args.partition, args.seed)
+    workload_transactions: list[Transaction] = load_simulation_workload(args.workload) if args.workload \
+        else create_simulation_workload(round(args.duration * args.transaction_rate))
+    start_time: float = perf_counter()
+    simulation: Simulation = create_simulation(simulation_config)
+    schedule_workload(simulation, workload_transactions)
+    run_simulation(simulation)
+    simulation_summary: dict[str, Any] = summarize_simulation(simulation)
+    close_simulation(simulation)
+    wall_time: float = round(perf_counter() - start_time, 3)
+
+    for summary_name, summary_value in simulation_summary.items():
+        print(f'{summary_name:>34} {summary_value}')
+
+    print(f'{"wall_time":>34} {wall_time}')
+
+    if args.output:
+        with open(args.output, 'w') as summary_file:
+            json.dump({'created': f'{datetime.now()}', 'config': simulation_config, 'wall_time': wall_time,
+                       'summary': simulation_summary}, summary_file, indent=2)
@@ -0,0 +1,35 @@
+from build_blockchain import Block, InitialBlock, MAX_TARGET, BLOCK_REWARD, create_initial_block, \
+    update_initial_block, compute_initial_block_target, compute_initial_block_difficulty, compute_target_bits
+from build_transaction import Transaction, create_coinbase_transaction
+from build_miner import mine_initial_block
+from build_node import Node, create_node
+from build_block_index import BLOCK_ORPHAN, BLOCK_INVALID, BlockIndex, create_block_index, process_new_block
+
+
+def create_orphan_block(bits: int, is_mined: bool) -> Block:
+    """ Creates height 3 block whose parent no node has seen
+    :param bits: target encoded in bits
+    :param is_mined: solve proof of work, or keep a made up hash & nonce 0
+    :return: block
+    """
+    coinbase_transaction: Transaction = create_coinbase_transaction('Node:1', 'Miner:1', BLOCK_REWARD, 3)
+    initial_block: InitialBlock = create_initial_block(2, 'cd' * 32, [coinbase_transaction], bits)
+    target: int = compute_initial_block_target(bits)
+    block_hash, nonce = mine_initial_block(initial_block, target) if is_mined else ('ab' * 32, 0)
+    return update_initial_block(initial_block, block_hash, nonce, compute_initial_block_difficulty(target))
+
+
+def test_orphan_needs_own_proof_of_work():
+    node: Node = create_node(5211)
+    block_index: BlockIndex = create_block_index()
+    min_difficulty_bits: int = compute_target_bits(MAX_TARGET)
+
+    assert process_new_block(node, block_index, create_orphan_block(min_difficulty_bits, False)) == BLOCK_INVALID
+    # Bits easier than minimum difficulty make proof of work trivial
+    easy_block: Block = create_orphan_block(0x207FFFFF, True)
+    assert process_new_block(node, block_index, easy_block) == BLOCK_INVALID
+    assert not block_index['orphans']
+
+    orphan_block: Block = create_orphan_block(min_difficulty_bits, True)
+    assert process_new_block(node, block_index, orphan_block) == BLOCK_ORPHAN
+    assert list(block_index['orphans']) == [orphan_block.hash]
@@ -0,0 +1,63 @@
+from build_blockchain import Block, InitialBlock, BLOCK_REWARD, create_initial_block, update_initial_block, \
+    compute_initial_block_target, compute_initial_block_difficulty
+from build_transaction import Transaction, create_transaction, create_coinbase_transaction, sign_transaction, \
+    compute_transaction_fee
+from build_signature import create_private_key, derive_public_key, create_address
+from build_miner import mine_initial_block
+from build_difficulty import compute_next_bits
+from build_node import Node, create_node
+from build_block_index import BLOCK_EXTENDED, BlockIndex, create_block_index, process_new_block
+from build_transaction_index import load_transaction_index, export_transaction_index
+from build_storage import TRANSACTION_INDEX_FILE_NAME, get_chain_tip, close_chain_store, save_snapshot
+
+
+def mine_payment_block(node: Node, receiver: str) -> Block:
+    """ Mines block on node's chain tip with a payment from a genesis account
+    :param node: node
+    :param receiver: payment receiver
+    :return: block
+    """
+    tip_block: Block = get_chain_tip(node['chain'])
+    private_key: str = create_private_key('Dan')
+    payment_transaction: Transaction = sign_transaction(
+        create_transaction({'inputs': [{'sender': create_address(derive_public_key(private_key)), 'amount': 2.0}],
+                            'outputs': [{'receiver': receiver, 'amount': 1.5}]}), [private_key])
+    coinbase_transaction: Transaction = create_coinbase_transaction(
+        'Node:1', 'Miner:1', BLOCK_REWARD + compute_transaction_fee(payment_transaction), tip_block.height + 1)
+    initial_block: InitialBlock = create_initial_block(tip_block.height, tip_block.hash,
+                                                       [coinbase_transaction, payment_transaction],
+                                                       compute_next_bits(node['chain']))
+    target: int = compute_initial_block_target(initial_block.bits)
+    block_hash, nonce = mine_initial_block(initial_block, target)
+    return update_initial_block(initial_block, block_hash, nonce, compute_initial_block_difficulty(target))
+
+
+def test_restart_indexes_only_blocks_after_snapshot(tmp_path):
+    data_dir: str = str(tmp_path)
+    node: Node = create_node(5221, data_dir)
+    block_index: BlockIndex = create_block_index()
+    assert process_new_block(node, block_index, mine_payment_block(node, 'Alice')) == BLOCK_EXTENDED
+    save_snapshot(data_dir, TRANSACTION_INDEX_FILE_NAME,
+                  export_transaction_index(node['transaction_index'], get_chain_tip(node['chain']).hash))
+    assert process_new_block(node, block_index, mine_payment_block(node, 'Bob')) == BLOCK_EXTENDED
+    close_chain_store(node['chain'])
+
+    restarted_node: Node = create_node(5221, data_dir)
+    assert restarted_node['transaction_index'] == load_transaction_index(restarted_node['chain'])
+    assert len(restarted_node['transaction_index']['addresses']['Bob']) == 1
+    close_chain_store(restarted_node['chain'])
+
+
+def test_restart_ignores_snapshot_off_chain(tmp_path):
+    data_dir: str = str(tmp_path)
+    node: Node = create_node(5222, data_dir)
+    assert process_new_block(node, create_block_index(), mine_payment_block(node, 'Alice')) == BLOCK_EXTENDED
+    # Snapshot of another branch at the same height
+    save_snapshot(data_dir, TRANSACTION_INDEX_FILE_NAME,
+                  {**export_transaction_index(node['transaction_index'], 'ab' * 32), 'addresses': {}})
+    close_chain_store(node['chain'])
+
+    restarted_node: Node = create_node(5222, data_dir)
+    assert restarted_node['transaction_index'] == load_transaction_index(restarted_node['chain'])
+    assert 'Alice' in restarted_node['transaction_index']['addresses']
+    close_chain_store(restarted_node['chain'])
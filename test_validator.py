@@ -0,0 +1,50 @@
+from build_blockchain import Block, InitialBlock, BLOCK_REWARD, create_initial_block, update_initial_block, \
+    compute_initial_block_target, compute_initial_block_difficulty
+from build_transaction import Transaction, create_transaction, create_coinbase_transaction
+from build_signature import create_private_key, derive_public_key, create_address
+from build_miner import mine_initial_block
+from build_node import Node, create_node
+from build_validator import ValidationPool, create_validation_pool, shutdown_validation_pool, check_block, \
+    validate_chain
+from build_storage import get_chain_tip, append_chain_block
+
+
+def create_theft_block(node: Node, is_mined: bool) -> Block:
+    """ Creates height 2 block moving a genesis account's whole balance to thief without its signature
+    :param node: node with genesis block only
+    :param is_mined: solve proof of work, or keep a made up hash & nonce 0
+    :return: block
+    """
+    genesis_block: Block = get_chain_tip(node['chain'])
+    victim_address: str = create_address(derive_public_key(create_private_key('Dan')))
+    theft_transaction: Transaction = create_transaction({'inputs': [{'sender': victim_address, 'amount': 1000.0}],
+                                                         'outputs': [{'receiver': 'thief', 'amount': 1000.0}]})
+    coinbase_transaction: Transaction = create_coinbase_transaction('Node:1', 'Miner:1', BLOCK_REWARD, 2)
+    initial_block: InitialBlock = create_initial_block(genesis_block.height, genesis_block.hash,
+                                                       [coinbase_transaction, theft_transaction])
+    target: int = compute_initial_block_target(initial_block.bits)
+    block_hash, nonce = mine_initial_block(initial_block, target) if is_mined else ('ab' * 32, 0)
+    return update_initial_block(initial_block, block_hash, nonce, compute_initial_block_difficulty(target))
+
+
+def test_check_block_exempts_genesis_only():
+    node: Node = create_node(5201)
+    assert check_block(get_chain_tip(node['chain']))['is_valid']
+    assert not check_block(create_theft_block(node, False))['is_valid']
+    # Unsigned transaction still fails with valid proof of work
+    assert not check_block(create_theft_block(node, True))['is_valid']
+
+
+def test_validate_chain_truncates_forged_height_2_block():
+    node: Node = create_node(5202)
+    append_chain_block(node['chain'], create_theft_block(node, False))
+    validation_pool: ValidationPool = create_validation_pool(1)
+
+    try:
+        chain_validation = validate_chain(node['chain'], validation_pool)
+    finally:
+        shutdown_validation_pool(validation_pool)
+
+    assert chain_validation['valid_height'] == 1
+    assert chain_validation['invalid_height'] == 2
+    assert 'thief' not in chain_validation['ledger']['balances']